@@ -1,85 +1,152 @@
 #!/usr/bin/env python
+"""
+Benchmarks for pack(), unpack(), to_json(), from_json(), pack_into(),
+pack_many(), unpack_many(), and Schema, run with pyperf
+(``python -m pip install pyperf``).
+
+Each benchmark measures one value type, data size class, or key count, so
+changes can be attributed to a specific codec path. Save results to compare
+them between runs:
+
+    python benchmark.py -o before.json
+    python benchmark.py -o after.json
+    python -m pyperf compare_to before.json after.json
+
+Pass ``--impl python`` to benchmark the pure Python implementation rather than
+the C extension, and ``--bench`` to select benchmarks by name prefix.
+"""
 from __future__ import annotations
 
-import io
-import sys
-import time
-from contextlib import contextmanager
+import argparse
+from datetime import date
+from datetime import datetime
+from datetime import time
+from decimal import Decimal
+from types import ModuleType
 from typing import Any
 from typing import Callable
-from typing import ContextManager
-from typing import Generator
-from typing import IO
 
-from tests import base
-from tests import test_mariadb_dyncol
+import pyperf
 
+from mariadb_dyncol import base
 
-def main() -> None:
-    nruns = 1000
-
-    def check_against_db(*args: Any, **kwargs: Any) -> None:
-        ...
-
-    base.check_against_db = check_against_db
-
-    test_funcs = get_test_funcs()
-    print("Running benchmark", file=sys.stderr)
-    start = time.time()
-    for _ in range(nruns):
-        print(".", file=sys.stderr, end="")
-        sys.stderr.flush()
-        [test_func() for test_func in test_funcs]
-    total = time.time() - start
-    print("\n", file=sys.stderr)
-    print(
-        "Ran all tests {} times in {} seconds = {} seconds per run".format(
-            nruns, total, total / nruns
-        ),
-        file=sys.stderr,
-    )
+_speedups: ModuleType | None
+try:
+    from mariadb_dyncol import _speedups
+except ImportError:  # pragma: no cover
+    _speedups = None
 
 
-def get_test_funcs() -> list[Callable[[], None]]:
-    funcs = []
-    for name in dir(test_mariadb_dyncol):
-        if not name.startswith("test_"):
-            continue
+def value_type_cases() -> dict[str, dict[str, Any]]:
+    # Ten columns of each type
+    return {
+        "int": {f"k{i}": i * 1_000_003 for i in range(10)},
+        "float": {f"k{i}": i * 1.5 for i in range(10)},
+        "string": {f"k{i}": f"value {i}" * 3 for i in range(10)},
+        "decimal": {f"k{i}": Decimal(f"{i * 1_000_003}.{i:02}") for i in range(10)},
+        "datetime": {
+            f"k{i}": datetime(2020, 1, 2, 3, 4, 5, 1000 + i) for i in range(10)
+        },
+        "date": {f"k{i}": date(2020, 1, i + 1) for i in range(10)},
+        "time": {f"k{i}": time(3, 4, 5, 1000 + i) for i in range(10)},
+        "dict": {f"k{i}": {"a": i, "b": str(i)} for i in range(10)},
+    }
 
-        testfunc = getattr(test_mariadb_dyncol, name)
-        if hasattr(testfunc, "slow"):
-            continue
 
-        if hasattr(testfunc, "skipif") and testfunc.skipif.args[0]:
-            continue
+def int_width_cases() -> dict[str, dict[str, Any]]:
+    # Ten ints of each encoded width in bytes
+    return {
+        str(width): {f"k{i}": 2 ** (width * 8 - 2) + i for i in range(10)}
+        for width in (1, 2, 3, 4, 6, 8)
+    }
 
-        funcs.append(testfunc)
-    return funcs
 
+def size_class_cases() -> dict[str, dict[str, Any]]:
+    # One case for each column directory data offset width
+    return {
+        "small": {"a": "a" * 100, "b": 1},
+        "medium": {"a": "a" * 2**13, "b": 1},
+        "large": {"a": "a" * 2**21, "b": 1},
+    }
 
-@contextmanager
-def captured_output(stream_name: str) -> Generator[IO[Any], None, None]:
-    """Return a context manager used by captured_stdout/stdin/stderr
-    that temporarily replaces the sys stream *stream_name* with a StringIO.
 
-    Note: This function and the following ``captured_std*`` are copied
-          from CPython's ``test.support`` module."""
-    orig_stdout = getattr(sys, stream_name)
-    setattr(sys, stream_name, io.StringIO())
-    try:
-        yield getattr(sys, stream_name)
-    finally:
-        setattr(sys, stream_name, orig_stdout)
+def key_count_cases() -> dict[str, dict[str, Any]]:
+    return {
+        str(count): {f"k{i}": i for i in range(count)} for count in (1, 10, 100, 1000)
+    }
 
 
-def captured_stdout() -> ContextManager[IO[Any]]:
-    """Capture the output of sys.stdout:
+def add_cmdline_args(cmd: list[str], args: argparse.Namespace) -> None:
+    cmd.extend(("--impl", args.impl))
+    if args.bench:
+        cmd.extend(("--bench", args.bench))
 
-    with captured_stdout() as stdout:
-        print("hello")
-    self.assertEqual(stdout.getvalue(), "hello\n")
-    """
-    return captured_output("stdout")
+
+def main() -> None:
+    runner = pyperf.Runner(add_cmdline_args=add_cmdline_args)
+    runner.argparser.add_argument(
+        "--impl", choices=("c", "python"), default="c" if _speedups else "python"
+    )
+    runner.argparser.add_argument(
+        "--bench", default="", help="Only run benchmarks starting with this"
+    )
+    args = runner.parse_args()
+
+    impl: ModuleType | None = _speedups if args.impl == "c" else base
+    if impl is None:
+        raise SystemExit("The C extension is not built")
+    runner.metadata["mariadb_dyncol_impl"] = args.impl
+
+    def bench(name: str, func: Callable[[Any], Any], arg: Any) -> None:
+        if name.startswith(args.bench):
+            runner.bench_func(name, func, arg)
+
+    groups = {
+        "type": value_type_cases(),
+        "int width": int_width_cases(),
+        "size": size_class_cases(),
+        "keys": key_count_cases(),
+    }
+    for group, cases in groups.items():
+        for case, dicty in cases.items():
+            bench(f"pack {group} {case}", impl.pack, dicty)
+            bench(f"unpack {group} {case}", impl.unpack, impl.pack(dicty))
+            bench(f"to_json {group} {case}", impl.to_json, impl.pack(dicty))
+
+    # Schema, against the general pack() and unpack() with the same rows
+    schema = base.Schema({"id": int, "name": str, "score": float})
+    if impl is base:
+        schema._speedups = None
+    row = {"id": 1, "name": "row 1", "score": 1.5}
+    bench("schema pack", schema.pack, row)
+    bench("schema unpack", schema.unpack, impl.pack(row))
+
+    # from_json(), which always packs with the C extension where it's built
+    bench("from_json", base.from_json, impl.to_json(impl.pack(row)))
+
+    # pack_into(), against copying the result of pack() into the buffer
+    pack = impl.pack
+    pack_into = impl.pack_into
+    buffer = bytearray(100)
+
+    def pack_and_copy(row: dict[str, Any]) -> None:
+        packed = pack(row)
+        buffer[: len(packed)] = packed
+
+    bench("pack_into", lambda row: pack_into(buffer, 0, row), row)
+    bench("pack copy", pack_and_copy, row)
+
+    # Whole result sets, against the equivalent loops
+    unpack = impl.unpack
+    rows = [{"id": i, "name": f"row {i}", "score": i * 1.5} for i in range(1000)]
+    bench("pack_many rows", impl.pack_many, rows)
+    bench("pack loop rows", lambda rows: [pack(row) for row in rows], rows)
+    bench("unpack_many rows", impl.unpack_many, impl.pack_many(rows))
+    bench(
+        "unpack loop rows",
+        lambda bufs: [unpack(buf) for buf in bufs],
+        impl.pack_many(rows),
+    )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,15 @@
+from __future__ import annotations
+
+from setuptools import Extension
+from setuptools import setup
+
+setup(
+    ext_modules=[
+        Extension(
+            "mariadb_dyncol._speedups",
+            sources=["src/mariadb_dyncol/_speedups.c"],
+            # Fall back to the pure Python implementation if the build fails
+            optional=True,
+        )
+    ]
+)
@@ -1,17 +1,87 @@
 from __future__ import annotations
 
+from .aio import aunpack_many
+from .aio import aunpack_rows
+from .base import check
+from .base import Codec
 from .base import DynColLimitError
 from .base import DynColNotSupported
 from .base import DynColTypeError
 from .base import DynColValueError
-from .base import pack
-from .base import unpack
+from .base import DynColView
+from .base import from_json
+from .base import get
+from .base import get_many
+from .base import Schema
+from .base import validate
+from .cache import CachedUnpacker
+from .columnar import extract_column
+from .dbapi import dyncol_cursor
+from .dbapi import DynColCursorMixin
+from .parallel import parallel_pack
+from .parallel import parallel_unpack
+from .stats import collect_stats
+from .stats import disable_stats
+from .stats import enable_stats
+from .stats import Stats
+from .stream import pack_stream
+from .stream import unpack_stream
+
+try:
+    from ._speedups import add
+    from ._speedups import delete
+    from ._speedups import pack
+    from ._speedups import pack_into
+    from ._speedups import pack_many
+    from ._speedups import packed_size
+    from ._speedups import to_json
+    from ._speedups import unpack
+    from ._speedups import unpack_many
+except ImportError:  # pragma: no cover
+    from .base import add
+    from .base import delete
+    from .base import pack
+    from .base import pack_into
+    from .base import pack_many
+    from .base import packed_size
+    from .base import to_json
+    from .base import unpack
+    from .base import unpack_many
 
 __all__ = (
+    "CachedUnpacker",
+    "Codec",
+    "DynColCursorMixin",
     "DynColLimitError",
     "DynColNotSupported",
     "DynColTypeError",
     "DynColValueError",
+    "DynColView",
+    "Schema",
+    "Stats",
+    "add",
+    "aunpack_many",
+    "aunpack_rows",
+    "check",
+    "collect_stats",
+    "delete",
+    "disable_stats",
+    "dyncol_cursor",
+    "enable_stats",
+    "extract_column",
+    "from_json",
+    "get",
+    "get_many",
     "pack",
+    "pack_into",
+    "pack_many",
+    "pack_stream",
+    "packed_size",
+    "parallel_pack",
+    "parallel_unpack",
+    "to_json",
     "unpack",
+    "unpack_many",
+    "unpack_stream",
+    "validate",
 )
@@ -0,0 +1,21 @@
+from __future__ import annotations
+
+from itertools import islice
+from typing import Iterable
+from typing import Iterator
+from typing import TypeVar
+
+T = TypeVar("T")
+
+
+def chunked(items: Iterable[T], size: int) -> Iterator[list[T]]:
+    """
+    Iterate over the items in lists of the given size, the last one possibly
+    shorter
+    """
+    iterator = iter(items)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
@@ -0,0 +1,1964 @@
+/*
+ * Optional C implementation of pack(), unpack(), pack_into(), packed_size(),
+ * pack_many(), unpack_many(), add(), delete(), to_json(), and the packing and
+ * unpacking of Schema.
+ *
+ * This only implements the common case. Whenever it meets anything else - an
+ * unsupported type, a value out of range, malformed data, and so on - it
+ * hands the whole call over to the pure Python implementation in
+ * mariadb_dyncol.base, so that behaviour and exceptions are identical.
+ */
+#define PY_SSIZE_T_CLEAN
+#include <Python.h>
+#include <datetime.h>
+#include <stdint.h>
+#include <string.h>
+
+#define DYN_COL_INT 0
+#define DYN_COL_UINT 1
+#define DYN_COL_DOUBLE 2
+#define DYN_COL_STRING 3
+#define DYN_COL_DECIMAL 4
+#define DYN_COL_DATETIME 5
+#define DYN_COL_DATE 6
+#define DYN_COL_TIME 7
+#define DYN_COL_DYNCOL 8
+
+#define MAX_TOTAL_NAME_LENGTH 65535
+#define MAX_NAME_LENGTH (MAX_TOTAL_NAME_LENGTH / 4)
+
+/* Internal return codes */
+#define OK 0
+#define ERROR -1
+#define FALLBACK 1
+
+static PyObject *py_pack = NULL;
+static PyObject *py_unpack = NULL;
+static PyObject *py_pack_into = NULL;
+static PyObject *py_packed_size = NULL;
+static PyObject *py_pack_many = NULL;
+static PyObject *py_unpack_many = NULL;
+static PyObject *py_add = NULL;
+static PyObject *py_delete = NULL;
+static PyObject *py_to_json = NULL;
+/* Default limit on the levels of nesting, from mariadb_dyncol.base.MAX_DEPTH */
+static Py_ssize_t default_max_depth;
+/* Set while collecting statistics, see mariadb_dyncol.stats */
+static PyObject *stats_hook = NULL;
+static PyObject *perf_counter = NULL;
+
+/*
+ * Convert a raised exception into a fallback, so the Python implementation
+ * can raise its own, except for MemoryError which is passed through.
+ */
+static int
+fallback_on_error(void)
+{
+    if (PyErr_ExceptionMatches(PyExc_MemoryError)) {
+        return ERROR;
+    }
+    PyErr_Clear();
+    return FALLBACK;
+}
+
+/* Statistics */
+
+/* Start timing a call for statistics, if they're being collected */
+static int
+stats_start(double *started)
+{
+    PyObject *now;
+
+    *started = -1.0;
+    if (stats_hook == NULL) {
+        return OK;
+    }
+    now = PyObject_CallObject(perf_counter, NULL);
+    if (now == NULL) {
+        return ERROR;
+    }
+    *started = PyFloat_AsDouble(now);
+    Py_DECREF(now);
+    return *started == -1.0 && PyErr_Occurred() ? ERROR : OK;
+}
+
+/*
+ * Pass a pack or unpack done here, and the time taken since stats_start(), to
+ * the statistics hook. The Python implementation records those it does.
+ */
+static int
+stats_record(const char *operation, PyObject *buf, double started)
+{
+    PyObject *hook = stats_hook, *now, *result;
+    double seconds;
+
+    if (hook == NULL || started < 0) {
+        return OK;
+    }
+    now = PyObject_CallObject(perf_counter, NULL);
+    if (now == NULL) {
+        return ERROR;
+    }
+    seconds = PyFloat_AsDouble(now) - started;
+    Py_DECREF(now);
+    if (PyErr_Occurred()) {
+        return ERROR;
+    }
+    Py_INCREF(hook);
+    result = PyObject_CallFunction(hook, "sOd", operation, buf, seconds);
+    Py_DECREF(hook);
+    if (result == NULL) {
+        return ERROR;
+    }
+    Py_DECREF(result);
+    return OK;
+}
+
+/* Growable output buffer */
+
+typedef struct {
+    unsigned char *data;
+    Py_ssize_t len;
+    Py_ssize_t cap;
+} Buffer;
+
+static int
+buffer_reserve(Buffer *buf, Py_ssize_t extra)
+{
+    Py_ssize_t needed = buf->len + extra;
+    Py_ssize_t cap;
+    unsigned char *data;
+
+    if (needed <= buf->cap) {
+        return OK;
+    }
+    cap = buf->cap ? buf->cap : 64;
+    while (cap < needed) {
+        cap *= 2;
+    }
+    data = PyMem_Realloc(buf->data, cap);
+    if (data == NULL) {
+        PyErr_NoMemory();
+        return ERROR;
+    }
+    buf->data = data;
+    buf->cap = cap;
+    return OK;
+}
+
+static int
+buffer_append(Buffer *buf, const void *src, Py_ssize_t len)
+{
+    if (buffer_reserve(buf, len) != OK) {
+        return ERROR;
+    }
+    if (len) {
+        memcpy(buf->data + buf->len, src, len);
+    }
+    buf->len += len;
+    return OK;
+}
+
+static int
+buffer_append_le(Buffer *buf, uint64_t value, int nbytes)
+{
+    unsigned char bytes[8];
+    int i;
+
+    for (i = 0; i < nbytes; i++) {
+        bytes[i] = (unsigned char)(value >> (8 * i));
+    }
+    return buffer_append(buf, bytes, nbytes);
+}
+
+static void
+buffer_free(Buffer *buf)
+{
+    PyMem_Free(buf->data);
+    buf->data = NULL;
+    buf->len = buf->cap = 0;
+}
+
+/* pack() */
+
+typedef struct {
+    const char *name;
+    Py_ssize_t name_len;
+    PyObject *value;
+    Py_ssize_t data_offset;
+    int dtype;
+} Column;
+
+static int
+column_order(const void *a, const void *b)
+{
+    const Column *left = a;
+    const Column *right = b;
+
+    /* Keys are ordered by name length then name */
+    if (left->name_len != right->name_len) {
+        return left->name_len < right->name_len ? -1 : 1;
+    }
+    return memcmp(left->name, right->name, left->name_len);
+}
+
+static int pack_dict(PyObject *dict, Buffer *out, Py_ssize_t depth);
+static int pack_columns(Column *columns, Py_ssize_t column_count,
+                        Py_ssize_t total_name_length, Buffer *out, Py_ssize_t depth);
+
+static int
+encode_int(PyObject *value, Buffer *data, int *dtype)
+{
+    int overflow;
+    long long svalue;
+    unsigned long long encvalue;
+
+    svalue = PyLong_AsLongLongAndOverflow(value, &overflow);
+    if (svalue == -1 && PyErr_Occurred()) {
+        return fallback_on_error();
+    }
+    if (overflow > 0) {
+        encvalue = PyLong_AsUnsignedLongLong(value);
+        if (encvalue == (unsigned long long)-1 && PyErr_Occurred()) {
+            return fallback_on_error();
+        }
+        *dtype = DYN_COL_UINT;
+    } else if (overflow < 0 || svalue < -(long long)0xFFFFFFFF) {
+        return FALLBACK;
+    } else if (svalue < 0) {
+        *dtype = DYN_COL_INT;
+        encvalue = ((unsigned long long)(-svalue) << 1) - 1;
+    } else {
+        *dtype = DYN_COL_INT;
+        encvalue = (unsigned long long)svalue << 1;
+    }
+
+    while (encvalue) {
+        unsigned char byte = encvalue & 0xFF;
+        if (buffer_append(data, &byte, 1) != OK) {
+            return ERROR;
+        }
+        encvalue >>= 8;
+    }
+    return OK;
+}
+
+static int
+encode_float(PyObject *value, Buffer *data)
+{
+    double dvalue = PyFloat_AS_DOUBLE(value);
+
+    if (Py_IS_NAN(dvalue) || Py_IS_INFINITY(dvalue)) {
+        return FALLBACK;
+    }
+    /* -0.0 is not supported in SQL, change to 0.0 */
+    if (dvalue == 0.0) {
+        dvalue = 0.0;
+    }
+    return buffer_append(data, &dvalue, sizeof(double));
+}
+
+static int
+encode_string(PyObject *value, Buffer *data)
+{
+    const char *encvalue;
+    Py_ssize_t len;
+    unsigned char charset = 0x2D;
+
+    encvalue = PyUnicode_AsUTF8AndSize(value, &len);
+    if (encvalue == NULL) {
+        return fallback_on_error();
+    }
+    if (buffer_append(data, &charset, 1) != OK) {
+        return ERROR;
+    }
+    return buffer_append(data, encvalue, len);
+}
+
+static int
+encode_bytes(PyObject *value, Buffer *data)
+{
+    /* Stored with the MySQL charset binary */
+    unsigned char charset = 0x3F;
+
+    if (buffer_append(data, &charset, 1) != OK) {
+        return ERROR;
+    }
+    return buffer_append(data, PyBytes_AS_STRING(value), PyBytes_GET_SIZE(value));
+}
+
+static int
+encode_date(int year, int month, int day, Buffer *data)
+{
+    uint64_t val = (uint64_t)day | (uint64_t)month << 5 | (uint64_t)year << 9;
+    return buffer_append_le(data, val, 3);
+}
+
+static int
+encode_time(int hour, int minute, int second, int microsecond, Buffer *data)
+{
+    uint64_t val;
+
+    if (microsecond > 0) {
+        val = (uint64_t)microsecond | (uint64_t)second << 20 |
+              (uint64_t)minute << 26 | (uint64_t)hour << 32;
+        return buffer_append_le(data, val, 6);
+    }
+    val = (uint64_t)second | (uint64_t)minute << 6 | (uint64_t)hour << 12;
+    return buffer_append_le(data, val, 3);
+}
+
+static int
+encode_value(PyObject *value, Buffer *data, int *dtype, Py_ssize_t depth)
+{
+    int result;
+
+    if (PyLong_CheckExact(value)) {
+        return encode_int(value, data, dtype);
+    } else if (PyUnicode_CheckExact(value)) {
+        *dtype = DYN_COL_STRING;
+        return encode_string(value, data);
+    } else if (PyBytes_CheckExact(value)) {
+        *dtype = DYN_COL_STRING;
+        return encode_bytes(value, data);
+    } else if (PyFloat_CheckExact(value)) {
+        *dtype = DYN_COL_DOUBLE;
+        return encode_float(value, data);
+    } else if (PyDateTime_CheckExact(value)) {
+        *dtype = DYN_COL_DATETIME;
+        if (encode_date(PyDateTime_GET_YEAR(value), PyDateTime_GET_MONTH(value),
+                        PyDateTime_GET_DAY(value), data) != OK) {
+            return ERROR;
+        }
+        return encode_time(PyDateTime_DATE_GET_HOUR(value),
+                           PyDateTime_DATE_GET_MINUTE(value),
+                           PyDateTime_DATE_GET_SECOND(value),
+                           PyDateTime_DATE_GET_MICROSECOND(value), data);
+    } else if (PyDate_CheckExact(value)) {
+        *dtype = DYN_COL_DATE;
+        return encode_date(PyDateTime_GET_YEAR(value), PyDateTime_GET_MONTH(value),
+                           PyDateTime_GET_DAY(value), data);
+    } else if (PyTime_CheckExact(value)) {
+        *dtype = DYN_COL_TIME;
+        return encode_time(PyDateTime_TIME_GET_HOUR(value),
+                           PyDateTime_TIME_GET_MINUTE(value),
+                           PyDateTime_TIME_GET_SECOND(value),
+                           PyDateTime_TIME_GET_MICROSECOND(value), data);
+    } else if (PyDict_CheckExact(value)) {
+        *dtype = DYN_COL_DYNCOL;
+        if (Py_EnterRecursiveCall(" while packing nested dynamic columns")) {
+            return fallback_on_error();
+        }
+        result = pack_dict(value, data, depth - 1);
+        Py_LeaveRecursiveCall();
+        return result;
+    }
+    return FALLBACK;
+}
+
+static int
+pack_dict(PyObject *dict, Buffer *out, Py_ssize_t depth)
+{
+    Py_ssize_t size = PyDict_Size(dict);
+    Py_ssize_t pos = 0;
+    Py_ssize_t column_count = 0;
+    Py_ssize_t total_name_length = 0;
+    PyObject *key, *value;
+    Column *columns;
+    int result = OK;
+
+    if (depth < 1) {
+        return FALLBACK;
+    }
+    columns = PyMem_Malloc(sizeof(Column) * (size ? size : 1));
+    if (columns == NULL) {
+        PyErr_NoMemory();
+        return ERROR;
+    }
+
+    while (PyDict_Next(dict, &pos, &key, &value)) {
+        Column *column;
+
+        if (!PyUnicode_CheckExact(key)) {
+            result = FALLBACK;
+            goto done;
+        }
+        if (value == Py_None) {
+            continue;
+        }
+        column = &columns[column_count++];
+        column->name = PyUnicode_AsUTF8AndSize(key, &column->name_len);
+        if (column->name == NULL) {
+            result = fallback_on_error();
+            goto done;
+        }
+        column->value = value;
+        total_name_length += column->name_len;
+        if (column->name_len > MAX_NAME_LENGTH ||
+            total_name_length > MAX_TOTAL_NAME_LENGTH) {
+            result = FALLBACK;
+            goto done;
+        }
+    }
+
+    qsort(columns, column_count, sizeof(Column), column_order);
+    result = pack_columns(columns, column_count, total_name_length, out, depth);
+
+done:
+    PyMem_Free(columns);
+    return result;
+}
+
+/*
+ * Encode the values of columns that are in order, and append the dynamic
+ * columns data made of them to out
+ */
+static int
+pack_columns(Column *columns, Py_ssize_t column_count, Py_ssize_t total_name_length,
+             Buffer *out, Py_ssize_t depth)
+{
+    Py_ssize_t coldata_size, i;
+    Buffer data = {NULL, 0, 0};
+    unsigned char flags;
+    int result = OK;
+
+    for (i = 0; i < column_count; i++) {
+        columns[i].data_offset = data.len;
+        result = encode_value(columns[i].value, &data, &columns[i].dtype, depth);
+        if (result != OK) {
+            goto done;
+        }
+    }
+
+    if (data.len < 0xFFF) {
+        flags = 4 | 0;
+        coldata_size = 4;
+    } else if (data.len < 0xFFFFF) {
+        flags = 4 | 1;
+        coldata_size = 5;
+    } else if (data.len < 0xFFFFFFF) {
+        flags = 4 | 2;
+        coldata_size = 6;
+    } else {
+        result = FALLBACK;
+        goto done;
+    }
+
+    if (buffer_reserve(out, 5 + coldata_size * column_count + total_name_length +
+                                data.len) != OK) {
+        result = ERROR;
+        goto done;
+    }
+    buffer_append_le(out, flags, 1);
+    buffer_append_le(out, (uint64_t)column_count, 2);
+    buffer_append_le(out, (uint64_t)total_name_length, 2);
+
+    total_name_length = 0;
+    for (i = 0; i < column_count; i++) {
+        buffer_append_le(out, (uint64_t)total_name_length, 2);
+        buffer_append_le(out,
+                         ((uint64_t)columns[i].data_offset << 4) + columns[i].dtype,
+                         (int)coldata_size - 2);
+        total_name_length += columns[i].name_len;
+    }
+    for (i = 0; i < column_count; i++) {
+        buffer_append(out, columns[i].name, columns[i].name_len);
+    }
+    buffer_append(out, data.data, data.len);
+
+done:
+    buffer_free(&data);
+    return result;
+}
+
+/*
+ * Pack a mapping into a new byte string, setting status to FALLBACK and
+ * returning NULL if the Python implementation should do it instead
+ */
+static PyObject *
+pack_object(PyObject *dicty, Py_ssize_t max_depth, int *status)
+{
+    Buffer out = {NULL, 0, 0};
+    PyObject *result;
+    double started;
+
+    *status = FALLBACK;
+    if (!PyDict_CheckExact(dicty)) {
+        return NULL;
+    }
+    if (stats_start(&started) != OK) {
+        *status = ERROR;
+        return NULL;
+    }
+    *status = pack_dict(dicty, &out, max_depth);
+    if (*status != OK) {
+        buffer_free(&out);
+        return NULL;
+    }
+    result = PyBytes_FromStringAndSize((const char *)out.data, out.len);
+    buffer_free(&out);
+    if (result == NULL || stats_record("pack", result, started) != OK) {
+        Py_XDECREF(result);
+        *status = ERROR;
+        return NULL;
+    }
+    return result;
+}
+
+static PyObject *
+speedups_pack(PyObject *module, PyObject *args, PyObject *kwargs)
+{
+    static char *kwlist[] = {"dicty", "max_depth", NULL};
+    PyObject *dicty, *result;
+    Py_ssize_t max_depth = default_max_depth;
+    int status;
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwargs, "O|$n:pack", kwlist, &dicty,
+                                     &max_depth)) {
+        return NULL;
+    }
+    result = pack_object(dicty, max_depth, &status);
+    if (status == FALLBACK) {
+        return PyObject_Call(py_pack, args, kwargs);
+    }
+    return result;
+}
+
+/* unpack() */
+
+static uint64_t
+read_le(const unsigned char *p, Py_ssize_t nbytes)
+{
+    uint64_t value = 0;
+    Py_ssize_t i;
+
+    for (i = 0; i < nbytes; i++) {
+        value |= (uint64_t)p[i] << (8 * i);
+    }
+    return value;
+}
+
+static int unpack_blob(const unsigned char *buf, Py_ssize_t len, Py_ssize_t depth,
+                       PyObject **result);
+
+static int
+decode_value(int dtype, const unsigned char *p, Py_ssize_t len, Py_ssize_t depth,
+             PyObject **result)
+{
+    uint64_t val, time_val;
+    double dvalue;
+    int status;
+
+    switch (dtype) {
+    case DYN_COL_INT:
+        if (len > 8) {
+            return FALLBACK;
+        }
+        val = read_le(p, len);
+        if (val & 1) {
+            *result = PyLong_FromLongLong(-(long long)(val >> 1) - 1);
+        } else {
+            *result = PyLong_FromLongLong((long long)(val >> 1));
+        }
+        break;
+    case DYN_COL_UINT:
+        if (len > 8) {
+            return FALLBACK;
+        }
+        *result = PyLong_FromUnsignedLongLong(read_le(p, len));
+        break;
+    case DYN_COL_DOUBLE:
+        if (len != sizeof(double)) {
+            return FALLBACK;
+        }
+        memcpy(&dvalue, p, sizeof(double));
+        *result = PyFloat_FromDouble(dvalue);
+        break;
+    case DYN_COL_STRING:
+        if (len < 1) {
+            return FALLBACK;
+        }
+        if (p[0] == 0x21 || p[0] == 0x2D) {
+            *result = PyUnicode_DecodeUTF8((const char *)p + 1, len - 1, NULL);
+        } else if (p[0] == 0x3F) {
+            *result = PyBytes_FromStringAndSize((const char *)p + 1, len - 1);
+        } else {
+            /* Other charsets are decoded by the Python implementation */
+            return FALLBACK;
+        }
+        break;
+    case DYN_COL_DATETIME:
+    case DYN_COL_DATE:
+        if ((dtype == DYN_COL_DATE && len != 3) ||
+            (dtype == DYN_COL_DATETIME && len != 6 && len != 9)) {
+            return FALLBACK;
+        }
+        val = read_le(p, 3);
+        if (dtype == DYN_COL_DATE) {
+            *result = PyDate_FromDate((int)(val >> 9), (int)((val >> 5) & 0xF),
+                                      (int)(val & 0x1F));
+        } else if (len == 9) {
+            time_val = read_le(p + 3, 6);
+            *result = PyDateTime_FromDateAndTime(
+                (int)(val >> 9), (int)((val >> 5) & 0xF), (int)(val & 0x1F),
+                (int)(time_val >> 32), (int)((time_val >> 26) & 0x3F),
+                (int)((time_val >> 20) & 0x3F), (int)(time_val & 0xFFFFF));
+        } else {
+            time_val = read_le(p + 3, 3);
+            *result = PyDateTime_FromDateAndTime(
+                (int)(val >> 9), (int)((val >> 5) & 0xF), (int)(val & 0x1F),
+                (int)(time_val >> 12), (int)((time_val >> 6) & 0x3F),
+                (int)(time_val & 0x3F), 0);
+        }
+        break;
+    case DYN_COL_TIME:
+        if (len == 6) {
+            val = read_le(p, 6);
+            *result = PyTime_FromTime((int)(val >> 32), (int)((val >> 26) & 0x3F),
+                                      (int)((val >> 20) & 0x3F),
+                                      (int)(val & 0xFFFFF));
+        } else if (len == 3) {
+            val = read_le(p, 3);
+            *result = PyTime_FromTime((int)(val >> 12), (int)((val >> 6) & 0x3F),
+                                      (int)(val & 0x3F), 0);
+        } else {
+            return FALLBACK;
+        }
+        break;
+    case DYN_COL_DYNCOL:
+        if (Py_EnterRecursiveCall(" while unpacking nested dynamic columns")) {
+            return fallback_on_error();
+        }
+        status = unpack_blob(p, len, depth - 1, result);
+        Py_LeaveRecursiveCall();
+        return status;
+    default:
+        return FALLBACK;
+    }
+
+    if (*result == NULL) {
+        return fallback_on_error();
+    }
+    return OK;
+}
+
+static int
+unpack_blob(const unsigned char *buf, Py_ssize_t len, Py_ssize_t depth,
+            PyObject **result)
+{
+    Py_ssize_t column_count, len_names, coldata_size;
+    Py_ssize_t names_start, data_start, i;
+    PyObject *dict, *name, *value;
+    int status;
+
+    *result = NULL;
+    if (depth < 1 || len < 5) {
+        return FALLBACK;
+    }
+    switch (buf[0] & 0x03) {
+    case 0:
+        coldata_size = 4;
+        break;
+    case 1:
+        coldata_size = 5;
+        break;
+    case 2:
+        coldata_size = 6;
+        break;
+    default:
+        return FALLBACK;
+    }
+    if ((buf[0] & 0xFC) != 4) {
+        return FALLBACK;
+    }
+    column_count = (Py_ssize_t)read_le(buf + 1, 2);
+    len_names = (Py_ssize_t)read_le(buf + 3, 2);
+    names_start = 5 + coldata_size * column_count;
+    data_start = names_start + len_names;
+    if (data_start > len) {
+        return FALLBACK;
+    }
+
+    dict = PyDict_New();
+    if (dict == NULL) {
+        return ERROR;
+    }
+
+    for (i = 0; i < column_count; i++) {
+        const unsigned char *entry = buf + 5 + coldata_size * i;
+        Py_ssize_t name_offset, name_end, data_offset, data_end;
+        uint64_t data_offset_dtype;
+
+        name_offset = (Py_ssize_t)read_le(entry, 2);
+        data_offset_dtype = read_le(entry + 2, coldata_size - 2);
+        data_offset = (Py_ssize_t)(data_offset_dtype >> 4);
+        if (i + 1 < column_count) {
+            name_end = (Py_ssize_t)read_le(entry + coldata_size, 2);
+            data_end = (Py_ssize_t)(read_le(entry + coldata_size + 2,
+                                            coldata_size - 2) >> 4);
+        } else {
+            name_end = len_names;
+            data_end = len - data_start;
+        }
+        if (name_offset > name_end || name_end > len_names ||
+            data_offset > data_end || data_end > len - data_start) {
+            status = FALLBACK;
+            goto error;
+        }
+
+        name = PyUnicode_DecodeUTF8((const char *)buf + names_start + name_offset,
+                                    name_end - name_offset, NULL);
+        if (name == NULL) {
+            status = fallback_on_error();
+            goto error;
+        }
+        status = decode_value((int)(data_offset_dtype & 0xF),
+                              buf + data_start + data_offset, data_end - data_offset,
+                              depth, &value);
+        if (status != OK) {
+            Py_DECREF(name);
+            goto error;
+        }
+        status = PyDict_SetItem(dict, name, value);
+        Py_DECREF(name);
+        Py_DECREF(value);
+        if (status < 0) {
+            status = ERROR;
+            goto error;
+        }
+    }
+
+    *result = dict;
+    return OK;
+
+error:
+    Py_DECREF(dict);
+    return status;
+}
+
+/*
+ * Unpack a byte string into a new dict, setting status to FALLBACK and
+ * returning NULL if the Python implementation should do it instead
+ */
+static PyObject *
+unpack_object(PyObject *buf, Py_ssize_t max_depth, int *status)
+{
+    PyObject *result;
+    double started;
+
+    *status = FALLBACK;
+    if (!PyBytes_CheckExact(buf)) {
+        return NULL;
+    }
+    if (stats_start(&started) != OK) {
+        *status = ERROR;
+        return NULL;
+    }
+    *status = unpack_blob((const unsigned char *)PyBytes_AS_STRING(buf),
+                          PyBytes_GET_SIZE(buf), max_depth, &result);
+    if (*status != OK) {
+        return NULL;
+    }
+    if (stats_record("unpack", buf, started) != OK) {
+        Py_DECREF(result);
+        *status = ERROR;
+        return NULL;
+    }
+    return result;
+}
+
+static PyObject *
+speedups_unpack(PyObject *module, PyObject *args, PyObject *kwargs)
+{
+    static char *kwlist[] = {"buf", "max_depth", NULL};
+    PyObject *buf, *result;
+    Py_ssize_t max_depth = default_max_depth;
+    int status;
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwargs, "O|$n:unpack", kwlist, &buf,
+                                     &max_depth)) {
+        return NULL;
+    }
+    result = unpack_object(buf, max_depth, &status);
+    if (status == FALLBACK) {
+        return PyObject_Call(py_unpack, args, kwargs);
+    }
+    return result;
+}
+
+/* pack_into() and packed_size() */
+
+static PyObject *
+speedups_pack_into(PyObject *module, PyObject *args, PyObject *kwargs)
+{
+    static char *kwlist[] = {"buffer", "offset", "dicty", NULL};
+    PyObject *buffer, *offset_obj, *dicty;
+    Py_ssize_t offset = 0, size;
+    Py_buffer view;
+    Buffer out = {NULL, 0, 0};
+    int status = FALLBACK;
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwargs, "OOO:pack_into", kwlist, &buffer,
+                                     &offset_obj, &dicty)) {
+        return NULL;
+    }
+    if (PyLong_CheckExact(offset_obj) && PyDict_CheckExact(dicty)) {
+        offset = PyLong_AsSsize_t(offset_obj);
+        if (offset == -1 && PyErr_Occurred()) {
+            status = fallback_on_error();
+        } else {
+            status = pack_dict(dicty, &out, default_max_depth);
+        }
+    }
+    /* The Python implementation raises the errors about the buffer */
+    if (status == OK) {
+        if (PyObject_GetBuffer(buffer, &view, PyBUF_WRITABLE | PyBUF_C_CONTIGUOUS) <
+            0) {
+            status = fallback_on_error();
+        } else {
+            if (offset >= 0 && out.len <= view.len - offset) {
+                memcpy((char *)view.buf + offset, out.data, out.len);
+            } else {
+                status = FALLBACK;
+            }
+            PyBuffer_Release(&view);
+        }
+    }
+    size = out.len;
+    buffer_free(&out);
+    if (status == ERROR) {
+        return NULL;
+    }
+    if (status == FALLBACK) {
+        return PyObject_Call(py_pack_into, args, kwargs);
+    }
+    return PyLong_FromSsize_t(size);
+}
+
+static PyObject *
+speedups_packed_size(PyObject *module, PyObject *args, PyObject *kwargs)
+{
+    static char *kwlist[] = {"dicty", NULL};
+    PyObject *dicty;
+    Buffer out = {NULL, 0, 0};
+    Py_ssize_t size;
+    int status = FALLBACK;
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwargs, "O:packed_size", kwlist,
+                                     &dicty)) {
+        return NULL;
+    }
+    if (PyDict_CheckExact(dicty)) {
+        status = pack_dict(dicty, &out, default_max_depth);
+    }
+    size = out.len;
+    buffer_free(&out);
+    if (status == ERROR) {
+        return NULL;
+    }
+    if (status == FALLBACK) {
+        return PyObject_Call(py_packed_size, args, kwargs);
+    }
+    return PyLong_FromSsize_t(size);
+}
+
+/* pack_many() and unpack_many() */
+
+/* Pack one mapping as pack() does with no keyword arguments */
+static PyObject *
+pack_one(PyObject *dicty)
+{
+    int status;
+    PyObject *result = pack_object(dicty, default_max_depth, &status);
+
+    if (status == FALLBACK) {
+        return PyObject_CallFunctionObjArgs(py_pack, dicty, NULL);
+    }
+    return result;
+}
+
+/* Unpack one byte string as unpack() does with no keyword arguments */
+static PyObject *
+unpack_one(PyObject *buf)
+{
+    int status;
+    PyObject *result = unpack_object(buf, default_max_depth, &status);
+
+    if (status == FALLBACK) {
+        return PyObject_CallFunctionObjArgs(py_unpack, buf, NULL);
+    }
+    return result;
+}
+
+/* Call func on each item of an iterable, returning a list of the results */
+static PyObject *
+map_to_list(PyObject *items, PyObject *(*func)(PyObject *))
+{
+    PyObject *iterator, *item, *value, *result;
+
+    result = PyList_New(0);
+    if (result == NULL) {
+        return NULL;
+    }
+    iterator = PyObject_GetIter(items);
+    if (iterator == NULL) {
+        Py_DECREF(result);
+        return NULL;
+    }
+    while ((item = PyIter_Next(iterator)) != NULL) {
+        value = func(item);
+        Py_DECREF(item);
+        if (value == NULL || PyList_Append(result, value) < 0) {
+            Py_XDECREF(value);
+            Py_DECREF(iterator);
+            Py_DECREF(result);
+            return NULL;
+        }
+        Py_DECREF(value);
+    }
+    Py_DECREF(iterator);
+    if (PyErr_Occurred()) {
+        Py_DECREF(result);
+        return NULL;
+    }
+    return result;
+}
+
+static PyObject *
+speedups_pack_many(PyObject *module, PyObject *args, PyObject *kwargs)
+{
+    static char *kwlist[] = {"dicties", NULL};
+    PyObject *dicties;
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwargs, "O:pack_many", kwlist,
+                                     &dicties)) {
+        return NULL;
+    }
+    return map_to_list(dicties, pack_one);
+}
+
+static PyObject *
+speedups_unpack_many(PyObject *module, PyObject *args, PyObject *kwargs)
+{
+    static char *kwlist[] = {"bufs", NULL};
+    PyObject *bufs;
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwargs, "O:unpack_many", kwlist, &bufs)) {
+        return NULL;
+    }
+    return map_to_list(bufs, unpack_one);
+}
+
+/* Schema.pack() and Schema.unpack() */
+
+/*
+ * Pack a dict with exactly the given keys, in the same order, into a new byte
+ * string, with the value of each key written as the column at the same index
+ * in positions, without sorting or looking up the keys. Sets status to
+ * FALLBACK and returns NULL if the dict doesn't match them. Values aren't
+ * checked against the schema's types, as values of other types are packed as
+ * pack() packs them anyway.
+ */
+static PyObject *
+schema_pack_object(PyObject *dicty, PyObject *keys, PyObject *positions,
+                   int *status)
+{
+    Py_ssize_t column_count = PyTuple_GET_SIZE(keys);
+    Py_ssize_t total_name_length = 0, pos = 0, i = 0, j;
+    PyObject *key, *value;
+    Column *columns;
+    Buffer out = {NULL, 0, 0};
+    PyObject *result = NULL;
+    double started;
+
+    *status = FALLBACK;
+    if (!PyDict_CheckExact(dicty) || PyDict_GET_SIZE(dicty) != column_count ||
+        PyTuple_GET_SIZE(positions) != column_count) {
+        return NULL;
+    }
+    if (stats_start(&started) != OK) {
+        *status = ERROR;
+        return NULL;
+    }
+    columns = PyMem_Malloc(sizeof(Column) * (column_count ? column_count : 1));
+    if (columns == NULL) {
+        PyErr_NoMemory();
+        *status = ERROR;
+        return NULL;
+    }
+
+    while (PyDict_Next(dicty, &pos, &key, &value)) {
+        PyObject *expected = PyTuple_GET_ITEM(keys, i);
+
+        if (key != expected &&
+            (!PyUnicode_CheckExact(key) || !PyUnicode_CheckExact(expected) ||
+             PyUnicode_Compare(key, expected) != 0)) {
+            goto done;
+        }
+        if (value == Py_None) {
+            goto done;
+        }
+        j = PyLong_AsSsize_t(PyTuple_GET_ITEM(positions, i++));
+        if (j < 0 || j >= column_count) {
+            *status = PyErr_Occurred() ? fallback_on_error() : FALLBACK;
+            goto done;
+        }
+        columns[j].name = PyUnicode_AsUTF8AndSize(expected, &columns[j].name_len);
+        if (columns[j].name == NULL) {
+            *status = fallback_on_error();
+            goto done;
+        }
+        columns[j].value = value;
+        total_name_length += columns[j].name_len;
+        if (columns[j].name_len > MAX_NAME_LENGTH ||
+            total_name_length > MAX_TOTAL_NAME_LENGTH) {
+            goto done;
+        }
+    }
+
+    *status = pack_columns(columns, column_count, total_name_length, &out,
+                           default_max_depth);
+    if (*status != OK) {
+        goto done;
+    }
+    result = PyBytes_FromStringAndSize((const char *)out.data, out.len);
+    if (result == NULL || stats_record("pack", result, started) != OK) {
+        Py_CLEAR(result);
+        *status = ERROR;
+    }
+
+done:
+    PyMem_Free(columns);
+    buffer_free(&out);
+    return result;
+}
+
+static PyObject *
+speedups_schema_pack(PyObject *module, PyObject *args)
+{
+    PyObject *dicty, *keys, *positions, *result;
+    int status;
+
+    if (!PyArg_ParseTuple(args, "OO!O!:_schema_pack", &dicty, &PyTuple_Type, &keys,
+                          &PyTuple_Type, &positions)) {
+        return NULL;
+    }
+    result = schema_pack_object(dicty, keys, positions, &status);
+    if (status == FALLBACK) {
+        /*
+         * Mappings that don't match the schema, including those with its keys
+         * in another order, are packed as by pack()
+         */
+        return pack_one(dicty);
+    }
+    return result;
+}
+
+/*
+ * Unpack a byte string with exactly the given keys as its columns, and the
+ * given names as its column names, into a new dict, using the keys rather
+ * than decoding the names. Sets status to FALLBACK and returns NULL if the
+ * data doesn't match them.
+ */
+static PyObject *
+schema_unpack_object(PyObject *buf, PyObject *keys, PyObject *names, int *status)
+{
+    Py_ssize_t column_count = PyTuple_GET_SIZE(keys);
+    Py_ssize_t len_names = PyBytes_GET_SIZE(names);
+    Py_ssize_t len, coldata_size, names_start, data_start, name_offset, i;
+    const unsigned char *p;
+    PyObject *dict, *value;
+    double started;
+
+    *status = FALLBACK;
+    if (!PyBytes_CheckExact(buf)) {
+        return NULL;
+    }
+    p = (const unsigned char *)PyBytes_AS_STRING(buf);
+    len = PyBytes_GET_SIZE(buf);
+    if (len < 5 || (p[0] & 0xFC) != 4 || (p[0] & 0x03) == 3 ||
+        (Py_ssize_t)read_le(p + 1, 2) != column_count ||
+        (Py_ssize_t)read_le(p + 3, 2) != len_names) {
+        return NULL;
+    }
+    coldata_size = 4 + (p[0] & 0x03);
+    names_start = 5 + coldata_size * column_count;
+    data_start = names_start + len_names;
+    if (data_start > len ||
+        memcmp(p + names_start, PyBytes_AS_STRING(names), len_names) != 0) {
+        return NULL;
+    }
+    if (stats_start(&started) != OK) {
+        *status = ERROR;
+        return NULL;
+    }
+    dict = PyDict_New();
+    if (dict == NULL) {
+        *status = ERROR;
+        return NULL;
+    }
+
+    name_offset = 0;
+    for (i = 0; i < column_count; i++) {
+        const unsigned char *entry = p + 5 + coldata_size * i;
+        PyObject *key = PyTuple_GET_ITEM(keys, i);
+        Py_ssize_t name_len, data_offset, data_end;
+        uint64_t data_offset_dtype;
+
+        if (PyUnicode_AsUTF8AndSize(key, &name_len) == NULL) {
+            *status = fallback_on_error();
+            goto error;
+        }
+        if ((Py_ssize_t)read_le(entry, 2) != name_offset) {
+            *status = FALLBACK;
+            goto error;
+        }
+        name_offset += name_len;
+        data_offset_dtype = read_le(entry + 2, coldata_size - 2);
+        data_offset = (Py_ssize_t)(data_offset_dtype >> 4);
+        if (i + 1 < column_count) {
+            data_end = (Py_ssize_t)(read_le(entry + coldata_size + 2,
+                                            coldata_size - 2) >> 4);
+        } else {
+            data_end = len - data_start;
+        }
+        if (data_offset > data_end || data_end > len - data_start) {
+            *status = FALLBACK;
+            goto error;
+        }
+
+        *status = decode_value((int)(data_offset_dtype & 0xF),
+                               p + data_start + data_offset, data_end - data_offset,
+                               default_max_depth, &value);
+        if (*status != OK) {
+            goto error;
+        }
+        if (PyDict_SetItem(dict, key, value) < 0) {
+            Py_DECREF(value);
+            *status = ERROR;
+            goto error;
+        }
+        Py_DECREF(value);
+    }
+    if (name_offset != len_names) {
+        *status = FALLBACK;
+        goto error;
+    }
+    if (stats_record("unpack", buf, started) != OK) {
+        *status = ERROR;
+        goto error;
+    }
+    *status = OK;
+    return dict;
+
+error:
+    Py_DECREF(dict);
+    return NULL;
+}
+
+static PyObject *
+speedups_schema_unpack(PyObject *module, PyObject *args)
+{
+    PyObject *buf, *keys, *names, *result;
+    int status;
+
+    if (!PyArg_ParseTuple(args, "OO!O!:_schema_unpack", &buf, &PyTuple_Type, &keys,
+                          &PyBytes_Type, &names)) {
+        return NULL;
+    }
+    result = schema_unpack_object(buf, keys, names, &status);
+    if (status == FALLBACK) {
+        /* Data that doesn't match the schema is unpacked as by unpack() */
+        return unpack_one(buf);
+    }
+    return result;
+}
+
+/* add() and delete() */
+
+/* A column of the output, with its encoded value, or a deletion if dtype < 0 */
+typedef struct {
+    const char *name;
+    Py_ssize_t name_len;
+    const unsigned char *value;
+    Py_ssize_t value_len;
+    int dtype;
+} Entry;
+
+static int
+entry_order(const void *a, const void *b)
+{
+    const Entry *left = a;
+    const Entry *right = b;
+
+    if (left->name_len != right->name_len) {
+        return left->name_len < right->name_len ? -1 : 1;
+    }
+    return memcmp(left->name, right->name, left->name_len);
+}
+
+/*
+ * Read the columns of dynamic columns data into entries, which must have room
+ * for the column count, without decoding anything. Falls back unless the data
+ * is well formed with its names in order, so merging with it is valid.
+ */
+static int
+read_entries(const unsigned char *buf, Py_ssize_t len, Entry **entries,
+             Py_ssize_t *count)
+{
+    Py_ssize_t column_count, len_names, coldata_size;
+    Py_ssize_t names_start, data_start, i;
+
+    *entries = NULL;
+    if (len < 5) {
+        return FALLBACK;
+    }
+    switch (buf[0] & 0x03) {
+    case 0:
+        coldata_size = 4;
+        break;
+    case 1:
+        coldata_size = 5;
+        break;
+    case 2:
+        coldata_size = 6;
+        break;
+    default:
+        return FALLBACK;
+    }
+    if ((buf[0] & 0xFC) != 4) {
+        return FALLBACK;
+    }
+    column_count = (Py_ssize_t)read_le(buf + 1, 2);
+    len_names = (Py_ssize_t)read_le(buf + 3, 2);
+    names_start = 5 + coldata_size * column_count;
+    data_start = names_start + len_names;
+    if (data_start > len) {
+        return FALLBACK;
+    }
+
+    *entries = PyMem_Malloc(sizeof(Entry) * (column_count ? column_count : 1));
+    if (*entries == NULL) {
+        PyErr_NoMemory();
+        return ERROR;
+    }
+    for (i = 0; i < column_count; i++) {
+        const unsigned char *entry = buf + 5 + coldata_size * i;
+        Entry *column = &(*entries)[i];
+        Py_ssize_t name_offset, name_end, data_offset, data_end;
+        uint64_t data_offset_dtype;
+
+        name_offset = (Py_ssize_t)read_le(entry, 2);
+        data_offset_dtype = read_le(entry + 2, coldata_size - 2);
+        data_offset = (Py_ssize_t)(data_offset_dtype >> 4);
+        if (i + 1 < column_count) {
+            name_end = (Py_ssize_t)read_le(entry + coldata_size, 2);
+            data_end = (Py_ssize_t)(read_le(entry + coldata_size + 2,
+                                            coldata_size - 2) >> 4);
+        } else {
+            name_end = len_names;
+            data_end = len - data_start;
+        }
+        if (name_offset > name_end || name_end > len_names ||
+            data_offset > data_end || data_end > len - data_start) {
+            return FALLBACK;
+        }
+        column->name = (const char *)buf + names_start + name_offset;
+        column->name_len = name_end - name_offset;
+        column->value = buf + data_start + data_offset;
+        column->value_len = data_end - data_offset;
+        column->dtype = (int)(data_offset_dtype & 0xF);
+        if (i > 0 && entry_order(column - 1, column) >= 0) {
+            return FALLBACK;
+        }
+    }
+    *count = column_count;
+    return OK;
+}
+
+/*
+ * Write dynamic columns data with the columns of both sorted arrays, taking
+ * edits over existing columns of the same name, and leaving out deletions.
+ */
+static int
+write_merged(const Entry *existing, Py_ssize_t existing_count, const Entry *edits,
+             Py_ssize_t edit_count, Buffer *out)
+{
+    Py_ssize_t i = 0, j = 0, count = 0, names_len = 0, data_len = 0;
+    Py_ssize_t coldata_size, k;
+    const Entry **merged;
+    unsigned char flags;
+    int order;
+
+    merged = PyMem_Malloc(sizeof(Entry *) * (existing_count + edit_count + 1));
+    if (merged == NULL) {
+        PyErr_NoMemory();
+        return ERROR;
+    }
+    while (i < existing_count || j < edit_count) {
+        if (i == existing_count) {
+            order = 1;
+        } else if (j == edit_count) {
+            order = -1;
+        } else {
+            order = entry_order(&existing[i], &edits[j]);
+        }
+        if (order < 0) {
+            merged[count++] = &existing[i++];
+            continue;
+        }
+        if (order == 0) {
+            i++;
+        }
+        if (edits[j].dtype >= 0) {
+            merged[count++] = &edits[j];
+        }
+        j++;
+    }
+
+    for (k = 0; k < count; k++) {
+        names_len += merged[k]->name_len;
+        data_len += merged[k]->value_len;
+    }
+    if (names_len > MAX_TOTAL_NAME_LENGTH) {
+        PyMem_Free(merged);
+        return FALLBACK;
+    }
+    if (data_len < 0xFFF) {
+        flags = 4 | 0;
+        coldata_size = 4;
+    } else if (data_len < 0xFFFFF) {
+        flags = 4 | 1;
+        coldata_size = 5;
+    } else if (data_len < 0xFFFFFFF) {
+        flags = 4 | 2;
+        coldata_size = 6;
+    } else {
+        PyMem_Free(merged);
+        return FALLBACK;
+    }
+
+    if (buffer_reserve(out, 5 + coldata_size * count + names_len + data_len) != OK) {
+        PyMem_Free(merged);
+        return ERROR;
+    }
+    buffer_append_le(out, flags, 1);
+    buffer_append_le(out, (uint64_t)count, 2);
+    buffer_append_le(out, (uint64_t)names_len, 2);
+    names_len = data_len = 0;
+    for (k = 0; k < count; k++) {
+        buffer_append_le(out, (uint64_t)names_len, 2);
+        buffer_append_le(out, ((uint64_t)data_len << 4) + merged[k]->dtype,
+                         (int)coldata_size - 2);
+        names_len += merged[k]->name_len;
+        data_len += merged[k]->value_len;
+    }
+    for (k = 0; k < count; k++) {
+        buffer_append(out, merged[k]->name, merged[k]->name_len);
+    }
+    for (k = 0; k < count; k++) {
+        buffer_append(out, merged[k]->value, merged[k]->value_len);
+    }
+    PyMem_Free(merged);
+    return OK;
+}
+
+static int
+add_columns(PyObject *buf, PyObject *updates, Buffer *out)
+{
+    Py_ssize_t size = PyDict_Size(updates);
+    Py_ssize_t pos = 0, edit_count = 0, existing_count = 0, i;
+    Py_ssize_t *data_offsets = NULL;
+    PyObject *key, *value;
+    Entry *existing = NULL, *edits;
+    Buffer data = {NULL, 0, 0};
+    int status;
+
+    edits = PyMem_Malloc(sizeof(Entry) * (size ? size : 1));
+    data_offsets = PyMem_Malloc(sizeof(Py_ssize_t) * (size + 1));
+    if (edits == NULL || data_offsets == NULL) {
+        PyErr_NoMemory();
+        status = ERROR;
+        goto done;
+    }
+
+    while (PyDict_Next(updates, &pos, &key, &value)) {
+        Entry *edit = &edits[edit_count];
+
+        if (!PyUnicode_CheckExact(key)) {
+            status = FALLBACK;
+            goto done;
+        }
+        edit->name = PyUnicode_AsUTF8AndSize(key, &edit->name_len);
+        if (edit->name == NULL) {
+            status = fallback_on_error();
+            goto done;
+        }
+        if (edit->name_len > MAX_NAME_LENGTH) {
+            status = FALLBACK;
+            goto done;
+        }
+        data_offsets[edit_count] = data.len;
+        if (value == Py_None) {
+            edit->dtype = -1;
+        } else {
+            status = encode_value(value, &data, &edit->dtype, default_max_depth);
+            if (status != OK) {
+                goto done;
+            }
+        }
+        edit_count++;
+    }
+    /* The encoded values can only be pointed to once the buffer is complete */
+    data_offsets[edit_count] = data.len;
+    for (i = 0; i < edit_count; i++) {
+        edits[i].value = data.data + data_offsets[i];
+        edits[i].value_len = data_offsets[i + 1] - data_offsets[i];
+    }
+    qsort(edits, edit_count, sizeof(Entry), entry_order);
+
+    status = read_entries((const unsigned char *)PyBytes_AS_STRING(buf),
+                          PyBytes_GET_SIZE(buf), &existing, &existing_count);
+    if (status == OK) {
+        status = write_merged(existing, existing_count, edits, edit_count, out);
+    }
+
+done:
+    PyMem_Free(existing);
+    PyMem_Free(edits);
+    PyMem_Free(data_offsets);
+    buffer_free(&data);
+    return status;
+}
+
+static int
+delete_columns(PyObject *buf, PyObject *names, Buffer *out)
+{
+    Py_ssize_t size = PySequence_Fast_GET_SIZE(names);
+    Py_ssize_t existing_count = 0, i;
+    Entry *existing = NULL, *edits;
+    int status;
+
+    edits = PyMem_Malloc(sizeof(Entry) * (size ? size : 1));
+    if (edits == NULL) {
+        PyErr_NoMemory();
+        return ERROR;
+    }
+    for (i = 0; i < size; i++) {
+        PyObject *name = PySequence_Fast_GET_ITEM(names, i);
+
+        if (!PyUnicode_CheckExact(name)) {
+            status = FALLBACK;
+            goto done;
+        }
+        edits[i].name = PyUnicode_AsUTF8AndSize(name, &edits[i].name_len);
+        if (edits[i].name == NULL) {
+            status = fallback_on_error();
+            goto done;
+        }
+        edits[i].dtype = -1;
+        edits[i].value = NULL;
+        edits[i].value_len = 0;
+    }
+    qsort(edits, size, sizeof(Entry), entry_order);
+
+    status = read_entries((const unsigned char *)PyBytes_AS_STRING(buf),
+                          PyBytes_GET_SIZE(buf), &existing, &existing_count);
+    if (status == OK) {
+        status = write_merged(existing, existing_count, edits, size, out);
+    }
+
+done:
+    PyMem_Free(existing);
+    PyMem_Free(edits);
+    return status;
+}
+
+static PyObject *
+speedups_add(PyObject *module, PyObject *args, PyObject *kwargs)
+{
+    static char *kwlist[] = {"buf", "updates", NULL};
+    PyObject *buf, *updates, *result;
+    Buffer out = {NULL, 0, 0};
+    int status = FALLBACK;
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwargs, "OO:add", kwlist, &buf,
+                                     &updates)) {
+        return NULL;
+    }
+    if (PyBytes_CheckExact(buf) && PyDict_CheckExact(updates)) {
+        status = add_columns(buf, updates, &out);
+    }
+    if (status == ERROR) {
+        buffer_free(&out);
+        return NULL;
+    }
+    if (status == FALLBACK) {
+        buffer_free(&out);
+        return PyObject_Call(py_add, args, kwargs);
+    }
+    result = PyBytes_FromStringAndSize((const char *)out.data, out.len);
+    buffer_free(&out);
+    return result;
+}
+
+static PyObject *
+speedups_delete(PyObject *module, PyObject *args, PyObject *kwargs)
+{
+    static char *kwlist[] = {"buf", "names", NULL};
+    PyObject *buf, *names, *result;
+    Buffer out = {NULL, 0, 0};
+    int status = FALLBACK;
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwargs, "OO:delete", kwlist, &buf,
+                                     &names)) {
+        return NULL;
+    }
+    /* Other iterables may only be iterable once, so are left for fallback */
+    if (PyBytes_CheckExact(buf) &&
+        (PyList_CheckExact(names) || PyTuple_CheckExact(names))) {
+        status = delete_columns(buf, names, &out);
+    }
+    if (status == ERROR) {
+        buffer_free(&out);
+        return NULL;
+    }
+    if (status == FALLBACK) {
+        buffer_free(&out);
+        return PyObject_Call(py_delete, args, kwargs);
+    }
+    result = PyBytes_FromStringAndSize((const char *)out.data, out.len);
+    buffer_free(&out);
+    return result;
+}
+
+/* to_json() */
+
+static const char hex_digits[] = "0123456789ABCDEF";
+
+/*
+ * Append a JSON string with the given UTF-8 or binary contents, escaping the
+ * same bytes as COLUMN_JSON: backslashes and double quotes, and control
+ * characters always as \u00XX.
+ */
+static int
+json_append_string(Buffer *out, const unsigned char *p, Py_ssize_t len)
+{
+    Py_ssize_t i;
+    unsigned char *dest;
+
+    /* At most 6 bytes per input byte, for \u00XX escapes, plus the quotes */
+    if (buffer_reserve(out, len * 6 + 2) != OK) {
+        return ERROR;
+    }
+    dest = out->data + out->len;
+    *dest++ = '"';
+    for (i = 0; i < len; i++) {
+        unsigned char c = p[i];
+
+        if (c >= 0x20 && c != '"' && c != '\\') {
+            *dest++ = c;
+        } else if (c >= 0x20) {
+            *dest++ = '\\';
+            *dest++ = c;
+        } else {
+            *dest++ = '\\';
+            *dest++ = 'u';
+            *dest++ = '0';
+            *dest++ = '0';
+            *dest++ = hex_digits[c >> 4];
+            *dest++ = hex_digits[c & 0xF];
+        }
+    }
+    *dest++ = '"';
+    out->len = dest - out->data;
+    return OK;
+}
+
+/*
+ * Check UTF-8 data is valid, falling back to the Python implementation to raise
+ * the error if not
+ */
+static int
+check_utf8(const unsigned char *p, Py_ssize_t len)
+{
+    Py_ssize_t i;
+    PyObject *decoded;
+
+    for (i = 0; i < len; i++) {
+        if (p[i] & 0x80) {
+            decoded = PyUnicode_DecodeUTF8((const char *)p, len, NULL);
+            if (decoded == NULL) {
+                return fallback_on_error();
+            }
+            Py_DECREF(decoded);
+            return OK;
+        }
+    }
+    return OK;
+}
+
+static int
+json_append_time(Buffer *out, uint64_t val, unsigned long microsecond)
+{
+    char text[32];
+    int n;
+
+    n = snprintf(text, sizeof(text), "%s%02d:%02d:%02d", (val >> 22) & 1 ? "-" : "",
+                 (int)((val >> 12) & 0x3FF), (int)((val >> 6) & 0x3F),
+                 (int)(val & 0x3F));
+    if (microsecond) {
+        n += snprintf(text + n, sizeof(text) - n, ".%06lu", microsecond);
+    }
+    return buffer_append(out, text, n);
+}
+
+static int
+json_append_date(Buffer *out, uint64_t val)
+{
+    char text[32];
+    int n;
+
+    n = snprintf(text, sizeof(text), "%04d-%02d-%02d", (int)(val >> 9),
+                 (int)((val >> 5) & 0xF), (int)(val & 0x1F));
+    return buffer_append(out, text, n);
+}
+
+static int json_blob(const unsigned char *buf, Py_ssize_t len, Py_ssize_t depth,
+                     Buffer *out);
+
+static int
+json_value(int dtype, const unsigned char *p, Py_ssize_t len, Py_ssize_t depth,
+           Buffer *out)
+{
+    uint64_t val;
+    double dvalue;
+    char text[32], *repr;
+    int n, status;
+
+    switch (dtype) {
+    case DYN_COL_INT:
+        if (len > 8) {
+            return FALLBACK;
+        }
+        val = read_le(p, len);
+        if (val & 1) {
+            n = snprintf(text, sizeof(text), "%lld", -(long long)(val >> 1) - 1);
+        } else {
+            n = snprintf(text, sizeof(text), "%lld", (long long)(val >> 1));
+        }
+        return buffer_append(out, text, n);
+    case DYN_COL_UINT:
+        if (len > 8) {
+            return FALLBACK;
+        }
+        n = snprintf(text, sizeof(text), "%llu", (unsigned long long)read_le(p, len));
+        return buffer_append(out, text, n);
+    case DYN_COL_DOUBLE:
+        if (len != sizeof(double)) {
+            return FALLBACK;
+        }
+        memcpy(&dvalue, p, sizeof(double));
+        if (Py_IS_NAN(dvalue) || Py_IS_INFINITY(dvalue)) {
+            return FALLBACK;
+        }
+        /* Like printf's %g, as COLUMN_JSON uses, but independent of locale */
+        repr = PyOS_double_to_string(dvalue, 'g', 6, 0, NULL);
+        if (repr == NULL) {
+            return ERROR;
+        }
+        status = buffer_append(out, repr, strlen(repr));
+        PyMem_Free(repr);
+        return status;
+    case DYN_COL_STRING:
+        if (len < 1) {
+            return FALLBACK;
+        }
+        if (p[0] == 0x21 || p[0] == 0x2D) {
+            status = check_utf8(p + 1, len - 1);
+            if (status != OK) {
+                return status;
+            }
+        } else if (p[0] != 0x3F) {
+            /* Other charsets are decoded by the Python implementation */
+            return FALLBACK;
+        }
+        return json_append_string(out, p + 1, len - 1);
+    case DYN_COL_DATETIME:
+        if (len != 6 && len != 9) {
+            return FALLBACK;
+        }
+        if (buffer_append(out, "\"", 1) != OK ||
+            json_append_date(out, read_le(p, 3)) != OK ||
+            buffer_append(out, " ", 1) != OK) {
+            return ERROR;
+        }
+        if (len == 9) {
+            val = read_le(p + 3, 6);
+            status = json_append_time(out, val >> 20, (unsigned long)(val & 0xFFFFF));
+        } else {
+            status = json_append_time(out, read_le(p + 3, 3), 0);
+        }
+        if (status != OK) {
+            return status;
+        }
+        return buffer_append(out, "\"", 1);
+    case DYN_COL_DATE:
+        if (len != 3) {
+            return FALLBACK;
+        }
+        if (buffer_append(out, "\"", 1) != OK ||
+            json_append_date(out, read_le(p, 3)) != OK) {
+            return ERROR;
+        }
+        return buffer_append(out, "\"", 1);
+    case DYN_COL_TIME:
+        if (buffer_append(out, "\"", 1) != OK) {
+            return ERROR;
+        }
+        if (len == 6) {
+            val = read_le(p, 6);
+            status = json_append_time(out, val >> 20, (unsigned long)(val & 0xFFFFF));
+        } else if (len == 3) {
+            status = json_append_time(out, read_le(p, 3), 0);
+        } else {
+            return FALLBACK;
+        }
+        if (status != OK) {
+            return status;
+        }
+        return buffer_append(out, "\"", 1);
+    case DYN_COL_DYNCOL:
+        if (Py_EnterRecursiveCall(" while converting nested dynamic columns")) {
+            return fallback_on_error();
+        }
+        status = json_blob(p, len, depth - 1, out);
+        Py_LeaveRecursiveCall();
+        return status;
+    default:
+        /* Including decimals, which are converted by the Python implementation */
+        return FALLBACK;
+    }
+}
+
+static int
+json_blob(const unsigned char *buf, Py_ssize_t len, Py_ssize_t depth, Buffer *out)
+{
+    Py_ssize_t column_count, len_names, coldata_size;
+    Py_ssize_t names_start, data_start, i;
+    int status;
+
+    if (depth < 1 || len < 5) {
+        return FALLBACK;
+    }
+    switch (buf[0] & 0x03) {
+    case 0:
+        coldata_size = 4;
+        break;
+    case 1:
+        coldata_size = 5;
+        break;
+    case 2:
+        coldata_size = 6;
+        break;
+    default:
+        return FALLBACK;
+    }
+    if ((buf[0] & 0xFC) != 4) {
+        return FALLBACK;
+    }
+    column_count = (Py_ssize_t)read_le(buf + 1, 2);
+    len_names = (Py_ssize_t)read_le(buf + 3, 2);
+    names_start = 5 + coldata_size * column_count;
+    data_start = names_start + len_names;
+    if (data_start > len) {
+        return FALLBACK;
+    }
+
+    if (buffer_append(out, "{", 1) != OK) {
+        return ERROR;
+    }
+    for (i = 0; i < column_count; i++) {
+        const unsigned char *entry = buf + 5 + coldata_size * i;
+        Py_ssize_t name_offset, name_end, data_offset, data_end;
+        uint64_t data_offset_dtype;
+
+        name_offset = (Py_ssize_t)read_le(entry, 2);
+        data_offset_dtype = read_le(entry + 2, coldata_size - 2);
+        data_offset = (Py_ssize_t)(data_offset_dtype >> 4);
+        if (i + 1 < column_count) {
+            name_end = (Py_ssize_t)read_le(entry + coldata_size, 2);
+            data_end = (Py_ssize_t)(read_le(entry + coldata_size + 2,
+                                            coldata_size - 2) >> 4);
+        } else {
+            name_end = len_names;
+            data_end = len - data_start;
+        }
+        if (name_offset > name_end || name_end > len_names ||
+            data_offset > data_end || data_end > len - data_start) {
+            return FALLBACK;
+        }
+
+        if (i > 0 && buffer_append(out, ",", 1) != OK) {
+            return ERROR;
+        }
+        status = check_utf8(buf + names_start + name_offset, name_end - name_offset);
+        if (status != OK) {
+            return status;
+        }
+        if (json_append_string(out, buf + names_start + name_offset,
+                               name_end - name_offset) != OK ||
+            buffer_append(out, ":", 1) != OK) {
+            return ERROR;
+        }
+        status = json_value((int)(data_offset_dtype & 0xF),
+                            buf + data_start + data_offset, data_end - data_offset,
+                            depth, out);
+        if (status != OK) {
+            return status;
+        }
+    }
+    return buffer_append(out, "}", 1);
+}
+
+static PyObject *
+speedups_to_json(PyObject *module, PyObject *args, PyObject *kwargs)
+{
+    static char *kwlist[] = {"buf", "max_depth", NULL};
+    PyObject *buf, *result;
+    Py_ssize_t max_depth = default_max_depth;
+    Buffer out = {NULL, 0, 0};
+    int status = FALLBACK;
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwargs, "O|$n:to_json", kwlist, &buf,
+                                     &max_depth)) {
+        return NULL;
+    }
+    if (PyBytes_CheckExact(buf)) {
+        status = json_blob((const unsigned char *)PyBytes_AS_STRING(buf),
+                           PyBytes_GET_SIZE(buf), max_depth, &out);
+    }
+    if (status == ERROR) {
+        buffer_free(&out);
+        return NULL;
+    }
+    if (status == FALLBACK) {
+        buffer_free(&out);
+        return PyObject_Call(py_to_json, args, kwargs);
+    }
+    result = PyBytes_FromStringAndSize((const char *)out.data, out.len);
+    buffer_free(&out);
+    return result;
+}
+
+static PyObject *
+speedups_set_stats_hook(PyObject *module, PyObject *hook)
+{
+    PyObject *old_hook = stats_hook;
+
+    if (hook == Py_None) {
+        stats_hook = NULL;
+    } else {
+        Py_INCREF(hook);
+        stats_hook = hook;
+    }
+    Py_XDECREF(old_hook);
+    Py_RETURN_NONE;
+}
+
+/* Module */
+
+static PyMethodDef speedups_methods[] = {
+    {"pack", (PyCFunction)(void (*)(void))speedups_pack,
+     METH_VARARGS | METH_KEYWORDS,
+     "Convert a mapping into the MariaDB dynamic columns format"},
+    {"unpack", (PyCFunction)(void (*)(void))speedups_unpack,
+     METH_VARARGS | METH_KEYWORDS,
+     "Convert MariaDB dynamic columns data in a byte string into a dict"},
+    {"pack_into", (PyCFunction)(void (*)(void))speedups_pack_into,
+     METH_VARARGS | METH_KEYWORDS,
+     "Convert a mapping into the MariaDB dynamic columns format, writing it into "
+     "a writable buffer at the given offset"},
+    {"packed_size", (PyCFunction)(void (*)(void))speedups_packed_size,
+     METH_VARARGS | METH_KEYWORDS,
+     "Return the size of a mapping in the MariaDB dynamic columns format"},
+    {"pack_many", (PyCFunction)(void (*)(void))speedups_pack_many,
+     METH_VARARGS | METH_KEYWORDS,
+     "Convert many mappings into the MariaDB dynamic columns format"},
+    {"unpack_many", (PyCFunction)(void (*)(void))speedups_unpack_many,
+     METH_VARARGS | METH_KEYWORDS,
+     "Convert many byte strings of MariaDB dynamic columns data into dicts"},
+    {"add", (PyCFunction)(void (*)(void))speedups_add,
+     METH_VARARGS | METH_KEYWORDS,
+     "Add or replace columns in MariaDB dynamic columns data, like COLUMN_ADD"},
+    {"delete", (PyCFunction)(void (*)(void))speedups_delete,
+     METH_VARARGS | METH_KEYWORDS,
+     "Remove columns from MariaDB dynamic columns data, like COLUMN_DELETE"},
+    {"to_json", (PyCFunction)(void (*)(void))speedups_to_json,
+     METH_VARARGS | METH_KEYWORDS,
+     "Convert MariaDB dynamic columns data into JSON, like COLUMN_JSON"},
+    {"_schema_pack", speedups_schema_pack, METH_VARARGS,
+     "Pack a mapping with the given keys, written as the columns at the given "
+     "positions, as Schema.pack()"},
+    {"_schema_unpack", speedups_schema_unpack, METH_VARARGS,
+     "Unpack data with the given keys and column names, as Schema.unpack()"},
+    {"_set_stats_hook", speedups_set_stats_hook, METH_O,
+     "Set the function passed each pack and unpack while collecting "
+     "statistics, or None"},
+    {NULL, NULL, 0, NULL},
+};
+
+static struct PyModuleDef speedups_module = {
+    PyModuleDef_HEAD_INIT, "mariadb_dyncol._speedups", NULL, -1, speedups_methods,
+};
+
+PyMODINIT_FUNC
+PyInit__speedups(void)
+{
+    PyObject *base, *time, *max_depth;
+
+    PyDateTime_IMPORT;
+    if (PyDateTimeAPI == NULL) {
+        return NULL;
+    }
+
+    base = PyImport_ImportModule("mariadb_dyncol.base");
+    if (base == NULL) {
+        return NULL;
+    }
+    py_pack = PyObject_GetAttrString(base, "pack");
+    py_unpack = PyObject_GetAttrString(base, "unpack");
+    py_pack_into = PyObject_GetAttrString(base, "pack_into");
+    py_packed_size = PyObject_GetAttrString(base, "packed_size");
+    py_pack_many = PyObject_GetAttrString(base, "pack_many");
+    py_unpack_many = PyObject_GetAttrString(base, "unpack_many");
+    py_add = PyObject_GetAttrString(base, "add");
+    py_delete = PyObject_GetAttrString(base, "delete");
+    py_to_json = PyObject_GetAttrString(base, "to_json");
+    max_depth = PyObject_GetAttrString(base, "MAX_DEPTH");
+    Py_DECREF(base);
+    if (py_pack == NULL || py_unpack == NULL || py_pack_into == NULL ||
+        py_packed_size == NULL || py_pack_many == NULL ||
+        py_unpack_many == NULL || py_add == NULL || py_delete == NULL ||
+        py_to_json == NULL || max_depth == NULL) {
+        Py_XDECREF(max_depth);
+        return NULL;
+    }
+    default_max_depth = PyLong_AsSsize_t(max_depth);
+    Py_DECREF(max_depth);
+    if (default_max_depth == -1 && PyErr_Occurred()) {
+        return NULL;
+    }
+
+    time = PyImport_ImportModule("time");
+    if (time == NULL) {
+        return NULL;
+    }
+    perf_counter = PyObject_GetAttrString(time, "perf_counter");
+    Py_DECREF(time);
+    if (perf_counter == NULL) {
+        return NULL;
+    }
+
+    return PyModule_Create(&speedups_module);
+}
@@ -0,0 +1,25 @@
+from __future__ import annotations
+
+from typing import Any
+from typing import Callable
+from typing import Iterable
+from typing import Mapping
+
+def pack(dicty: Mapping[str, Any], *, max_depth: int = ...) -> bytes: ...
+def unpack(buf: bytes, *, max_depth: int = ...) -> dict[str, Any]: ...
+def pack_into(
+    buffer: bytearray | memoryview, offset: int, dicty: Mapping[str, Any]
+) -> int: ...
+def packed_size(dicty: Mapping[str, Any]) -> int: ...
+def pack_many(dicties: Iterable[Mapping[str, Any]]) -> list[bytes]: ...
+def unpack_many(bufs: Iterable[bytes]) -> list[dict[str, Any]]: ...
+def add(buf: bytes, updates: Mapping[str, Any]) -> bytes: ...
+def delete(buf: bytes, names: Iterable[str]) -> bytes: ...
+def to_json(buf: bytes, *, max_depth: int = ...) -> bytes: ...
+def _schema_pack(
+    dicty: Mapping[str, Any], keys: tuple[str, ...], positions: tuple[int, ...]
+) -> bytes: ...
+def _schema_unpack(
+    buf: bytes, keys: tuple[str, ...], names: bytes
+) -> dict[str, Any]: ...
+def _set_stats_hook(hook: Callable[[str, bytes, float], None] | None) -> None: ...
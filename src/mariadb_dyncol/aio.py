@@ -0,0 +1,88 @@
+from __future__ import annotations
+
+from concurrent.futures import Executor
+from typing import Any
+from typing import AsyncIterator
+from typing import Collection
+from typing import Iterable
+from typing import Mapping
+
+import mariadb_dyncol
+from ._batching import chunked
+
+
+async def aunpack_many(
+    bufs: Iterable[bytes],
+    batch_size: int = 100,
+    offload_size: int | None = None,
+    executor: Executor | None = None,
+) -> list[dict[str, Any]]:
+    """
+    Convert many byte strings of MariaDB dynamic columns data into dicts,
+    yielding to the event loop between batches
+    """
+    if batch_size < 1:
+        raise ValueError("batch_size must be at least 1")
+
+    result: list[dict[str, Any]] = []
+    for batch in chunked(bufs, batch_size):
+        result.extend(await _unpack_batch(batch, offload_size, executor))
+    return result
+
+
+async def aunpack_rows(
+    cursor: Any,
+    columns: Collection[int | str],
+    batch_size: int = 100,
+    offload_size: int | None = None,
+    executor: Executor | None = None,
+) -> AsyncIterator[Any]:
+    """
+    Iterate over the rows of an async DB-API cursor, such as aiomysql's, with
+    the given columns unpacked, fetching and unpacking them in batches and
+    yielding to the event loop between batches
+    """
+    if batch_size < 1:
+        raise ValueError("batch_size must be at least 1")
+
+    while True:
+        rows = await cursor.fetchmany(batch_size)
+        if not rows:
+            return
+
+        # Unpack the whole batch before yielding any rows, so the event loop is
+        # yielded to once per batch
+        bufs = [
+            row[column] for row in rows for column in columns if row[column] is not None
+        ]
+        unpacked = iter(await _unpack_batch(bufs, offload_size, executor))
+
+        for row in rows:
+            new_row: Any = dict(row) if isinstance(row, Mapping) else list(row)
+            for column in columns:
+                if new_row[column] is not None:
+                    new_row[column] = next(unpacked)
+            yield new_row if isinstance(row, Mapping) else tuple(new_row)
+
+
+async def _unpack_batch(
+    bufs: list[bytes], offload_size: int | None, executor: Executor | None
+) -> list[dict[str, Any]]:
+    # Imported here as it's slow to import and only needed by async code
+    import asyncio
+
+    if offload_size is None:
+        result = [mariadb_dyncol.unpack(buf) for buf in bufs]
+    else:
+        loop = asyncio.get_running_loop()
+        result = []
+        for buf in bufs:
+            if len(buf) >= offload_size:
+                result.append(
+                    await loop.run_in_executor(executor, mariadb_dyncol.unpack, buf)
+                )
+            else:
+                result.append(mariadb_dyncol.unpack(buf))
+    # Let other tasks run before the next batch
+    await asyncio.sleep(0)
+    return result
@@ -1,22 +1,30 @@
 from __future__ import annotations
 
+import re
+import sys
+from codecs import charmap_decode
 from datetime import date
 from datetime import datetime
 from datetime import time
+from decimal import Context
 from decimal import Decimal
+from functools import lru_cache
+from functools import partial
+from json import JSONDecodeError
+from json import loads as json_loads
 from math import isinf
 from math import isnan
 from struct import pack as struct_pack
+from struct import Struct
 from struct import unpack as struct_unpack
-from struct import unpack_from as struct_unpack_from
+from time import perf_counter
+from types import ModuleType
 from typing import Any
 from typing import Callable
-from typing import TYPE_CHECKING
-
-if TYPE_CHECKING:  # pragma: no cover
-    from typing import NoReturn
-else:
-    NoReturn = None
+from typing import Iterable
+from typing import Iterator
+from typing import Mapping
+from typing import Sequence
 
 DYN_COL_INT = 0
 DYN_COL_UINT = 1
@@ -31,6 +39,14 @@ DYN_COL_DYNCOL = 8
 MAX_TOTAL_NAME_LENGTH = 65535
 MAX_NAME_LENGTH = MAX_TOTAL_NAME_LENGTH // 4
 
+# Default limit on the levels of nested mappings, to guard against hostile data
+MAX_DEPTH = 64
+
+# When statistics are being collected, see stats.py, this is called with the
+# operation, the packed data, and the time taken in seconds after each pack and
+# unpack
+stats_hook: Callable[[str, bytes, float], None] | None = None
+
 
 class DynColLimitError(Exception):
     """
@@ -56,39 +72,185 @@ class DynColNotSupported(Exception):
     """
 
 
-def pack(dicty: dict[str, Any]) -> bytes:
+def pack(dicty: Mapping[str, Any], *, max_depth: int = MAX_DEPTH) -> bytes:
+    """
+    Convert a mapping into the MariaDB dynamic columns format, with at most
+    max_depth levels of nested mappings
+    """
+    return pack_with(dicty, None, max_depth, DEFAULT_CODEC)
+
+
+def pack_many(dicties: Iterable[Mapping[str, Any]]) -> list[bytes]:
+    """
+    Convert many mappings into the MariaDB dynamic columns format, reusing
+    work between consecutive mappings with the same keys
+    """
+    result = []
+    last_keys: tuple[str, ...] | None = None
+    names: list[tuple[bytes, str]] = []
+    for dicty in dicties:
+        if type(dicty) is not dict:
+            # Copied in one pass over its items, so that its keys can be
+            # looked up without calling back into the mapping
+            dicty = dict(dicty.items())
+        keys = tuple(dicty)
+        if keys != last_keys:
+            names = sorted_names(keys)
+            last_keys = keys
+        result.append(pack_with(dicty, names, MAX_DEPTH, DEFAULT_CODEC))
+    return result
+
+
+def sorted_names(keys: Iterable[str]) -> list[tuple[bytes, str]]:
+    """
+    Encode the given keys, and sort them in the order they are stored
+    """
+    names = [(encode_name(key), key) for key in keys]
+    names.sort(key=lambda name: (len(name[0]), name[0]))
+    return names
+
+
+def sorted_items(dicty: Mapping[str, Any]) -> list[tuple[bytes, str, Any]]:
+    """
+    Encode the keys of a mapping, and sort its items in the order they are
+    stored, iterating over it once
+    """
+    items = [(encode_name(key), key, value) for key, value in dicty.items()]
+    items.sort(key=lambda item: (len(item[0]), item[0]))
+    return items
+
+
+def pack_with(
+    dicty: Mapping[str, Any],
+    names: list[tuple[bytes, str]] | None,
+    max_depth: int,
+    codec: Codec,
+) -> bytes:
+    """
+    Convert a mapping into the MariaDB dynamic columns format with the given
+    codec, using its keys encoded and sorted by sorted_names() if given, and
+    pass the result to stats_hook if it's set
+    """
+    hook = stats_hook
+    started = perf_counter() if hook is not None else 0.0
+    if names is None:
+        items = sorted_items(dicty)
+    else:
+        items = [(encname, key, dicty[key]) for encname, key in names]
+    chunks, _ = sorted_chunks(items, max_depth, codec)
+    buf = b"".join(chunks)
+    if hook is not None:
+        hook("pack", buf, perf_counter() - started)
+    return buf
+
+
+def pack_nested(dicty: Mapping[str, Any], codec: Codec) -> bytes:
+    """
+    Convert a mapping nested in a value being encoded into the MariaDB dynamic
+    columns format, without passing it to stats_hook as a call of its own
+    """
+    chunks, _ = sorted_chunks(sorted_items(dicty), MAX_DEPTH, codec)
+    return b"".join(chunks)
+
+
+def packed_size(dicty: Mapping[str, Any]) -> int:
+    """
+    Return the size of a mapping in the MariaDB dynamic columns format
+    """
+    _, size = sorted_chunks(sorted_items(dicty))
+    return size
+
+
+def pack_into(
+    buffer: bytearray | memoryview, offset: int, dicty: Mapping[str, Any]
+) -> int:
     """
-    Convert a mapping into the MariaDB dynamic columns format
+    Convert a mapping into the MariaDB dynamic columns format, writing it into
+    a writable buffer at the given offset. Returns the number of bytes written.
+    """
+    chunks, size = sorted_chunks(sorted_items(dicty))
+    view = memoryview(buffer).cast("B")
+    if offset < 0 or offset + size > len(view):
+        raise ValueError(
+            f"Buffer of size {len(view)} too small to pack {size} bytes at offset "
+            + f"{offset}"
+        )
+    for chunk in chunks:
+        end = offset + len(chunk)
+        view[offset:end] = chunk
+        offset = end
+    return size
+
+
+def sorted_chunks(
+    items: list[tuple[bytes, str, Any]],
+    max_depth: int = MAX_DEPTH,
+    codec: Codec | None = None,
+) -> tuple[list[bytes | memoryview], int]:
     """
-    column_count = 0
+    Convert the (encoded name, key, value) items of a mapping, sorted by
+    sorted_items(), into the MariaDB dynamic columns format as a list of byte
+    strings to concatenate, along with their total size. Nested mappings are
+    included as their own chunks rather than being packed separately.
+    """
+    if max_depth < 1:
+        raise DynColLimitError("Mappings nested too deeply")
+    if codec is None:
+        codec = DEFAULT_CODEC
     column_directory = []
-    directory_offset = 0
+    enc_names = []
+    data: list[bytes | memoryview] = []
     name_offset = 0
-    names = []
     data_offset = 0
-    data = []
-    total_encname_length = 0
+    encoders = codec._encoders
 
-    dicty_names_encoded = {key.encode("utf-8"): value for key, value in dicty.items()}
-
-    for encname in sorted(dicty_names_encoded.keys(), key=name_order):
-        value = dicty_names_encoded[encname]
+    for encname, key, value in items:
         if value is None:
             continue
 
         if len(encname) > MAX_NAME_LENGTH:
-            raise DynColLimitError("Key too long: " + encname.decode("utf-8"))
-        total_encname_length += len(encname)
-        if total_encname_length > MAX_TOTAL_NAME_LENGTH:
+            raise DynColLimitError("Key too long: " + key)
+        if name_offset + len(encname) > MAX_TOTAL_NAME_LENGTH:
             raise DynColLimitError("Total length of keys too long")
 
         try:
-            encode_func = ENCODE_FUNCS[type(value)]
+            encode_func = encoders[type(value)]
         except KeyError:
-            raise DynColTypeError(f"Unencodable type {type(value)}")
-        dtype, encvalue = encode_func(value)
+            encode_func = codec.encoder(type(value))
+        if encode_func is encode_dict:
+            dtype = DYN_COL_DYNCOL
+            chunks, size = sorted_chunks(sorted_items(value), max_depth - 1, codec)
+            data.extend(chunks)
+        else:
+            dtype, encvalue = encode_func(value)
+            size = len(encvalue)
+            data.append(encvalue)
 
-        column_count += 1
+        column_directory.append(name_offset)
+        column_directory.append((data_offset << 4) + dtype)
+        enc_names.append(encname)
+        name_offset += len(encname)
+        data_offset += size
+
+    header = column_header(column_directory, name_offset, data_offset)
+    chunks = [header]
+    chunks.extend(enc_names)
+    chunks.extend(data)
+    return chunks, len(header) + name_offset + data_offset
+
+
+def pack_columns(columns: Sequence[tuple[bytes, int, bytes | memoryview]]) -> bytes:
+    """
+    Build MariaDB dynamic columns data from (encoded name, type, encoded
+    value) triples, already sorted by name_order and validated
+    """
+    column_directory = []
+    name_offset = 0
+    names = []
+    data_offset = 0
+    data: list[bytes | memoryview] = []
+
+    for encname, dtype, encvalue in columns:
         column_directory.append(name_offset)
         column_directory.append((data_offset << 4) + dtype)
         names.append(encname)
@@ -96,42 +258,139 @@ def pack(dicty: dict[str, Any]) -> bytes:
         data.append(encvalue)
         data_offset += len(encvalue)
 
-        directory_offset += 2
+    return join_columns(column_directory, b"".join(names), data)
 
-    data_size_flag, coldir_size_code, odd_sized_datacode = data_size(data)
 
-    flags = 4 | data_size_flag  # means this contains named dynamic columns
-    enc_names = b"".join(names)
-
-    buf = [struct_pack("<BHH", flags, column_count, len(enc_names))]
-    if not odd_sized_datacode:
-        buf.append(
-            struct_pack(
-                "<" + ("H" + coldir_size_code) * (len(column_directory) // 2),
-                *column_directory,
-            )
-        )
-    else:
-        for i, val in enumerate(column_directory):
-            if i % 2 == 0:
-                # name_offset
-                buf.append(struct_pack("<H", val))
-            else:
-                # data_offset + dtype, have to cut last byte
-                value = struct_pack("<" + coldir_size_code, val)
-                buf.append(value[:-1])
-    buf.append(enc_names)
+def join_columns(
+    column_directory: list[int], enc_names: bytes, data: list[bytes | memoryview]
+) -> bytes:
+    """
+    Build MariaDB dynamic columns data from a column directory of alternating
+    name offsets and data offset + types, the encoded names, and the encoded
+    values
+    """
+    header = column_header(column_directory, len(enc_names), sum(len(d) for d in data))
+    buf: list[bytes | memoryview] = [header, enc_names]
     buf.extend(data)
     return b"".join(buf)
 
 
+def column_header(
+    column_directory: list[int], names_size: int, data_size: int
+) -> bytes:
+    """
+    Build the header and column directory of MariaDB dynamic columns data
+    """
+    column_count = len(column_directory) // 2
+    data_size_flag, _, _ = data_size_flags(data_size)
+    coldata_size = COLDATA_SIZES[data_size_flag]
+
+    flags = 4 | data_size_flag  # means this contains named dynamic columns
+
+    if coldata_size == 5:
+        # Can't pack the 3 byte data offset + dtype, so split into 2 + 1
+        column_directory = [
+            part
+            for name_offset, val in zip(column_directory[0::2], column_directory[1::2])
+            for part in (name_offset, val & 0xFFFF, val >> 16)
+        ]
+
+    return HEADER_STRUCT.pack(flags, column_count, names_size) + coldir_struct(
+        column_count, coldata_size
+    ).pack(*column_directory)
+
+
+def add(buf: bytes | bytearray | memoryview, updates: Mapping[str, Any]) -> bytes:
+    """
+    Add or replace columns in MariaDB dynamic columns data, like COLUMN_ADD.
+    Columns not in updates are copied across without being decoded. Updating
+    a column to None deletes it.
+    """
+    merged: dict[bytes, tuple[int, bytes | memoryview]] = {
+        encname: (dtype, encvalue) for encname, dtype, encvalue in columns(buf)
+    }
+
+    for key, value in updates.items():
+        encname = encode_name(key)
+        if value is None:
+            merged.pop(encname, None)
+            continue
+        if len(encname) > MAX_NAME_LENGTH:
+            raise DynColLimitError("Key too long: " + key)
+        merged[encname] = encode(value)
+
+    if sum(len(encname) for encname in merged) > MAX_TOTAL_NAME_LENGTH:
+        raise DynColLimitError("Total length of keys too long")
+
+    return pack_columns(
+        [
+            (encname, *merged[encname])
+            for encname in sorted(merged.keys(), key=name_order)
+        ]
+    )
+
+
+def delete(buf: bytes | bytearray | memoryview, names: Iterable[str]) -> bytes:
+    """
+    Remove columns from MariaDB dynamic columns data, like COLUMN_DELETE.
+    Remaining columns are copied across without being decoded.
+    """
+    encnames = {encode_name(name) for name in names}
+    return pack_columns(
+        [column for column in columns(buf) if column[0] not in encnames]
+    )
+
+
+# Column names are cached in both directions, since the same names tend to
+# appear in many mappings. Only the pure Python implementation uses the caches,
+# so decoded names are only shared between dicts it unpacks.
+NAME_CACHE_SIZE = 4096
+# Longer names are rare enough as keys that caching them isn't worth the memory
+NAME_CACHE_MAX_LENGTH = 64
+encoded_names: dict[str, bytes] = {}
+decoded_names: dict[bytes, str] = {}
+
+
+def encode_name(name: str) -> bytes:
+    if len(name) > NAME_CACHE_MAX_LENGTH:
+        return name.encode("utf-8")
+    try:
+        return encoded_names[name]
+    except KeyError:
+        pass
+    encname = name.encode("utf-8")
+    # Names of non-ASCII characters may still be too long to cache
+    if len(encname) <= NAME_CACHE_MAX_LENGTH:
+        if len(encoded_names) >= NAME_CACHE_SIZE:
+            # Evict the oldest entry
+            encoded_names.pop(next(iter(encoded_names)), None)
+        encoded_names[name] = encname
+    return encname
+
+
+def decode_name(encname: bytes | bytearray | memoryview) -> str:
+    if len(encname) > NAME_CACHE_MAX_LENGTH:
+        return str(encname, "utf-8")
+    # Slices of bytearrays and writable memoryviews aren't hashable
+    encname = bytes(encname)
+    try:
+        return decoded_names[encname]
+    except KeyError:
+        pass
+    name = sys.intern(encname.decode("utf-8"))
+    if len(decoded_names) >= NAME_CACHE_SIZE:
+        # Evict the oldest entry
+        decoded_names.pop(next(iter(decoded_names)), None)
+    decoded_names[encname] = name
+    return name
+
+
 def name_order(name: bytes) -> tuple[int, bytes]:
     # Keys are ordered by name length then name
     return len(name), name
 
 
-def data_size(data: list[bytes]) -> tuple[int, str, bool]:
-    data_len = sum(len(d) for d in data)
+def data_size_flags(data_len: int) -> tuple[int, str, bool]:
     if data_len < 0xFFF:
         return 0, "H", False
     elif data_len < 0xFFFFF:
@@ -158,11 +417,7 @@ def encode_int(value: int) -> tuple[int, bytes]:
         else:
             raise DynColValueError(f"int {value} out of range")
 
-    to_enc = []
-    while encvalue:
-        to_enc.append(encvalue & 0xFF)
-        encvalue = encvalue >> 8
-    return dtype, struct_pack("B" * len(to_enc), *to_enc)
+    return dtype, encvalue.to_bytes((encvalue.bit_length() + 7) // 8, "little")
 
 
 def encode_float(value: float) -> tuple[int, bytes]:
@@ -181,43 +436,106 @@ def encode_string(value: str) -> tuple[int, bytes]:
     return DYN_COL_STRING, b"\x2D" + value.encode("utf-8")
 
 
-def encode_decimal(value: Decimal) -> NoReturn:
-    raise DynColNotSupported("Can't encode Decimal values currently")
-
+def encode_bytes(value: bytes) -> tuple[int, bytes]:
+    # Stored with the MySQL charset binary
+    return DYN_COL_STRING, b"\x3F" + value
 
-# def encode_decimal(value):
-#     buf = bytearray()
-#     intg = int(value)
-#     intg_digits = 9
-#     buf.extend(struct_pack('>I', intg))
 
-#     frac = value - intg
-#     if frac:
-#         frac_digits = 1
-#         frac_piece = int(str(frac)[2:])  # ugh
-#         buf.extend(struct_pack('B', frac_piece))
-#     else:
-#         frac_digits = 0
+def encode_decimal(value: Decimal) -> tuple[int, bytes]:
+    if not value.is_finite():
+        raise DynColValueError(f"Decimal value not encodeable: {value}")
+    if not value:
+        # Zero is stored as an empty string, whatever its precision
+        return DYN_COL_DECIMAL, b""
 
-#     header = struct_pack('>BB', intg_digits, frac_digits)
-#     buf[0] |= 0x80  # Flip the top bit
-#     return DYN_COL_DECIMAL, header + bytes(buf)
+    sign, digits, exponent = value.as_tuple()
+    assert isinstance(exponent, int)  # since finite
+    if exponent < 0:
+        frac = -exponent
+        coefficient = int(value.scaleb(frac, DECIMAL_CONTEXT))
+    else:
+        frac = 0
+        coefficient = int(value)
+    intg_digits = max(len(digits) + exponent, 0)
+    if frac > MAX_DECIMAL_SCALE or intg_digits + frac > MAX_DECIMAL_PRECISION:
+        raise DynColValueError(f"Decimal value out of range: {value}")
+    # MariaDB stores the integer part in whole 9 digit words, as it does when
+    # converting from integers.
+    intg = min(-(-intg_digits // 9) * 9, MAX_DECIMAL_PRECISION - frac)
+
+    pieces, size = decimal_layout(intg, frac)
+    coefficient = abs(coefficient)
+    val = 0
+    shift = 0
+    for bits, _, limit in reversed(pieces):
+        coefficient, piece = divmod(coefficient, limit)
+        val |= piece << shift
+        shift += bits
+    if sign:
+        val ^= (1 << shift) - 1
+    val ^= 1 << (shift - 1)
+    return DYN_COL_DECIMAL, bytes((intg, frac)) + val.to_bytes(size, "big")
+
+
+MAX_DECIMAL_PRECISION = 65
+MAX_DECIMAL_SCALE = 38
+DECIMAL_CONTEXT = Context(prec=MAX_DECIMAL_PRECISION)
+
+# Bytes used to store a word of N < 9 decimal digits
+DECIMAL_DIGITS_SIZES = (0, 1, 1, 2, 2, 3, 3, 4, 4, 4)
+
+
+@lru_cache(maxsize=256)
+def decimal_layout(
+    intg: int, frac: int
+) -> tuple[tuple[tuple[int, int, int], ...], int]:
+    """
+    Return the words of MariaDB's binary format for a decimal with intg integer
+    digits and frac fractional digits, as (bits, mask, 10 ** digits) tuples,
+    along with their total size in bytes. The integer part has its leading
+    partial word first, and the fractional part its trailing partial word last.
+    """
+    words = []
+    if intg % 9:
+        words.append(intg % 9)
+    words.extend([9] * (intg // 9 + frac // 9))
+    if frac % 9:
+        words.append(frac % 9)
+
+    pieces = []
+    size = 0
+    for digits in words:
+        bits = DECIMAL_DIGITS_SIZES[digits] * 8
+        pieces.append((bits, (1 << bits) - 1, 10**digits))
+        size += DECIMAL_DIGITS_SIZES[digits]
+    return tuple(pieces), size
 
 
 def encode_datetime(value: datetime) -> tuple[int, bytes]:
-    _, enc_date = encode_date(value)
-    _, enc_time = encode_time(value)
-    return DYN_COL_DATETIME, enc_date + enc_time
+    time_val, time_size = time_value(value)
+    val = date_value(value) | time_val << 24
+    return DYN_COL_DATETIME, val.to_bytes(3 + time_size, "little")
 
 
 def encode_date(value: date) -> tuple[int, bytes]:
+    return DYN_COL_DATE, date_value(value).to_bytes(3, "little")
+
+
+def encode_time(value: datetime | time) -> tuple[int, bytes]:
+    val, size = time_value(value)
+    return DYN_COL_TIME, val.to_bytes(size, "little")
+
+
+def date_value(value: date) -> int:
     # We don't need any validation since datetime.date is more limited than the
     # MySQL format
-    val = value.day | value.month << 5 | value.year << 9
-    return DYN_COL_DATE, struct_pack("I", val)[:-1]
+    return value.day | value.month << 5 | value.year << 9
 
 
-def encode_time(value: datetime | time) -> tuple[int, bytes]:
+def time_value(value: datetime | time) -> tuple[int, int]:
+    """
+    Return the packed value of a time, and its size in bytes
+    """
     if value.microsecond > 0:
         val = (
             value.microsecond
@@ -225,14 +543,13 @@ def encode_time(value: datetime | time) -> tuple[int, bytes]:
             | value.minute << 26
             | value.hour << 32
         )
-        return DYN_COL_TIME, struct_pack("Q", val)[:6]
+        return val, 6
     else:
-        val = value.second | value.minute << 6 | value.hour << 12
-        return DYN_COL_TIME, struct_pack("I", val)[:3]
+        return value.second | value.minute << 6 | value.hour << 12, 3
 
 
-def encode_dict(value: dict[str, Any]) -> tuple[int, bytes]:
-    return DYN_COL_DYNCOL, pack(value)
+def encode_dict(value: Mapping[str, Any]) -> tuple[int, bytes]:
+    return DYN_COL_DYNCOL, pack_nested(value, DEFAULT_CODEC)
 
 
 ENCODE_FUNCS: dict[type[Any], Callable[[Any], tuple[int, bytes]]] = {
@@ -242,80 +559,686 @@ ENCODE_FUNCS: dict[type[Any], Callable[[Any], tuple[int, bytes]]] = {
     time: encode_time,
     float: encode_float,
     str: encode_string,
+    bytes: encode_bytes,
     Decimal: encode_decimal,
     dict: encode_dict,
 }
 
 
-def unpack(buf: bytes) -> dict[str, Any]:
+def encode(value: Any) -> tuple[int, bytes]:
+    return DEFAULT_CODEC.encode(value)
+
+
+def unpack(buf: bytes, *, max_depth: int = MAX_DEPTH) -> dict[str, Any]:
+    """
+    Convert MariaDB dynamic columns data in a byte string into a dict, with at
+    most max_depth levels of nested dynamic columns
+    """
+    return unpack_with(buf, max_depth, DECODE_FUNCS)
+
+
+def unpack_with(
+    buf: bytes, max_depth: int, decode_funcs: dict[int, Callable[[bytes], Any]]
+) -> dict[str, Any]:
+    hook = stats_hook
+    started = perf_counter() if hook is not None else 0.0
+    result: dict[str, Any] = {}
+    # Nested dynamic columns are decoded in a loop rather than recursively,
+    # and as ranges of buf rather than copies of their data
+    pending = [(result, 0, len(buf), max_depth)]
+
+    while pending:
+        target, start, end, depth = pending.pop()
+        if depth < 1:
+            raise DynColLimitError("Dynamic columns nested too deeply")
+        if end - start < 5:
+            raise DynColValueError("Truncated dynamic columns data")
+
+        flags: int
+        column_count: int
+        len_names: int
+        flags, column_count, len_names = HEADER_STRUCT.unpack_from(buf, start)
+        _, coldata_size, _ = decode_data_size(flags)
+        if (flags & 0xFC) != 4:
+            raise DynColValueError("Unknown dynamic columns format")
+
+        if column_count == 0:
+            continue
+
+        names_start = start + (1 + 2 + 2) + coldata_size * column_count
+        data_start = names_start + len_names
+        if data_start > end:
+            raise DynColValueError("Truncated dynamic columns data")
+
+        name_offsets, data_offsets_dtypes = read_column_directory(
+            buf, column_count, coldata_size, start
+        )
+        name_offsets.append(len_names)
+        data_offsets_dtypes.append((end - data_start) << 4)
+
+        for i in range(column_count):
+            name_start = names_start + name_offsets[i]
+            name_end = names_start + name_offsets[i + 1]
+            name = decode_name(buf[name_start:name_end])
+
+            data_offset_dtype = data_offsets_dtypes[i]
+            dtype = data_offset_dtype & 0xF
+            value_start = data_start + (data_offset_dtype >> 4)
+            value_end = data_start + (data_offsets_dtypes[i + 1] >> 4)
+            if dtype == DYN_COL_DYNCOL:
+                nested: dict[str, Any] = {}
+                target[name] = nested
+                pending.append((nested, value_start, value_end, depth - 1))
+                continue
+            try:
+                decode_func = decode_funcs[dtype]
+            except KeyError:
+                raise ValueError()
+            target[name] = decode_func(buf[value_start:value_end])
+
+    if hook is not None:
+        hook("unpack", buf, perf_counter() - started)
+    return result
+
+
+def read_column_directory(
+    buf: bytes | memoryview, column_count: int, coldata_size: int, start: int = 0
+) -> tuple[list[int], list[int]]:
+    """
+    Read the name offsets and data offset + types from the column directory of
+    the dynamic columns data at the given start of buf
+    """
+    directory = coldir_struct(column_count, coldata_size).unpack_from(
+        buf, start + 1 + 2 + 2
+    )
+    if coldata_size == 5:
+        # 3 byte data offset + dtype, read as 2 + 1 bytes
+        name_offsets = list(directory[0::3])
+        data_offsets_dtypes = [
+            low | high << 16 for low, high in zip(directory[1::3], directory[2::3])
+        ]
+    else:
+        name_offsets = list(directory[0::2])
+        data_offsets_dtypes = list(directory[1::2])
+    return name_offsets, data_offsets_dtypes
+
+
+def unpack_many(bufs: Iterable[bytes]) -> list[dict[str, Any]]:
     """
-    Convert MariaDB dynamic columns data in a byte string into a dict
+    Convert many byte strings of MariaDB dynamic columns data into dicts
     """
+    return [unpack(buf) for buf in bufs]
+
+
+def check(buf: bytes | bytearray | memoryview, *, max_depth: int = MAX_DEPTH) -> bool:
+    """
+    Return whether MariaDB dynamic columns data is well formed, like
+    COLUMN_CHECK, without decoding it
+    """
+    try:
+        validate(buf, max_depth=max_depth)
+    except (DynColValueError, DynColLimitError):
+        return False
+    return True
+
+
+def validate(
+    buf: bytes | bytearray | memoryview, *, max_depth: int = MAX_DEPTH
+) -> None:
+    """
+    Check that MariaDB dynamic columns data is well formed without decoding
+    it, raising DynColValueError for the first problem found, or
+    DynColLimitError if nested more than max_depth levels deep
+    """
+    if not isinstance(buf, bytes):
+        buf = bytes(buf)
+    # Nested dynamic columns are checked in a loop, as in unpack()
+    pending = [(0, len(buf), max_depth)]
+
+    while pending:
+        start, end, depth = pending.pop()
+        if depth < 1:
+            raise DynColLimitError("Dynamic columns nested too deeply")
+        if end - start < 5:
+            raise DynColValueError("Truncated dynamic columns data")
+
+        flags: int
+        column_count: int
+        len_names: int
+        flags, column_count, len_names = HEADER_STRUCT.unpack_from(buf, start)
+        if (flags & 0xFC) != 4 or (flags & 0x03) == 3:
+            raise DynColValueError("Unknown dynamic columns format")
+        coldata_size = COLDATA_SIZES[flags & 0x03]
+
+        names_start = start + (1 + 2 + 2) + coldata_size * column_count
+        data_start = names_start + len_names
+        if data_start > end:
+            raise DynColValueError("Truncated dynamic columns data")
+
+        name_offsets, data_offsets_dtypes = read_column_directory(
+            buf, column_count, coldata_size, start
+        )
+        name_offsets.append(len_names)
+        data_offsets_dtypes.append((end - data_start) << 4)
+        if name_offsets[0] != 0:
+            raise DynColValueError("Invalid column name offset")
+        if data_offsets_dtypes[0] >> 4 != 0:
+            raise DynColValueError("Invalid column data offset")
+
+        last_name = b""
+        for i in range(column_count):
+            name_start = names_start + name_offsets[i]
+            name_end = names_start + name_offsets[i + 1]
+            if not name_start <= name_end <= data_start:
+                raise DynColValueError("Invalid column name offset")
+            name = buf[name_start:name_end]
+            if i > 0 and name_order(name) <= name_order(last_name):
+                raise DynColValueError("Column names out of order")
+            try:
+                name.decode("utf-8")
+            except UnicodeDecodeError:
+                raise DynColValueError("Invalid column name")
+            last_name = name
+
+            data_offset_dtype = data_offsets_dtypes[i]
+            dtype = data_offset_dtype & 0xF
+            value_start = data_start + (data_offset_dtype >> 4)
+            value_end = data_start + (data_offsets_dtypes[i + 1] >> 4)
+            if not value_start <= value_end <= end:
+                raise DynColValueError("Invalid column data offset")
+            if dtype == DYN_COL_DYNCOL:
+                pending.append((value_start, value_end, depth - 1))
+            elif not valid_value(dtype, buf, value_start, value_end):
+                raise DynColValueError(f"Invalid value for column type {dtype}")
+
+
+def valid_value(dtype: int, buf: bytes, start: int, end: int) -> bool:
+    """
+    Return whether the size of an encoded value is valid for its type
+    """
+    size = end - start
+    if dtype in (DYN_COL_INT, DYN_COL_UINT):
+        return size <= 8
+    elif dtype == DYN_COL_DOUBLE:
+        return size == 8
+    elif dtype == DYN_COL_STRING:
+        # Must start with a complete charset number
+        return any(not byte & 0x80 for byte in buf[start : min(end, start + 4)])
+    elif dtype == DYN_COL_DECIMAL:
+        if size == 0:
+            return True
+        if size < 2 or buf[start] + buf[start + 1] > MAX_DECIMAL_PRECISION:
+            return False
+        _, decimal_size = decimal_layout(buf[start], buf[start + 1])
+        return decimal_size > 0 and size == 2 + decimal_size
+    elif dtype == DYN_COL_DATETIME:
+        return size in (6, 9)
+    elif dtype == DYN_COL_DATE:
+        return size == 3
+    elif dtype == DYN_COL_TIME:
+        return size in (3, 6)
+    else:
+        return False
+
+
+def to_json(buf: bytes, *, max_depth: int = MAX_DEPTH) -> bytes:
+    """
+    Convert MariaDB dynamic columns data into JSON, like COLUMN_JSON, without
+    building a dict
+    """
+    if max_depth < 1:
+        raise DynColLimitError("Dynamic columns nested too deeply")
+    chunks = [b"{"]
+    append = chunks.append
+    # Nested dynamic columns are written in a loop rather than recursively, by
+    # keeping each level's columns and the index of the next one to write
+    pending = [(json_columns(buf, 0, len(buf)), 0)]
+
+    while pending:
+        columns, first = pending.pop()
+        for i in range(first, len(columns)):
+            name, dtype, value_start, value_end = columns[i]
+            if i:
+                append(b",")
+            append(json_name(name))
+            if dtype == DYN_COL_DYNCOL:
+                if len(pending) + 1 >= max_depth:
+                    raise DynColLimitError("Dynamic columns nested too deeply")
+                append(b"{")
+                pending.append((columns, i + 1))
+                pending.append((json_columns(buf, value_start, value_end), 0))
+                break
+            try:
+                format_func = JSON_FORMAT_FUNCS[dtype]
+            except KeyError:
+                raise DynColValueError("Unknown dynamic columns type")
+            append(format_func(buf[value_start:value_end]))
+        else:
+            append(b"}")
+
+    return b"".join(chunks)
+
+
+def json_name(encname: bytes | bytearray | memoryview) -> bytes:
+    """
+    Return a column name as a JSON object key, followed by a colon
+    """
+    encname = bytes(encname)
+    if len(encname) > NAME_CACHE_MAX_LENGTH:
+        return json_key(encname)
+    try:
+        return json_names[encname]
+    except KeyError:
+        pass
+    key = json_key(encname)
+    if len(json_names) >= NAME_CACHE_SIZE:
+        # Evict the oldest entry
+        json_names.pop(next(iter(json_names)), None)
+    json_names[encname] = key
+    return key
+
+
+def json_key(encname: bytes) -> bytes:
+    try:
+        encname.decode("utf-8")
+    except UnicodeDecodeError:
+        raise DynColValueError("Invalid column name")
+    return b'"%s":' % json_escape(encname)
+
+
+json_names: dict[bytes, bytes] = {}
+
+
+def json_columns(buf: bytes, start: int, end: int) -> list[tuple[bytes, int, int, int]]:
+    """
+    Read the (encoded name, type, value start, value end) of each column of the
+    dynamic columns data between start and end in buf
+    """
+    if end - start < 5:
+        raise DynColValueError("Truncated dynamic columns data")
     flags: int
     column_count: int
     len_names: int
-    flags, column_count, len_names = struct_unpack_from("<BHH", buf)
-    data_offset_code, coldata_size, data_offset_mask = decode_data_size(flags)
+    flags, column_count, len_names = HEADER_STRUCT.unpack_from(buf, start)
+    _, coldata_size, _ = decode_data_size(flags)
     if (flags & 0xFC) != 4:
         raise DynColValueError("Unknown dynamic columns format")
 
-    if column_count == 0:
-        return {}
+    names_start = start + (1 + 2 + 2) + coldata_size * column_count
+    data_start = names_start + len_names
+    if data_start > end:
+        raise DynColValueError("Truncated dynamic columns data")
+
+    name_offsets, data_offsets_dtypes = read_column_directory(
+        buf, column_count, coldata_size, start
+    )
+    name_offsets.append(len_names)
+    data_offsets_dtypes.append((end - data_start) << 4)
+    columns = []
+    for i in range(column_count):
+        name_start = names_start + name_offsets[i]
+        name_end = names_start + name_offsets[i + 1]
+        if not name_start <= name_end <= data_start:
+            raise DynColValueError("Invalid column name offset")
+        value_start = data_start + (data_offsets_dtypes[i] >> 4)
+        value_end = data_start + (data_offsets_dtypes[i + 1] >> 4)
+        if not value_start <= value_end <= end:
+            raise DynColValueError("Invalid column data offset")
+        columns.append(
+            (
+                buf[name_start:name_end],
+                data_offsets_dtypes[i] & 0xF,
+                value_start,
+                value_end,
+            )
+        )
+    return columns
 
-    column_directory_end = (1 + 2 + 2) + coldata_size * column_count
-    names_end = column_directory_end + len_names
 
-    column_directory = buf[1 + 2 + 2 : column_directory_end]
-    enc_names = buf[column_directory_end:names_end]
-    data = buf[names_end:]
+def from_json(json: str | bytes, *, max_depth: int = MAX_DEPTH) -> bytes:
+    """
+    Convert a JSON object into the MariaDB dynamic columns format
+    """
+    try:
+        dicty = json_loads(json)
+    except (JSONDecodeError, UnicodeDecodeError) as exc:
+        raise DynColValueError(f"Invalid JSON: {exc}")
+    if type(dicty) is not dict:
+        raise DynColValueError("JSON must be an object")
+    # Packed with the C extension where it's built, as pack() is
+    speedups = load_speedups()
+    if speedups is not None:
+        return speedups.pack(dicty, max_depth=max_depth)  # type: ignore[no-any-return]
+    return pack(dicty, max_depth=max_depth)
+
+
+class DynColView(Mapping[str, Any]):
+    """
+    A read-only mapping over MariaDB dynamic columns data, backed by the
+    original buffer, which decodes only the values that are accessed
+    """
 
-    names = {}
-    values = {}
+    __slots__ = (
+        "_buf",
+        "_column_count",
+        "_coldata_size",
+        "_coldir_struct",
+        "_names_start",
+        "_names_end",
+    )
+
+    def __init__(self, buf: bytes | bytearray | memoryview) -> None:
+        view = memoryview(buf)
+        if len(view) < 5:
+            raise DynColValueError("Truncated dynamic columns data")
+        flags: int
+        column_count: int
+        len_names: int
+        flags, column_count, len_names = HEADER_STRUCT.unpack_from(view)
+        if (flags & 0xFC) != 4 or (flags & 0x03) == 3:
+            raise DynColValueError("Unknown dynamic columns format")
+        coldata_size = COLDATA_SIZES[flags & 0x03]
+
+        self._buf = view
+        self._column_count = column_count
+        self._coldata_size = coldata_size
+        self._coldir_struct = coldir_struct(1, coldata_size)
+        self._names_start = (1 + 2 + 2) + coldata_size * column_count
+        self._names_end = self._names_start + len_names
+        # The column directory and names are read lazily, so check they're
+        # present up front
+        if self._names_end > len(view):
+            raise DynColValueError("Truncated dynamic columns data")
+
+    def __len__(self) -> int:
+        return self._column_count
+
+    def __iter__(self) -> Iterator[str]:
+        for i in range(self._column_count):
+            start, end = self._name_bounds(i)
+            yield decode_name(self._buf[start:end].tobytes())
+
+    def __contains__(self, key: object) -> bool:
+        return isinstance(key, str) and self._find(key) is not None
+
+    def __getitem__(self, key: str) -> Any:
+        i = self._find(key) if isinstance(key, str) else None
+        if i is None:
+            raise KeyError(key)
+        return self._value(i)
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({dict(self)!r})"
+
+    def _columns(self) -> Iterator[tuple[bytes, int, memoryview]]:
+        """
+        Yield the encoded name, type, and encoded value of each column
+        """
+        buf = self._buf
+        names_start = self._names_start
+        data_start = self._names_end
+        # The whole column directory is read at once
+        name_offsets, data_offsets_dtypes = read_column_directory(
+            buf, self._column_count, self._coldata_size
+        )
+        name_offsets.append(data_start - names_start)
+        data_offsets_dtypes.append((len(buf) - data_start) << 4)
+        for i in range(self._column_count):
+            name_start = names_start + name_offsets[i]
+            name_end = names_start + name_offsets[i + 1]
+            value_start = data_start + (data_offsets_dtypes[i] >> 4)
+            value_end = data_start + (data_offsets_dtypes[i + 1] >> 4)
+            yield (
+                buf[name_start:name_end].tobytes(),
+                data_offsets_dtypes[i] & 0xF,
+                buf[value_start:value_end],
+            )
 
-    last_name_offset: int | None = None
-    last_data_offset: int | None = None
-    last_dtype: int | None = None
-    name_offset: int
-    data_offset_dtype: int
+    def _entry(self, i: int) -> tuple[int, int, int]:
+        """
+        Read the name offset, data offset, and type of column i
+        """
+        offset = (1 + 2 + 2) + i * self._coldata_size
+        name_offset: int
+        name_offset, *rest = self._coldir_struct.unpack_from(self._buf, offset)
+        if len(rest) == 2:
+            # 3 byte data offset + dtype, read as 2 + 1 bytes
+            data_offset_dtype = rest[0] | rest[1] << 16
+        else:
+            data_offset_dtype = rest[0]
+        return name_offset, data_offset_dtype >> 4, data_offset_dtype & 0xF
 
-    for i in range(column_count):
-        if coldata_size % 2 == 0:
-            name_offset, data_offset_dtype = struct_unpack_from(
-                "<H" + data_offset_code, column_directory, offset=i * coldata_size
-            )
+    def _name_bounds(self, i: int) -> tuple[int, int]:
+        name_offset = self._entry(i)[0]
+        if i + 1 < self._column_count:
+            name_end = self._entry(i + 1)[0]
         else:
-            (name_offset,) = struct_unpack_from(
-                "<H", column_directory, offset=i * coldata_size
-            )
-            # can't struct_unpack the 3 bytes so hack around
-            dodt_bytes = (
-                column_directory[i * coldata_size + 2 : (i * coldata_size + 5)]
-                + b"\x00"
-            )
-            (data_offset_dtype,) = struct_unpack("<" + data_offset_code, dodt_bytes)
+            name_end = self._names_end - self._names_start
+        return self._names_start + name_offset, self._names_start + name_end
+
+    def _find(self, key: str) -> int | None:
+        """
+        Binary search the column directory for the given name, using the
+        same ordering that pack() stores names in
+        """
+        encname = key.encode("utf-8")
+        target = name_order(encname)
+        lo = 0
+        hi = self._column_count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start, end = self._name_bounds(mid)
+            if end - start == len(encname):
+                current = name_order(self._buf[start:end].tobytes())
+            else:
+                # Only the length is needed to order names of different lengths
+                current = (end - start, b"")
+            if current == target:
+                return mid
+            elif current < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        return None
+
+    def _encvalue(self, i: int) -> tuple[int, memoryview]:
+        """
+        Return the type and encoded value of column i
+        """
+        _, data_offset, dtype = self._entry(i)
+        data_start = self._names_end + data_offset
+        if i + 1 < self._column_count:
+            data_end = self._names_end + self._entry(i + 1)[1]
+        else:
+            data_end = len(self._buf)
+        return dtype, self._buf[data_start:data_end]
+
+    def _value(self, i: int) -> Any:
+        dtype, encvalue = self._encvalue(i)
+        if dtype == DYN_COL_DYNCOL:
+            return DynColView(encvalue)
+        return decode(dtype, encvalue.tobytes())
+
+
+def columns(
+    buf: bytes | bytearray | memoryview,
+) -> Iterator[tuple[bytes, int, memoryview]]:
+    """
+    Iterate over the encoded name, type, and encoded value of each column in
+    MariaDB dynamic columns data, without decoding anything
+    """
+    return DynColView(buf)._columns()
 
-        data_offset_dtype &= data_offset_mask
-        data_offset = data_offset_dtype >> 4
-        dtype = data_offset_dtype & 0xF
 
-        # Store *last* column's name
-        if last_name_offset is not None:
-            names[i - 1] = enc_names[last_name_offset:name_offset].decode("utf-8")
-        last_name_offset = name_offset
+def get(buf: bytes | bytearray | memoryview, name: str, default: Any = None) -> Any:
+    """
+    Decode a single column from MariaDB dynamic columns data, like COLUMN_GET
+    """
+    view = DynColView(buf)
+    i = view._find(name)
+    if i is None:
+        return default
+    return view._value(i)
 
-        #
-        if last_data_offset is not None:
-            assert last_dtype is not None
-            values[i - 1] = decode(last_dtype, data[last_data_offset:data_offset])
-        last_data_offset = data_offset
-        last_dtype = dtype
 
-    names[column_count - 1] = enc_names[last_name_offset:].decode("utf-8")
-    assert last_dtype is not None
-    values[column_count - 1] = decode(last_dtype, data[last_data_offset:])
+def get_many(
+    buf: bytes | bytearray | memoryview, names: Iterable[str]
+) -> dict[str, Any]:
+    """
+    Decode the given columns from MariaDB dynamic columns data into a dict,
+    omitting any that are not present
+    """
+    view = DynColView(buf)
+    result = {}
+    for name in names:
+        i = view._find(name)
+        if i is not None:
+            result[name] = view._value(i)
+    return result
 
-    # join data and names
-    return {names[i]: values[i] for i in range(column_count)}
+
+class Schema:
+    """
+    A specialised packer and unpacker for mappings with a fixed set of keys
+    and value types
+    """
+
+    def __init__(self, types: dict[str, type[Any]]) -> None:
+        self.types = dict(types)
+        self._columns = []
+        self._name_offsets = []
+        names = []
+        name_offset = 0
+
+        for encname, key in sorted_names(types):
+            if len(encname) > MAX_NAME_LENGTH:
+                raise DynColLimitError("Key too long: " + key)
+            encode_func = DEFAULT_CODEC.encoder(types[key])
+            self._columns.append((key, types[key], encode_func))
+            self._name_offsets.append(name_offset)
+            names.append(encname)
+            name_offset += len(encname)
+
+        if name_offset > MAX_TOTAL_NAME_LENGTH:
+            raise DynColLimitError("Total length of keys too long")
+        self._enc_names = b"".join(names)
+        # For the C extension's versions of pack() and unpack(), which are used
+        # where it's built: the keys in column order, and the keys in the order
+        # they were given, which mappings usually have them in too, with their
+        # columns' positions
+        self._keys = tuple(key for key, _, _ in self._columns)
+        self._given_keys = tuple(self.types)
+        self._positions = tuple(self._keys.index(key) for key in self._given_keys)
+        self._speedups = load_speedups()
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.types!r})"
+
+    def pack(self, dicty: Mapping[str, Any]) -> bytes:
+        """
+        Convert a mapping into the MariaDB dynamic columns format. Mappings
+        that don't match the schema are packed with pack().
+        """
+        if self._speedups is not None:
+            return self._speedups._schema_pack(  # type: ignore[no-any-return]
+                dicty, self._given_keys, self._positions
+            )
+        if len(dicty) != len(self._columns):
+            return pack(dicty)
+
+        hook = stats_hook
+        started = perf_counter() if hook is not None else 0.0
+        column_directory = []
+        data_offset = 0
+        data: list[bytes | memoryview] = []
+        for (key, type_, encode_func), name_offset in zip(
+            self._columns, self._name_offsets
+        ):
+            value = dicty.get(key)
+            if type(value) is not type_:
+                return pack(dicty)
+            dtype, encvalue = encode_func(value)
+            column_directory.append(name_offset)
+            column_directory.append((data_offset << 4) + dtype)
+            data.append(encvalue)
+            data_offset += len(encvalue)
+
+        buf = join_columns(column_directory, self._enc_names, data)
+        if hook is not None:
+            hook("pack", buf, perf_counter() - started)
+        return buf
+
+    def unpack(self, buf: bytes) -> dict[str, Any]:
+        """
+        Convert MariaDB dynamic columns data in a byte string into a dict.
+        Data that doesn't match the schema is unpacked with unpack().
+        """
+        if self._speedups is not None:
+            return self._speedups._schema_unpack(  # type: ignore[no-any-return]
+                buf, self._keys, self._enc_names
+            )
+        if len(buf) < HEADER_STRUCT.size:
+            return unpack(buf)
+        flags: int
+        column_count: int
+        len_names: int
+        flags, column_count, len_names = HEADER_STRUCT.unpack_from(buf)
+        if (
+            (flags & 0xFC) != 4
+            or (flags & 0x03) == 3
+            or column_count != len(self._columns)
+            or len_names != len(self._enc_names)
+            or column_count == 0
+        ):
+            return unpack(buf)
+
+        coldata_size = COLDATA_SIZES[flags & 0x03]
+        names_start = (1 + 2 + 2) + coldata_size * column_count
+        data_start = names_start + len_names
+        if buf[names_start:data_start] != self._enc_names:
+            return unpack(buf)
+
+        name_offsets, data_offsets_dtypes = read_column_directory(
+            buf, column_count, coldata_size
+        )
+        if name_offsets != self._name_offsets:
+            return unpack(buf)
+        data_offsets_dtypes.append((len(buf) - data_start) << 4)
+
+        hook = stats_hook
+        started = perf_counter() if hook is not None else 0.0
+        decode_funcs = DECODE_FUNCS
+        result = {}
+        for i, (key, _, _) in enumerate(self._columns):
+            data_offset_dtype = data_offsets_dtypes[i]
+            value_start = data_start + (data_offset_dtype >> 4)
+            value_end = data_start + (data_offsets_dtypes[i + 1] >> 4)
+            dtype = data_offset_dtype & 0xF
+            if (
+                dtype not in decode_funcs
+                or dtype == DYN_COL_DYNCOL
+                or not value_start <= value_end <= len(buf)
+            ):
+                # Nested or invalid data
+                return unpack(buf)
+            result[key] = decode_funcs[dtype](buf[value_start:value_end])
+
+        if hook is not None:
+            hook("unpack", buf, perf_counter() - started)
+        return result
+
+
+@lru_cache(maxsize=None)
+def load_speedups() -> ModuleType | None:
+    """
+    Return the C extension module, or None if it isn't built. It's imported
+    lazily as it imports this module.
+    """
+    try:
+        from mariadb_dyncol import _speedups
+    except ImportError:  # pragma: no cover
+        return None
+    return _speedups
 
 
 def decode_data_size(flags: int) -> tuple[str, int, int]:
@@ -330,6 +1253,21 @@ def decode_data_size(flags: int) -> tuple[str, int, int]:
         raise ValueError("Unknown dynamic columns format")
 
 
+HEADER_STRUCT = Struct("<BHH")
+
+# struct formats for one column directory entry, by its size in bytes. A 3
+# byte data offset + dtype is split into 2 + 1 bytes.
+COLDIR_FORMATS = {4: "HH", 5: "HHB", 6: "HL"}
+
+# column directory entry size, by data size flag
+COLDATA_SIZES = {0: 4, 1: 5, 2: 6}
+
+
+@lru_cache(maxsize=256)
+def coldir_struct(column_count: int, coldata_size: int) -> Struct:
+    return Struct("<" + COLDIR_FORMATS[coldata_size] * column_count)
+
+
 def decode(dtype: int, encvalue: bytes) -> Any:
     try:
         decode_func = DECODE_FUNCS[dtype]
@@ -338,20 +1276,19 @@ def decode(dtype: int, encvalue: bytes) -> Any:
     return decode_func(encvalue)
 
 
-def decode_int(encvalue: bytes) -> int:
-    value = 0
-    for i, b in enumerate(bytearray(encvalue)):
-        value += b << (8 * i)
+def decode_int(encvalue: bytes | memoryview) -> int:
+    value = int.from_bytes(encvalue, "little")
     if value & 1:
         return -(value >> 1) - 1
     else:
         return value >> 1
 
 
-def decode_uint(encvalue: bytes) -> int:
-    value: int
-    (value,) = struct_unpack("Q", encvalue)
-    return value
+def decode_uint(encvalue: bytes | memoryview) -> int:
+    # Stored in as few bytes as needed, like DYN_COL_INT
+    if len(encvalue) > 8:
+        raise DynColValueError("Invalid uint value")
+    return int.from_bytes(encvalue, "little")
 
 
 def decode_double(encvalue: bytes) -> float:
@@ -360,43 +1297,182 @@ def decode_double(encvalue: bytes) -> float:
     return value
 
 
-def decode_string(encvalue: bytes) -> str:
-    if not encvalue.startswith((b"\x21", b"\x2D")):
+def decode_string(encvalue: bytes) -> str | bytes:
+    if encvalue.startswith((b"\x21", b"\x2D")):
+        # Fast path for the MySQL charsets utf8 and utf8mb4
+        return encvalue[1:].decode("utf-8")
+    charset, start = decode_var_uint(encvalue)
+    try:
+        decode_func = STRING_DECODE_FUNCS[charset]
+    except KeyError:
         raise DynColNotSupported(
-            "Can only decode strings with MySQL charsets utf8 or utf8mb4"
+            f"Can't decode strings with MySQL charset number {charset}"
         )
-    return encvalue[1:].decode("utf-8")
+    return decode_func(encvalue[start:])
 
 
-def decode_decimal(encvalue: bytes) -> NoReturn:
-    raise DynColNotSupported("Can't decode Decimal values currently")
+def decode_var_uint(encvalue: bytes) -> tuple[int, int]:
+    """
+    Decode a variable length unsigned integer, 7 bits per byte with the top
+    bit set on all but the last byte, returning it and the number of bytes
+    """
+    value = 0
+    for i, byte in enumerate(encvalue):
+        value |= (byte & 0x7F) << (7 * i)
+        if not byte & 0x80:
+            return value, i + 1
+    raise DynColValueError("Invalid string value")
+
+
+# MySQL's latin1 is Windows-1252, with the five bytes that leaves undefined
+# decoded to the same code points as ISO-8859-1
+LATIN1_DECODING_TABLE = "".join(
+    bytes([i]).decode("cp1252", errors="ignore") or chr(i) for i in range(256)
+)
+
+
+def decode_latin1(encvalue: bytes) -> str:
+    return charmap_decode(encvalue, "strict", LATIN1_DECODING_TABLE)[0]
+
+
+# MySQL charset numbers of each collation, by Python codec
+CHARSET_CODECS: dict[str, Iterable[int]] = {
+    "ascii": (11, 65),
+    "big5": (1, 84),
+    "cp1250": (26, 34, 44, 66, 99),
+    "cp1251": (14, 23, 50, 51, 52),
+    "cp1256": (57, 67),
+    "cp1257": (29, 58, 59),
+    "cp850": (4, 80),
+    "cp852": (40, 81),
+    "cp866": (36, 68),
+    "cp932": (95, 96),
+    "euc_jp": (12, 91),
+    "euc_kr": (19, 85),
+    "gb2312": (24, 86),
+    "gbk": (28, 87),
+    "iso8859_13": (20, 41, 42, 79),
+    "iso8859_2": (2, 9, 21, 27, 77),
+    "iso8859_7": (25, 70),
+    "iso8859_8": (16, 71),
+    "iso8859_9": (30, 78),
+    "koi8_r": (7, 74),
+    "koi8_u": (22, 75),
+    "mac_latin2": (38, 43),
+    "mac_roman": (39, 53),
+    "shift_jis": (13, 88),
+    "tis_620": (18, 89),
+    "utf_16_be": (35, 54, 55, 90, *range(101, 125), *range(128, 152), 159),
+    "utf_16_le": (56, 62),
+    "utf_32_be": (60, 61, *range(160, 184)),
+    "utf_8": (33, 45, 46, 83, *range(192, 216), 223, *range(224, 248)),
+}
 
 
-# def decode_decimal(encvalue):
-#     num_intg, num_frac = struct_unpack('>BB', encvalue[:2])
-#     intg, = struct_unpack('>I', encvalue[2:6])
-#     intg ^= 0x80000000
-#     if num_frac == 0:
-#         frac = 0
-#     else:
-#         frac, = struct_unpack('>B', encvalue[6:])
-#     return Decimal(str(intg) + '.' + str(frac))
+def string_decode_funcs() -> dict[int, Callable[[bytes], str | bytes]]:
+    def string_decoder(codec: str) -> Callable[[bytes], str]:
+        def decode_func(encvalue: bytes) -> str:
+            return encvalue.decode(codec)
+
+        return decode_func
+
+    funcs: dict[int, Callable[[bytes], str | bytes]] = {
+        charset: string_decoder(codec)
+        for codec, charsets in CHARSET_CODECS.items()
+        for charset in charsets
+    }
+    funcs.update(dict.fromkeys((5, 8, 15, 31, 47, 48, 49, 94), decode_latin1))
+    funcs[63] = bytes  # binary
+    # MariaDB numbers its NO PAD collations 1024 above the PAD SPACE ones
+    funcs.update({charset + 1024: func for charset, func in funcs.items()})
+    return funcs
+
+
+STRING_DECODE_FUNCS = string_decode_funcs()
+
+
+def decode_decimal(encvalue: bytes | memoryview) -> Decimal:
+    if not encvalue:
+        # Zero is stored as an empty string
+        return Decimal(0)
+    if len(encvalue) < 2:
+        raise DynColValueError("Invalid decimal value")
+
+    intg, frac = encvalue[0], encvalue[1]
+    if intg + frac > MAX_DECIMAL_PRECISION:
+        raise DynColValueError("Invalid decimal value")
+    pieces, size = decimal_layout(intg, frac)
+    if len(encvalue) != size + 2 or not size:
+        raise DynColValueError("Invalid decimal value")
+    val = int.from_bytes(encvalue[2:], "big")
+    sign_bit = 1 << (size * 8 - 1)
+    negative = not val & sign_bit
+    val ^= sign_bit
+    if negative:
+        val ^= (sign_bit << 1) - 1
+
+    coefficient = 0
+    multiplier = 1
+    for bits, mask, limit in reversed(pieces):
+        piece = val & mask
+        if piece >= limit:
+            raise DynColValueError("Invalid decimal value")
+        coefficient += piece * multiplier
+        multiplier *= limit
+        val >>= bits
+
+    if negative:
+        coefficient = -coefficient
+    if frac:
+        return Decimal(coefficient).scaleb(-frac, DECIMAL_CONTEXT)
+    return Decimal(coefficient)
+
+
+def decode_datetime(encvalue: bytes | memoryview) -> datetime:
+    if len(encvalue) not in (6, 9):
+        raise DynColValueError("Invalid datetime value")
+    val = int.from_bytes(encvalue, "little")
+    date_val = val & 0xFFFFFF
+    time_val = val >> 24
+    if len(encvalue) == 9:
+        return datetime(
+            day=date_val & 0x1F,
+            month=(date_val >> 5) & 0xF,
+            year=(date_val >> 9),
+            microsecond=time_val & 0xFFFFF,
+            second=(time_val >> 20) & 0x3F,
+            minute=(time_val >> 26) & 0x3F,
+            hour=(time_val >> 32),
+        )
+    else:  # must be 6
+        return datetime(
+            day=date_val & 0x1F,
+            month=(date_val >> 5) & 0xF,
+            year=(date_val >> 9),
+            microsecond=0,
+            second=time_val & 0x3F,
+            minute=(time_val >> 6) & 0x3F,
+            hour=(time_val >> 12),
+        )
 
 
-def decode_datetime(encvalue: bytes) -> datetime:
-    d = decode_date(encvalue[:3])
-    t = decode_time(encvalue[3:])
-    return datetime.combine(d, t)
+def decode_date(encvalue: bytes | memoryview) -> date:
+    if len(encvalue) != 3:
+        raise DynColValueError("Invalid date value")
+    return date_from_value(int.from_bytes(encvalue, "little"))
 
 
-def decode_date(encvalue: bytes) -> date:
-    (val,) = struct_unpack("I", encvalue + b"\x00")
+# dates are immutable, so recently seen ones can be shared
+@lru_cache(maxsize=1024)
+def date_from_value(val: int) -> date:
     return date(day=val & 0x1F, month=(val >> 5) & 0xF, year=(val >> 9))
 
 
-def decode_time(encvalue: bytes) -> time:
+def decode_time(encvalue: bytes | memoryview) -> time:
+    if len(encvalue) not in (3, 6):
+        raise DynColValueError("Invalid time value")
+    val = int.from_bytes(encvalue, "little")
     if len(encvalue) == 6:
-        (val,) = struct_unpack("Q", encvalue + b"\x00\x00")
         return time(
             microsecond=val & 0xFFFFF,
             second=(val >> 20) & 0x3F,
@@ -404,7 +1480,6 @@ def decode_time(encvalue: bytes) -> time:
             hour=(val >> 32),
         )
     else:  # must be 3
-        (val,) = struct_unpack("I", encvalue + b"\x00")
         return time(
             microsecond=0,
             second=(val) & 0x3F,
@@ -424,3 +1499,257 @@ DECODE_FUNCS: dict[int, Callable[[bytes], Any]] = {
     DYN_COL_TIME: decode_time,
     DYN_COL_DYNCOL: unpack,
 }
+
+
+# The Python types that values of each type are decoded to
+DECODED_TYPES: dict[type[Any], tuple[int, ...]] = {
+    int: (DYN_COL_INT, DYN_COL_UINT),
+    float: (DYN_COL_DOUBLE,),
+    str: (DYN_COL_STRING,),
+    bytes: (DYN_COL_STRING,),
+    Decimal: (DYN_COL_DECIMAL,),
+    datetime: (DYN_COL_DATETIME,),
+    date: (DYN_COL_DATE,),
+    time: (DYN_COL_TIME,),
+}
+
+
+class Codec:
+    """
+    The functions used to encode values by their type and decode them by
+    their dynamic columns type, which can be extended. Subclasses of
+    encodable types are encoded like their nearest base class, and the
+    encoding function found for each type is cached.
+    """
+
+    def __init__(self) -> None:
+        self._encode_funcs = dict(ENCODE_FUNCS)
+        # Encoding functions by exact type, filled in as types are seen
+        self._encoders = dict(self._encode_funcs)
+        self._decode_converters: dict[type[Any], Callable[[Any], Any]] = {}
+        self._decode_funcs = dict(DECODE_FUNCS)
+
+    def __repr__(self) -> str:
+        return f"<{type(self).__name__}>"
+
+    def register_encoder(self, type_: type[Any], func: Callable[[Any], Any]) -> None:
+        """
+        Encode values of the given type, and its subclasses, by converting them
+        with func to a value of another encodable type
+        """
+        self._encode_funcs[type_] = partial(self._encode_converted, func)
+        self._encoders = dict(self._encode_funcs)
+
+    def register_raw_encoder(
+        self, type_: type[Any], func: Callable[[Any], tuple[int, bytes]]
+    ) -> None:
+        """
+        Encode values of the given type, and its subclasses, with func, which
+        returns their dynamic columns type number and encoded bytes
+        """
+        self._encode_funcs[type_] = func
+        self._encoders = dict(self._encode_funcs)
+
+    def register_decoder(self, type_: type[Any], func: Callable[[Any], Any]) -> None:
+        """
+        Convert decoded values of the given type with func
+        """
+        if type_ not in DECODED_TYPES:
+            raise DynColTypeError(f"Undecodable type {type_}")
+        self._decode_converters[type_] = func
+        decode_funcs = dict(DECODE_FUNCS)
+        for decoded_type, convert_func in self._decode_converters.items():
+            for dtype in DECODED_TYPES[decoded_type]:
+                decode_funcs[dtype] = partial(
+                    convert_decoded, decode_funcs[dtype], decoded_type, convert_func
+                )
+        self._decode_funcs = decode_funcs
+
+    def encoder(self, type_: type[Any]) -> Callable[[Any], tuple[int, bytes]]:
+        """
+        Return the function that encodes values of the given type, found
+        through its method resolution order
+        """
+        try:
+            return self._encoders[type_]
+        except KeyError:
+            pass
+        for klass in type_.__mro__:
+            if klass in self._encode_funcs:
+                encode_func = self._encode_funcs[klass]
+                break
+        else:
+            if issubclass(type_, Mapping):
+                # Mappings are often only registered with the ABC, so not
+                # found through the method resolution order
+                encode_func = encode_dict
+            else:
+                raise DynColTypeError(f"Unencodable type {type_}")
+        self._encoders[type_] = encode_func
+        return encode_func
+
+    def encode(self, value: Any) -> tuple[int, bytes]:
+        encode_func = self.encoder(type(value))
+        if encode_func is encode_dict:
+            return DYN_COL_DYNCOL, pack_nested(value, self)
+        return encode_func(value)
+
+    def _encode_converted(
+        self, func: Callable[[Any], Any], value: Any
+    ) -> tuple[int, bytes]:
+        return self.encode(func(value))
+
+    def pack(self, dicty: Mapping[str, Any], *, max_depth: int = MAX_DEPTH) -> bytes:
+        """
+        Convert a mapping into the MariaDB dynamic columns format, as per
+        pack(), with this codec
+        """
+        return pack_with(dicty, None, max_depth, self)
+
+    def unpack(self, buf: bytes, *, max_depth: int = MAX_DEPTH) -> dict[str, Any]:
+        """
+        Convert MariaDB dynamic columns data in a byte string into a dict, as
+        per unpack(), with this codec
+        """
+        return unpack_with(buf, max_depth, self._decode_funcs)
+
+
+def convert_decoded(
+    decode_func: Callable[[bytes], Any],
+    type_: type[Any],
+    func: Callable[[Any], Any],
+    encvalue: bytes,
+) -> Any:
+    value = decode_func(encvalue)
+    if type(value) is type_:
+        return func(value)
+    return value
+
+
+DEFAULT_CODEC = Codec()
+
+
+def json_int(encvalue: bytes) -> bytes:
+    return b"%d" % decode_int(encvalue)
+
+
+def json_uint(encvalue: bytes) -> bytes:
+    return b"%d" % decode_uint(encvalue)
+
+
+def json_double(encvalue: bytes) -> bytes:
+    # COLUMN_JSON uses printf's %g, with 6 significant digits
+    return b"%g" % decode_double(encvalue)
+
+
+def json_string(encvalue: bytes) -> bytes:
+    if encvalue.startswith((b"\x21", b"\x2D")):
+        # UTF-8 data is copied once it's known to be valid
+        data = encvalue[1:]
+        try:
+            data.decode("utf-8")
+        except UnicodeDecodeError:
+            raise DynColValueError("Invalid UTF-8 string value")
+        return b'"%s"' % json_escape(data)
+    try:
+        value = decode_string(encvalue)
+    except UnicodeDecodeError:
+        raise DynColValueError("Invalid string value")
+    if isinstance(value, bytes):
+        # Binary strings are copied as they are, as in COLUMN_JSON
+        return b'"%s"' % json_escape(value)
+    return b'"%s"' % json_escape(value.encode("utf-8"))
+
+
+def json_escape(data: bytes) -> bytes:
+    """
+    Escape UTF-8 data for a JSON string as COLUMN_JSON does, with only
+    backslashes, double quotes, and control characters escaped, the latter
+    always as \\u00XX
+    """
+    if not JSON_ESCAPE_RE.search(data):
+        return data
+    return JSON_ESCAPE_RE.sub(json_escape_match, data)
+
+
+def json_escape_match(match: re.Match[bytes]) -> bytes:
+    return JSON_ESCAPES[match.group()]
+
+
+def json_decimal(encvalue: bytes) -> bytes:
+    return format(decode_decimal(encvalue), "f").encode("ascii")
+
+
+# Temporal values are formatted from their fields, so out of range times such
+# as "-838:59:59" are supported like in COLUMN_JSON
+
+
+def json_datetime(encvalue: bytes) -> bytes:
+    if len(encvalue) not in (6, 9):
+        raise DynColValueError("Invalid datetime value")
+    val = int.from_bytes(encvalue, "little")
+    if len(encvalue) == 9:
+        microsecond = (val >> 24) & 0xFFFFF
+        time_val = val >> 44
+    else:
+        microsecond = 0
+        time_val = val >> 24
+    return b'"%s %s"' % (
+        json_date_fields(val & 0xFFFFFF),
+        json_time_fields(time_val, microsecond),
+    )
+
+
+def json_date(encvalue: bytes) -> bytes:
+    if len(encvalue) != 3:
+        raise DynColValueError("Invalid date value")
+    return b'"%s"' % json_date_fields(int.from_bytes(encvalue, "little"))
+
+
+def json_time(encvalue: bytes) -> bytes:
+    if len(encvalue) not in (3, 6):
+        raise DynColValueError("Invalid time value")
+    val = int.from_bytes(encvalue, "little")
+    if len(encvalue) == 6:
+        text = json_time_fields(val >> 20, val & 0xFFFFF)
+    else:
+        text = json_time_fields(val, 0)
+    return b'"%s"' % text
+
+
+def json_date_fields(val: int) -> bytes:
+    return b"%04d-%02d-%02d" % (val >> 9, (val >> 5) & 0xF, val & 0x1F)
+
+
+def json_time_fields(val: int, microsecond: int) -> bytes:
+    """
+    Format the seconds, minutes, hours, and sign bit fields of a time, packed
+    6 + 6 + 10 + 1 bits, and the microseconds
+    """
+    text = b"%s%02d:%02d:%02d" % (
+        b"-" if val >> 22 & 1 else b"",
+        (val >> 12) & 0x3FF,
+        (val >> 6) & 0x3F,
+        val & 0x3F,
+    )
+    if microsecond:
+        text += b".%06d" % microsecond
+    return text
+
+
+# The bytes that COLUMN_JSON escapes, and their escapes
+JSON_ESCAPE_RE = re.compile(rb'[\x00-\x1f\\"]')
+JSON_ESCAPES = {bytes([i]): b"\\u%04X" % i for i in range(0x20)}
+JSON_ESCAPES[b'"'] = b'\\"'
+JSON_ESCAPES[b"\\"] = b"\\\\"
+
+JSON_FORMAT_FUNCS: dict[int, Callable[[bytes], bytes]] = {
+    DYN_COL_INT: json_int,
+    DYN_COL_UINT: json_uint,
+    DYN_COL_DOUBLE: json_double,
+    DYN_COL_STRING: json_string,
+    DYN_COL_DECIMAL: json_decimal,
+    DYN_COL_DATETIME: json_datetime,
+    DYN_COL_DATE: json_date,
+    DYN_COL_TIME: json_time,
+}
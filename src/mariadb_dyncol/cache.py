@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+from collections import OrderedDict
+from threading import Lock
+from types import MappingProxyType
+from typing import Any
+from typing import Mapping
+from typing import NamedTuple
+
+import mariadb_dyncol
+
+
+class CacheInfo(NamedTuple):
+    hits: int
+    misses: int
+    maxsize: int | None
+    max_bytes: int | None
+    currsize: int
+    currbytes: int
+
+
+class CachedUnpacker:
+    """
+    Unpack MariaDB dynamic columns data, caching the results for repeated
+    data in a least recently used cache. Results are read-only mappings, so
+    they can be shared between callers.
+    """
+
+    def __init__(self, maxsize: int | None = 1024, max_bytes: int | None = None):
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self._cache: OrderedDict[bytes, Mapping[str, Any]] = OrderedDict()
+        self._lock = Lock()
+        self._hits = 0
+        self._misses = 0
+        self._currbytes = 0
+
+    def __call__(self, buf: bytes | bytearray | memoryview) -> Mapping[str, Any]:
+        key = buf if isinstance(buf, bytes) else bytes(buf)
+        with self._lock:
+            try:
+                result = self._cache[key]
+            except KeyError:
+                self._misses += 1
+            else:
+                self._hits += 1
+                self._cache.move_to_end(key)
+                return result
+
+        result = freeze(mariadb_dyncol.unpack(key))
+
+        if self.max_bytes is not None and len(key) > self.max_bytes:
+            return result
+        with self._lock:
+            if key not in self._cache:
+                self._cache[key] = result
+                self._currbytes += len(key)
+                self._evict()
+        return result
+
+    def _evict(self) -> None:
+        while (self.maxsize is not None and len(self._cache) > self.maxsize) or (
+            self.max_bytes is not None and self._currbytes > self.max_bytes
+        ):
+            key, _ = self._cache.popitem(last=False)
+            self._currbytes -= len(key)
+
+    def cache_info(self) -> CacheInfo:
+        with self._lock:
+            return CacheInfo(
+                self._hits,
+                self._misses,
+                self.maxsize,
+                self.max_bytes,
+                len(self._cache),
+                self._currbytes,
+            )
+
+    def cache_clear(self) -> None:
+        with self._lock:
+            self._cache.clear()
+            self._hits = self._misses = self._currbytes = 0
+
+
+def freeze(dicty: dict[str, Any]) -> Mapping[str, Any]:
+    """
+    Make a read-only mapping from a dict, and any nested dicts
+    """
+    for key, value in dicty.items():
+        if isinstance(value, dict):
+            dicty[key] = freeze(value)
+    return MappingProxyType(dicty)
@@ -0,0 +1,223 @@
+from __future__ import annotations
+
+from calendar import monthrange
+from functools import partial
+from math import isfinite
+from typing import Any
+from typing import Callable
+from typing import Iterable
+from typing import TYPE_CHECKING
+
+from .base import decode_int
+from .base import decode_uint
+from .base import DYN_COL_DATE
+from .base import DYN_COL_DATETIME
+from .base import DYN_COL_DOUBLE
+from .base import DYN_COL_INT
+from .base import DYN_COL_UINT
+from .base import DynColTypeError
+from .base import DynColValueError
+from .base import DynColView
+
+if TYPE_CHECKING:  # pragma: no cover
+    import numpy as np
+
+
+def extract_column(
+    bufs: Iterable[bytes | bytearray | memoryview], name: str, dtype: Any = "float64"
+) -> tuple[np.ndarray[Any, Any], np.ndarray[Any, Any]]:
+    """
+    Extract one column from many byte strings of MariaDB dynamic columns data
+    into a NumPy array, plus a boolean array marking which contained it
+    """
+    import numpy as np
+
+    if not isinstance(bufs, (list, tuple)):
+        bufs = list(bufs)
+
+    dtype = np.dtype(dtype)
+    convert: Callable[[Any], Any] | None = None
+    if dtype.kind == "M":
+        unit, count = np.datetime_data(dtype)
+        if unit == "generic":
+            dtype = np.dtype("datetime64[us]")
+            unit = "us"
+        elif unit not in TEMPORAL_UNITS or count != 1:
+            raise DynColTypeError(f"Unsupported dtype {dtype}")
+        decoders = TEMPORAL_DECODERS
+        convert = partial(convert_temporal, dtype, TEMPORAL_UNITS[unit])
+    elif dtype.kind in "iu":
+        decoders = NUMERIC_DECODERS
+        info = np.iinfo(dtype)
+        convert = partial(convert_integer, dtype, int(info.min), int(info.max))
+    elif dtype.kind == "f":
+        decoders = NUMERIC_DECODERS
+        convert = partial(convert_float, dtype, float(np.finfo(dtype).max))
+    else:
+        raise DynColTypeError(f"Unsupported dtype {dtype}")
+
+    values = np.zeros(len(bufs), dtype=dtype)
+    mask = np.zeros(len(bufs), dtype=bool)
+    # Decode doubles by copying their bytes straight into the array
+    raw_doubles = values.view(np.uint8) if dtype == np.dtype("<f8") else None
+
+    for i, buf in enumerate(bufs):
+        view = DynColView(buf)
+        index = view._find(name)
+        if index is None:
+            continue
+        value_dtype, encvalue = view._encvalue(index)
+        if value_dtype == DYN_COL_DOUBLE and raw_doubles is not None:
+            if len(encvalue) != 8:
+                raise DynColValueError("Invalid double value")
+            raw_doubles[i * 8 : (i + 1) * 8] = encvalue
+        else:
+            try:
+                decoder = decoders[value_dtype]
+            except KeyError:
+                raise DynColTypeError(
+                    f"Can't store dynamic column type {value_dtype} as {dtype}"
+                )
+            value = decoder(encvalue)
+            values[i] = value if convert is None else convert(value)
+        mask[i] = True
+
+    return values, mask
+
+
+def convert_integer(dtype: Any, min_value: int, max_value: int, value: Any) -> int:
+    """
+    Check a decoded int or float can be stored in an integer dtype exactly
+    """
+    if isinstance(value, float):
+        if not value.is_integer():
+            raise DynColValueError(f"Can't store {value} as {dtype} without loss")
+        value = int(value)
+    if not min_value <= value <= max_value:
+        raise DynColValueError(f"{value} is out of range for {dtype}")
+    return int(value)
+
+
+def convert_float(dtype: Any, max_value: float, value: Any) -> float:
+    """
+    Check a decoded int or float can be stored in a float dtype exactly, given
+    its largest finite value
+    """
+    converted = float(value)
+    if not isfinite(converted):
+        # NaN and infinities are stored as they are
+        return converted
+    if (
+        (isinstance(value, int) and int(converted) != value)
+        or abs(converted) > max_value
+        or dtype.type(converted) != converted
+    ):
+        raise DynColValueError(f"Can't store {value} as {dtype} without loss")
+    return converted
+
+
+def convert_temporal(dtype: Any, scale: tuple[int, int], microseconds: int) -> int:
+    """
+    Convert microseconds since the Unix epoch into the unit of a datetime64
+    dtype, given as its units per microsecond and microseconds per unit
+    """
+    per_microsecond, microseconds_per = scale
+    value, remainder = divmod(microseconds * per_microsecond, microseconds_per)
+    if remainder:
+        raise DynColValueError(f"Can't store a value as {dtype} without loss")
+    # The minimum int64 is NaT
+    if not -(2**63) < value < 2**63:
+        raise DynColValueError(f"A value is out of range for {dtype}")
+    return value
+
+
+def decode_double(encvalue: memoryview) -> float:
+    if len(encvalue) != 8:
+        raise DynColValueError("Invalid double value")
+    value: float = encvalue.cast("d")[0]
+    return value
+
+
+def decode_date_us(encvalue: memoryview) -> int:
+    """
+    Decode a date as microseconds since the Unix epoch
+    """
+    if len(encvalue) != 3:
+        raise DynColValueError("Invalid date value")
+    val = int.from_bytes(encvalue[:3], "little")
+    year = val >> 9
+    month = (val >> 5) & 0xF
+    day = val & 0x1F
+    # The same dates as datetime.date accepts, as unpack() decodes into them
+    if not (
+        1 <= year <= 9999
+        and 1 <= month <= 12
+        and 1 <= day
+        and (day <= 28 or day <= monthrange(year, month)[1])
+    ):
+        raise DynColValueError("Invalid date value")
+    return days_from_civil(year, month, day) * 86_400_000_000
+
+
+def decode_datetime_us(encvalue: memoryview) -> int:
+    """
+    Decode a datetime as microseconds since the Unix epoch
+    """
+    if len(encvalue) not in (6, 9):
+        raise DynColValueError("Invalid datetime value")
+    val = int.from_bytes(encvalue[3:], "little")
+    if len(encvalue) == 9:
+        microsecond = val & 0xFFFFF
+        second = (val >> 20) & 0x3F
+        minute = (val >> 26) & 0x3F
+        hour = val >> 32
+    else:
+        microsecond = 0
+        second = val & 0x3F
+        minute = (val >> 6) & 0x3F
+        hour = val >> 12
+    if hour > 23 or minute > 59 or second > 59 or microsecond > 999_999:
+        raise DynColValueError("Invalid datetime value")
+    return (
+        decode_date_us(encvalue[:3])
+        + ((hour * 60 + minute) * 60 + second) * 1_000_000
+        + microsecond
+    )
+
+
+def days_from_civil(year: int, month: int, day: int) -> int:
+    """
+    Convert a date to days since the Unix epoch, without constructing a date
+    object. From http://howardhinnant.github.io/date_algorithms.html
+    """
+    if month <= 2:
+        year -= 1
+    era = year // 400
+    year_of_era = year - era * 400
+    day_of_year = (153 * (month + (-3 if month > 2 else 9)) + 2) // 5 + day - 1
+    day_of_era = year_of_era * 365 + year_of_era // 4 - year_of_era // 100 + day_of_year
+    return era * 146097 + day_of_era - 719468
+
+
+NUMERIC_DECODERS: dict[int, Callable[[memoryview], Any]] = {
+    DYN_COL_INT: decode_int,
+    DYN_COL_UINT: decode_uint,
+    DYN_COL_DOUBLE: decode_double,
+}
+
+# datetime64 units that can be extracted into, as their units per microsecond
+# and microseconds per unit
+TEMPORAL_UNITS = {
+    "D": (1, 86_400_000_000),
+    "h": (1, 3_600_000_000),
+    "m": (1, 60_000_000),
+    "s": (1, 1_000_000),
+    "ms": (1, 1_000),
+    "us": (1, 1),
+    "ns": (1_000, 1),
+}
+
+TEMPORAL_DECODERS: dict[int, Callable[[memoryview], Any]] = {
+    DYN_COL_DATETIME: decode_datetime_us,
+    DYN_COL_DATE: decode_date_us,
+}
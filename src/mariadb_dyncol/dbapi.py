@@ -0,0 +1,80 @@
+from __future__ import annotations
+
+from typing import Any
+from typing import Collection
+from typing import MutableMapping
+
+from mariadb_dyncol.base import DynColView
+
+
+class DynColCursorMixin:
+    """
+    A mixin for DB-API cursor classes, such as those of PyMySQL and
+    mysqlclient, that wraps the values of the columns named in dyncol_columns
+    in DynColViews as rows are fetched
+    """
+
+    dyncol_columns: Collection[str] = frozenset()
+
+    # Set by the cursor class
+    description: Any
+
+    _dyncol_description: Any = None
+    _dyncol_indexes: list[int] = []
+
+    def fetchone(self) -> Any:
+        row = super().fetchone()  # type: ignore[misc]
+        if row is None:
+            return None
+        return self._dyncol_row(row, self._dyncol_column_indexes())
+
+    def fetchmany(self, *args: Any, **kwargs: Any) -> Any:
+        rows = super().fetchmany(*args, **kwargs)  # type: ignore[misc]
+        indexes = self._dyncol_column_indexes()
+        return [self._dyncol_row(row, indexes) for row in rows]
+
+    def fetchall(self) -> Any:
+        rows = super().fetchall()  # type: ignore[misc]
+        indexes = self._dyncol_column_indexes()
+        return [self._dyncol_row(row, indexes) for row in rows]
+
+    def _dyncol_column_indexes(self) -> list[int]:
+        # Cached per result set, which each have their own description
+        description = self.description
+        if description is not self._dyncol_description:
+            self._dyncol_description = description
+            self._dyncol_indexes = [
+                i
+                for i, column in enumerate(description or ())
+                if column[0] in self.dyncol_columns
+            ]
+        return self._dyncol_indexes
+
+    def _dyncol_row(self, row: Any, indexes: list[int]) -> Any:
+        # Values are checked for being bytes as rows may already be converted,
+        # where the driver implements one fetch method with another
+        if isinstance(row, MutableMapping):
+            for name in self.dyncol_columns:
+                value = row.get(name)
+                if isinstance(value, bytes):
+                    row[name] = DynColView(value)
+            return row
+
+        values = list(row)
+        for i in indexes:
+            value = values[i]
+            if isinstance(value, bytes):
+                values[i] = DynColView(value)
+        return tuple(values)
+
+
+def dyncol_cursor(cursor_class: type, columns: Collection[str]) -> type:
+    """
+    Create a subclass of the given DB-API cursor class that wraps the values of
+    the named columns in DynColViews as rows are fetched
+    """
+    return type(
+        f"DynCol{cursor_class.__name__}",
+        (DynColCursorMixin, cursor_class),
+        {"dyncol_columns": frozenset(columns)},
+    )
@@ -0,0 +1,85 @@
+from __future__ import annotations
+
+from concurrent.futures import Executor
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any
+from typing import Callable
+from typing import Iterable
+from typing import Iterator
+from typing import Mapping
+from typing import TypeVar
+
+import mariadb_dyncol
+from ._batching import chunked
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+def parallel_pack(
+    dicties: Iterable[Mapping[str, Any]],
+    workers: int | None = None,
+    chunksize: int = 1000,
+    executor: Executor | None = None,
+) -> list[bytes]:
+    """
+    Convert many mappings into the MariaDB dynamic columns format, sharing the
+    work between processes
+    """
+    return _map_chunks(_pack_chunk, dicties, workers, chunksize, executor)
+
+
+def parallel_unpack(
+    bufs: Iterable[bytes],
+    workers: int | None = None,
+    chunksize: int = 1000,
+    executor: Executor | None = None,
+) -> list[dict[str, Any]]:
+    """
+    Convert many byte strings of MariaDB dynamic columns data into dicts,
+    sharing the work between processes
+    """
+    return _map_chunks(_unpack_chunk, bufs, workers, chunksize, executor)
+
+
+def _pack_chunk(dicties: list[Mapping[str, Any]]) -> list[bytes]:
+    return [mariadb_dyncol.pack(dicty) for dicty in dicties]
+
+
+def _unpack_chunk(bufs: list[bytes]) -> list[dict[str, Any]]:
+    return [mariadb_dyncol.unpack(buf) for buf in bufs]
+
+
+def _map_chunks(
+    func: Callable[[list[T]], list[R]],
+    items: Iterable[T],
+    workers: int | None,
+    chunksize: int,
+    executor: Executor | None,
+) -> list[R]:
+    if chunksize < 1:
+        raise ValueError("chunksize must be at least 1")
+
+    chunks = chunked(items, chunksize)
+    first = next(chunks, None)
+    if first is None:
+        return []
+    second = next(chunks, None)
+    if second is None:
+        # A single chunk isn't worth sending to another process
+        return func(first)
+
+    def all_chunks() -> Iterator[list[T]]:
+        yield first
+        assert second is not None
+        yield second
+        yield from chunks
+
+    if executor is not None:
+        return _flatten(executor.map(func, all_chunks()))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return _flatten(pool.map(func, all_chunks()))
+
+
+def _flatten(chunk_results: Iterable[list[R]]) -> list[R]:
+    return [item for chunk_result in chunk_results for item in chunk_result]
@@ -0,0 +1,145 @@
+from __future__ import annotations
+
+from collections import Counter
+from contextlib import contextmanager
+from threading import Lock
+from types import ModuleType
+from typing import Callable
+from typing import Iterator
+
+from mariadb_dyncol import base
+
+_speedups: ModuleType | None
+try:
+    from mariadb_dyncol import _speedups
+except ImportError:  # pragma: no cover
+    _speedups = None
+
+TYPE_NAMES = {
+    base.DYN_COL_INT: "int",
+    base.DYN_COL_UINT: "uint",
+    base.DYN_COL_DOUBLE: "double",
+    base.DYN_COL_STRING: "string",
+    base.DYN_COL_DECIMAL: "decimal",
+    base.DYN_COL_DATETIME: "datetime",
+    base.DYN_COL_DATE: "date",
+    base.DYN_COL_TIME: "time",
+    base.DYN_COL_DYNCOL: "dyncol",
+}
+
+
+class Stats:
+    """
+    Counts of what has been packed and unpacked, for finding out which value
+    types, data sizes and shapes a workload actually uses
+    """
+
+    def __init__(self, timing: bool = False) -> None:
+        self.timing = timing
+        self._lock = Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        """
+        Set all the counts back to zero
+        """
+        with self._lock:
+            # Per operation, "pack" or "unpack"
+            self.calls: Counter[str] = Counter()
+            self.bytes: Counter[str] = Counter()
+            self.seconds: dict[str, float] = {}
+            # Per type name, as in TYPE_NAMES
+            self.type_columns: Counter[str] = Counter()
+            self.type_bytes: Counter[str] = Counter()
+            # Columns per level of dynamic columns data, nesting depth of each
+            # call's data, and column directory entry size per level
+            self.column_counts: Counter[int] = Counter()
+            self.depths: Counter[int] = Counter()
+            self.offset_sizes: Counter[int] = Counter()
+
+    def record(self, operation: str, buf: bytes, seconds: float = 0.0) -> None:
+        """
+        Count one call of the given operation on well formed dynamic columns
+        data
+        """
+        type_columns: Counter[str] = Counter()
+        type_bytes: Counter[str] = Counter()
+        column_counts: Counter[int] = Counter()
+        offset_sizes: Counter[int] = Counter()
+        max_depth = 0
+        # Nested dynamic columns are walked in a loop, as in unpack()
+        pending = [(0, len(buf), 1)]
+
+        while pending:
+            start, end, depth = pending.pop()
+            max_depth = max(max_depth, depth)
+            flags, column_count, len_names = base.HEADER_STRUCT.unpack_from(buf, start)
+            coldata_size = base.COLDATA_SIZES[flags & 0x03]
+            column_counts[column_count] += 1
+            offset_sizes[coldata_size] += 1
+
+            data_start = start + (1 + 2 + 2) + coldata_size * column_count + len_names
+            _, data_offsets_dtypes = base.read_column_directory(
+                buf, column_count, coldata_size, start
+            )
+            data_offsets_dtypes.append((end - data_start) << 4)
+            for i in range(column_count):
+                dtype = data_offsets_dtypes[i] & 0xF
+                value_start = data_start + (data_offsets_dtypes[i] >> 4)
+                value_end = data_start + (data_offsets_dtypes[i + 1] >> 4)
+                type_name = TYPE_NAMES[dtype]
+                type_columns[type_name] += 1
+                type_bytes[type_name] += value_end - value_start
+                if dtype == base.DYN_COL_DYNCOL:
+                    pending.append((value_start, value_end, depth + 1))
+
+        with self._lock:
+            self.calls[operation] += 1
+            self.bytes[operation] += len(buf)
+            if self.timing:
+                self.seconds[operation] = self.seconds.get(operation, 0.0) + seconds
+            self.type_columns.update(type_columns)
+            self.type_bytes.update(type_bytes)
+            self.column_counts.update(column_counts)
+            self.depths[max_depth] += 1
+            self.offset_sizes.update(offset_sizes)
+
+
+def set_stats_hook(hook: Callable[[str, bytes, float], None] | None) -> None:
+    # The C extension records the calls it handles, and the Python
+    # implementation those it falls back to
+    base.stats_hook = hook
+    if _speedups is not None:
+        _speedups._set_stats_hook(hook)
+
+
+def enable_stats(timing: bool = False) -> Stats:
+    """
+    Start counting every pack and unpack, returning the Stats they are counted
+    in
+    """
+    stats = Stats(timing)
+    set_stats_hook(stats.record)
+    return stats
+
+
+def disable_stats() -> None:
+    """
+    Stop counting pack and unpack calls
+    """
+    set_stats_hook(None)
+
+
+@contextmanager
+def collect_stats(timing: bool = False) -> Iterator[Stats]:
+    """
+    Count every pack and unpack within the block. Within a nested block, calls
+    are only counted by the inner one, and counting by the outer one resumes
+    after it.
+    """
+    previous = base.stats_hook
+    stats = enable_stats(timing)
+    try:
+        yield stats
+    finally:
+        set_stats_hook(previous)
@@ -0,0 +1,80 @@
+from __future__ import annotations
+
+from mmap import mmap
+from struct import Struct
+from typing import Any
+from typing import IO
+from typing import Iterable
+from typing import Iterator
+from typing import Mapping
+
+import mariadb_dyncol
+from .base import DynColValueError
+from .base import DynColView
+
+# Each packed mapping in a stream is prefixed with its length
+LENGTH_STRUCT = Struct("<I")
+
+
+def pack_stream(stream: IO[bytes], dicties: Iterable[Mapping[str, Any]]) -> None:
+    """
+    Write mappings to a binary stream in the MariaDB dynamic columns format,
+    each prefixed with its length
+    """
+    for dicty in dicties:
+        packed = mariadb_dyncol.pack(dicty)
+        stream.write(LENGTH_STRUCT.pack(len(packed)))
+        stream.write(packed)
+
+
+def unpack_stream(
+    stream: IO[bytes] | bytes | bytearray | memoryview | mmap, lazy: bool = False
+) -> Iterator[Any]:
+    """
+    Iterate over length-prefixed MariaDB dynamic columns data in a binary
+    stream or buffer, yielding dicts, or DynColViews if lazy is true
+    """
+    try:
+        view = memoryview(stream)  # type: ignore [arg-type]
+    except TypeError:
+        assert not isinstance(stream, (bytes, bytearray, memoryview, mmap))
+        return _unpack_file(stream, lazy)
+    else:
+        return _unpack_buffer(view, lazy)
+
+
+def _unpack_buffer(view: memoryview, lazy: bool) -> Iterator[Any]:
+    length_size = LENGTH_STRUCT.size
+    offset = 0
+    with view:
+        while offset < len(view):
+            if offset + length_size > len(view):
+                raise DynColValueError("Truncated dynamic columns stream")
+            (length,) = LENGTH_STRUCT.unpack_from(view, offset)
+            offset += length_size
+            if offset + length > len(view):
+                raise DynColValueError("Truncated dynamic columns stream")
+            buf = view[offset : offset + length]
+            offset += length
+            if lazy:
+                yield DynColView(buf)
+            else:
+                yield mariadb_dyncol.unpack(buf.tobytes())
+
+
+def _unpack_file(stream: IO[bytes], lazy: bool) -> Iterator[Any]:
+    length_size = LENGTH_STRUCT.size
+    while True:
+        prefix = stream.read(length_size)
+        if not prefix:
+            return
+        if len(prefix) < length_size:
+            raise DynColValueError("Truncated dynamic columns stream")
+        (length,) = LENGTH_STRUCT.unpack(prefix)
+        buf = stream.read(length)
+        if len(buf) < length:
+            raise DynColValueError("Truncated dynamic columns stream")
+        if lazy:
+            yield DynColView(buf)
+        else:
+            yield mariadb_dyncol.unpack(buf)
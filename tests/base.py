@@ -5,12 +5,15 @@ import os
 from datetime import date
 from datetime import datetime
 from datetime import time
+from decimal import Decimal
 from typing import Any
 
 import pymysql
 
 from mariadb_dyncol import pack
+from mariadb_dyncol import to_json
 from mariadb_dyncol import unpack
+from mariadb_dyncol import validate
 
 hexs = binascii.hexlify
 unhexs = binascii.unhexlify
@@ -34,6 +37,7 @@ def check(
         packed_hex_prefix = packed_hex[: len(expected_prefix)]
         assert packed_hex_prefix == expected_prefix
 
+    validate(packed)
     check_against_db(input, packed)
 
     unpacked = unpack(packed)
@@ -80,6 +84,10 @@ def check_against_db(dicty: dict[str, Any], byte_string: bytes) -> None:
         cursor.execute(sql, params)
         result = cursor.fetchone()[0]
         assert hexs(byte_string) == hexs(result)
+        # Check JSON conversion matches COLUMN_JSON
+        cursor.execute("SELECT CAST(COLUMN_JSON(%s) AS BINARY) AS j", (byte_string,))
+        result = cursor.fetchone()[0]
+        assert to_json(byte_string) == result
     finally:
         cursor.close()
 
@@ -100,7 +108,7 @@ def column_create(dicty: dict[str, Any]) -> tuple[str, list[Any]]:
             params.extend(subparams)
         elif value is None:
             sql.append("NULL")
-        elif isinstance(value, (int, str)):
+        elif isinstance(value, (int, str, bytes)):
             sql.append("%s")
             params.append(value)
         elif isinstance(value, float):
@@ -113,4 +121,9 @@ def column_create(dicty: dict[str, Any]) -> tuple[str, list[Any]]:
     return "COLUMN_CREATE(" + ", ".join(sql) + ")", params
 
 
-type_map = {date: "DATE", datetime: "DATETIME", time: "TIME"}
+type_map = {
+    date: "DATE",
+    datetime: "DATETIME",
+    Decimal: "DECIMAL",
+    time: "TIME",
+}
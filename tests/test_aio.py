@@ -0,0 +1,116 @@
+from __future__ import annotations
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+import pytest
+
+from mariadb_dyncol import aunpack_many
+from mariadb_dyncol import aunpack_rows
+from mariadb_dyncol import pack
+
+dicties: list[dict[str, Any]] = [{"i": i, "s": str(i)} for i in range(25)]
+bufs = [pack(dicty) for dicty in dicties]
+
+
+class FakeCursor:
+    def __init__(self, rows: list[Any]) -> None:
+        self.rows = rows
+        self.batch_sizes: list[int] = []
+
+    async def fetchmany(self, size: int) -> list[Any]:
+        self.batch_sizes.append(size)
+        batch, self.rows = self.rows[:size], self.rows[size:]
+        return batch
+
+
+async def collect_rows(cursor: FakeCursor, *args: Any, **kwargs: Any) -> list[Any]:
+    return [row async for row in aunpack_rows(cursor, *args, **kwargs)]
+
+
+def test_aunpack_many():
+    assert asyncio.run(aunpack_many(bufs, batch_size=7)) == dicties
+
+
+def test_aunpack_many_empty():
+    assert asyncio.run(aunpack_many([])) == []
+
+
+def test_aunpack_many_iterator():
+    assert asyncio.run(aunpack_many(iter(bufs))) == dicties
+
+
+def test_aunpack_many_batch_size_invalid():
+    with pytest.raises(ValueError, match="batch_size must be at least 1"):
+        asyncio.run(aunpack_many(bufs, batch_size=0))
+
+
+def test_aunpack_many_offload():
+    big = pack({"a": "a" * 1000})
+    with ThreadPoolExecutor(1) as executor:
+        result = asyncio.run(
+            aunpack_many([big, bufs[0]], offload_size=1000, executor=executor)
+        )
+    assert result == [{"a": "a" * 1000}, dicties[0]]
+
+
+def test_aunpack_many_offload_default_executor():
+    big = pack({"a": "a" * 1000})
+    assert asyncio.run(aunpack_many([big], offload_size=1000)) == [{"a": "a" * 1000}]
+
+
+def test_aunpack_many_yields_between_batches():
+    ticks = 0
+
+    async def ticker() -> None:
+        nonlocal ticks
+        while True:
+            ticks += 1
+            await asyncio.sleep(0)
+
+    async def main() -> None:
+        task = asyncio.ensure_future(ticker())
+        await asyncio.sleep(0)
+        before = ticks
+        await aunpack_many(bufs, batch_size=5)
+        # One batch at a time
+        assert ticks - before == 5
+        task.cancel()
+
+    asyncio.run(main())
+
+
+def test_aunpack_rows():
+    rows = [(i, buf) for i, buf in enumerate(bufs)]
+    cursor = FakeCursor(rows)
+    result = asyncio.run(collect_rows(cursor, [1], batch_size=10))
+    assert result == [(i, dicty) for i, dicty in enumerate(dicties)]
+    assert cursor.batch_sizes == [10, 10, 10, 10]
+
+
+def test_aunpack_rows_dicts():
+    rows = [{"id": 1, "attrs": bufs[0], "other": bufs[1]}, {"id": 2, "attrs": None}]
+    result = asyncio.run(collect_rows(FakeCursor(rows), ["attrs"]))
+    assert result == [
+        {"id": 1, "attrs": dicties[0], "other": bufs[1]},
+        {"id": 2, "attrs": None},
+    ]
+
+
+def test_aunpack_rows_several_columns():
+    rows = [(bufs[0], None, bufs[1]), (None, bufs[2], bufs[3])]
+    result = asyncio.run(collect_rows(FakeCursor(rows), [0, 1, 2], offload_size=1))
+    assert result == [
+        (dicties[0], None, dicties[1]),
+        (None, dicties[2], dicties[3]),
+    ]
+
+
+def test_aunpack_rows_empty():
+    assert asyncio.run(collect_rows(FakeCursor([]), [0])) == []
+
+
+def test_aunpack_rows_batch_size_invalid():
+    with pytest.raises(ValueError, match="batch_size must be at least 1"):
+        asyncio.run(collect_rows(FakeCursor([]), [0], batch_size=0))
@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+from datetime import date
+from types import MappingProxyType
+
+import pytest
+
+from mariadb_dyncol import CachedUnpacker
+from mariadb_dyncol import DynColValueError
+from mariadb_dyncol import pack
+
+
+def test_unpack():
+    unpacker = CachedUnpacker()
+    buf = pack({"a": 1, "b": {"c": date(2020, 1, 1)}})
+    result = unpacker(buf)
+    assert result == {"a": 1, "b": {"c": date(2020, 1, 1)}}
+    assert unpacker.cache_info() == (0, 1, 1024, None, 1, len(buf))
+
+
+def test_hit():
+    unpacker = CachedUnpacker()
+    buf = pack({"a": 1})
+    first = unpacker(buf)
+    second = unpacker(bytes(bytearray(buf)))
+    assert second is first
+    info = unpacker.cache_info()
+    assert info.hits == 1
+    assert info.misses == 1
+
+
+def test_bytearray_and_memoryview():
+    unpacker = CachedUnpacker()
+    buf = pack({"a": 1})
+    assert unpacker(bytearray(buf)) == {"a": 1}
+    assert unpacker(memoryview(buf)) == {"a": 1}
+    assert unpacker.cache_info().hits == 1
+
+
+def test_read_only():
+    unpacker = CachedUnpacker()
+    result = unpacker(pack({"a": 1, "b": {"c": 2}}))
+    assert isinstance(result, MappingProxyType)
+    assert isinstance(result["b"], MappingProxyType)
+    with pytest.raises(TypeError):
+        result["a"] = 2  # type: ignore [index]
+    with pytest.raises(TypeError):
+        result["b"]["c"] = 3  # type: ignore [index]
+
+
+def test_maxsize_evicts_least_recently_used():
+    unpacker = CachedUnpacker(maxsize=2)
+    a, b, c = pack({"a": 1}), pack({"b": 1}), pack({"c": 1})
+    unpacker(a)
+    unpacker(b)
+    unpacker(a)
+    unpacker(c)  # evicts b
+    assert unpacker.cache_info().currsize == 2
+    unpacker(a)
+    assert unpacker.cache_info().hits == 2
+    unpacker(b)
+    assert unpacker.cache_info().misses == 4
+
+
+def test_max_bytes():
+    a, b = pack({"a": 1}), pack({"b": 1})
+    unpacker = CachedUnpacker(maxsize=None, max_bytes=len(a) + len(b) - 1)
+    unpacker(a)
+    unpacker(b)
+    info = unpacker.cache_info()
+    assert info.currsize == 1
+    assert info.currbytes == len(b)
+
+
+def test_max_bytes_too_large():
+    unpacker = CachedUnpacker(max_bytes=4)
+    assert unpacker(pack({"a": 1})) == {"a": 1}
+    assert unpacker.cache_info().currsize == 0
+
+
+def test_cache_clear():
+    unpacker = CachedUnpacker()
+    unpacker(pack({"a": 1}))
+    unpacker.cache_clear()
+    assert unpacker.cache_info() == (0, 0, 1024, None, 0, 0)
+
+
+def test_error_not_cached():
+    unpacker = CachedUnpacker()
+    with pytest.raises(DynColValueError):
+        unpacker(b"0001000100030861666166")
+    assert unpacker.cache_info().currsize == 0
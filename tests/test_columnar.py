@@ -0,0 +1,202 @@
+from __future__ import annotations
+
+from datetime import date
+from datetime import datetime
+
+import pytest
+
+from .base import unhexs
+from mariadb_dyncol import DynColTypeError
+from mariadb_dyncol import DynColValueError
+from mariadb_dyncol import extract_column
+from mariadb_dyncol import pack
+
+np = pytest.importorskip("numpy")
+
+
+def test_float():
+    bufs = [pack({"a": 1.5}), pack({"b": 2.0}), pack({"a": -3.25, "b": 1})]
+    values, mask = extract_column(bufs, "a")
+    assert values.dtype == np.float64
+    assert values.tolist() == [1.5, 0.0, -3.25]
+    assert mask.tolist() == [True, False, True]
+
+
+def test_float_from_ints():
+    bufs = [pack({"a": 1}), pack({"a": 2**53}), pack({"a": 2**64 - 2**11})]
+    values, mask = extract_column(bufs, "a", dtype="float64")
+    assert values.tolist() == [1.0, float(2**53), float(2**64 - 2**11)]
+    assert mask.tolist() == [True, True, True]
+
+
+@pytest.mark.parametrize("value", [2**53 + 1, 2**64 - 1, -(2**63) + 1])
+def test_inexact_int_into_float(value):
+    with pytest.raises(DynColValueError):
+        extract_column([pack({"a": value})], "a", dtype="float64")
+
+
+def test_float32():
+    bufs = [pack({"a": 1.5}), pack({"a": 2**24})]
+    values, mask = extract_column(bufs, "a", dtype="float32")
+    assert values.dtype == np.float32
+    assert values.tolist() == [1.5, float(2**24)]
+
+
+@pytest.mark.parametrize("value", [0.1, 1e300, 2**24 + 1])
+def test_inexact_into_float32(value):
+    with pytest.raises(DynColValueError):
+        extract_column([pack({"a": value})], "a", dtype="float32")
+
+
+def test_int64():
+    bufs = [pack({"a": 1}), pack({"a": -(2**31)}), pack({}), pack({"a": 2**62})]
+    values, mask = extract_column(bufs, "a", dtype=np.int64)
+    assert values.dtype == np.int64
+    assert values.tolist() == [1, -(2**31), 0, 2**62]
+    assert mask.tolist() == [True, True, False, True]
+
+
+def test_uint64():
+    bufs = [pack({"a": 2**64 - 1}), pack({"a": 0})]
+    values, mask = extract_column(bufs, "a", dtype="uint64")
+    assert values.tolist() == [2**64 - 1, 0]
+    assert mask.tolist() == [True, True]
+
+
+def test_datetime64():
+    bufs = [
+        pack({"a": datetime(2020, 1, 2, 3, 4, 5, 678)}),
+        pack({"a": datetime(1, 1, 1)}),
+        pack({"a": date(1969, 12, 31)}),
+        pack({"a": datetime(9999, 12, 31, 23, 59, 59, 999999)}),
+        pack({"b": datetime(2020, 1, 1)}),
+    ]
+    values, mask = extract_column(bufs, "a", dtype="datetime64")
+    assert values.dtype == np.dtype("datetime64[us]")
+    assert values[:4].tolist() == [
+        datetime(2020, 1, 2, 3, 4, 5, 678),
+        datetime(1, 1, 1),
+        datetime(1969, 12, 31),
+        datetime(9999, 12, 31, 23, 59, 59, 999999),
+    ]
+    assert mask.tolist() == [True, True, True, True, False]
+
+
+def test_iterator():
+    values, mask = extract_column((pack({"a": i}) for i in range(3)), "a", "int64")
+    assert values.tolist() == [0, 1, 2]
+    assert mask.all()
+
+
+def test_empty():
+    values, mask = extract_column([], "a")
+    assert len(values) == 0
+    assert len(mask) == 0
+
+
+def test_string_value():
+    with pytest.raises(DynColTypeError):
+        extract_column([pack({"a": "x"})], "a")
+
+
+def test_datetime_into_float():
+    with pytest.raises(DynColTypeError):
+        extract_column([pack({"a": datetime(2020, 1, 1)})], "a")
+
+
+def test_unsupported_dtype():
+    with pytest.raises(DynColTypeError):
+        extract_column([pack({"a": 1})], "a", dtype=object)
+
+
+@pytest.mark.parametrize(
+    "unit, expected",
+    [
+        ("D", [date(2020, 1, 2), date(1969, 12, 31)]),
+        ("s", [datetime(2020, 1, 2), datetime(1969, 12, 31)]),
+        ("ms", [datetime(2020, 1, 2), datetime(1969, 12, 31)]),
+    ],
+)
+def test_datetime64_unit(unit, expected):
+    bufs = [pack({"a": datetime(2020, 1, 2)}), pack({"a": date(1969, 12, 31)})]
+    values, mask = extract_column(bufs, "a", dtype=f"datetime64[{unit}]")
+    assert values.dtype == np.dtype(f"datetime64[{unit}]")
+    assert values.tolist() == expected
+
+
+def test_datetime64_ns():
+    bufs = [pack({"a": datetime(2020, 1, 2, 3, 4, 5, 678)})]
+    values, mask = extract_column(bufs, "a", dtype="datetime64[ns]")
+    assert values.dtype == np.dtype("datetime64[ns]")
+    assert values[0] == np.datetime64("2020-01-02T03:04:05.000678000")
+
+
+def test_datetime64_ns_out_of_range():
+    with pytest.raises(DynColValueError):
+        extract_column([pack({"a": date(3000, 1, 1)})], "a", dtype="datetime64[ns]")
+
+
+def test_datetime64_lossy_unit():
+    with pytest.raises(DynColValueError):
+        extract_column(
+            [pack({"a": datetime(2020, 1, 2, 3)})], "a", dtype="datetime64[D]"
+        )
+
+
+@pytest.mark.parametrize("dtype", ["datetime64[Y]", "datetime64[2s]"])
+def test_datetime64_unsupported_unit(dtype):
+    with pytest.raises(DynColTypeError):
+        extract_column([pack({"a": date(2020, 1, 1)})], "a", dtype=dtype)
+
+
+def test_uint_into_int64():
+    with pytest.raises(DynColValueError):
+        extract_column([pack({"a": 2**63})], "a", dtype="int64")
+
+
+def test_int_out_of_range():
+    with pytest.raises(DynColValueError):
+        extract_column([pack({"a": 2**31})], "a", dtype="int32")
+    with pytest.raises(DynColValueError):
+        extract_column([pack({"a": -1})], "a", dtype="uint64")
+
+
+def test_whole_float_into_int():
+    values, mask = extract_column([pack({"a": 3.0})], "a", dtype="int64")
+    assert values.tolist() == [3]
+
+
+def test_fractional_float_into_int():
+    with pytest.raises(DynColValueError):
+        extract_column([pack({"a": 1.5})], "a", dtype="int64")
+
+
+def test_datetime64_invalid_length():
+    buf = unhexs("04010001000000050061a1300f00000000")
+    with pytest.raises(DynColValueError):
+        extract_column([buf], "a", dtype="datetime64")
+
+
+@pytest.mark.parametrize("dtype", ["float64", "float32"])
+def test_double_invalid_length(dtype):
+    buf = unhexs("0401000100000002006100000000")
+    with pytest.raises(DynColValueError):
+        extract_column([buf], "a", dtype=dtype)
+
+
+@pytest.mark.parametrize(
+    "buf",
+    [
+        # Month 0
+        "040100010000000600610fc80f",
+        # Day 0
+        "0401000100000006006120c80f",
+        # 31st of February
+        "040100010000000600615fc80f",
+        # Hour 24
+        "0401000100000005006121c80f008001",
+    ],
+)
+def test_datetime64_invalid_fields(buf):
+    with pytest.raises(DynColValueError):
+        extract_column([unhexs(buf)], "a", dtype="datetime64")
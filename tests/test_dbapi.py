@@ -0,0 +1,115 @@
+from __future__ import annotations
+
+from typing import Any
+
+import pymysql
+
+from mariadb_dyncol import dyncol_cursor
+from mariadb_dyncol import DynColCursorMixin
+from mariadb_dyncol import DynColView
+from mariadb_dyncol import pack
+
+packed = pack({"a": 1, "b": "x"})
+other = pack({"c": 2})
+
+
+class FakeCursor:
+    # Like the cursors of PyMySQL and mysqlclient
+    def __init__(self, results: list[tuple[list[str], list[Any]]]) -> None:
+        self.results = results
+        self.nextset()
+
+    def nextset(self) -> bool | None:
+        if not self.results:
+            return None
+        names, self.rows = self.results.pop(0)
+        self.description = tuple(
+            (name, 252, None, None, None, None, True) for name in names
+        )
+        return True
+
+    def fetchone(self) -> Any:
+        if not self.rows:
+            return None
+        return self.rows.pop(0)
+
+    def fetchmany(self, size: int = 1) -> list[Any]:
+        rows, self.rows = self.rows[:size], self.rows[size:]
+        return rows
+
+    def fetchall(self) -> list[Any]:
+        rows, self.rows = self.rows, []
+        return rows
+
+
+class FakeFetchallViaFetchoneCursor(FakeCursor):
+    # Like PyMySQL's SSCursor
+    def fetchall(self) -> list[Any]:
+        return list(iter(self.fetchone, None))
+
+
+def test_dyncol_cursor_fetchone():
+    cursor = dyncol_cursor(FakeCursor, ["attrs"])([(["id", "attrs"], [(1, packed)])])
+    row = cursor.fetchone()
+    assert row[0] == 1
+    assert isinstance(row[1], DynColView)
+    assert row[1] == {"a": 1, "b": "x"}
+    assert cursor.fetchone() is None
+
+
+def test_dyncol_cursor_fetchmany():
+    cursor_class = dyncol_cursor(FakeCursor, ["attrs", "more"])
+    cursor = cursor_class(
+        [(["attrs", "id", "more"], [(packed, 1, None), (None, 2, other)])]
+    )
+    assert cursor.fetchmany(5) == [
+        ({"a": 1, "b": "x"}, 1, None),
+        (None, 2, {"c": 2}),
+    ]
+
+
+def test_dyncol_cursor_fetchall():
+    cursor = dyncol_cursor(FakeCursor, ["attrs"])(
+        [(["id", "attrs", "data"], [(1, packed, other)])]
+    )
+    assert cursor.fetchall() == [(1, {"a": 1, "b": "x"}, other)]
+
+
+def test_dyncol_cursor_fetchall_via_fetchone():
+    cursor = dyncol_cursor(FakeFetchallViaFetchoneCursor, ["attrs"])(
+        [(["attrs"], [(packed,), (other,)])]
+    )
+    rows = cursor.fetchall()
+    assert rows == [({"a": 1, "b": "x"},), ({"c": 2},)]
+    assert all(isinstance(row[0], DynColView) for row in rows)
+
+
+def test_dyncol_cursor_dict_rows():
+    cursor = dyncol_cursor(FakeCursor, ["attrs"])(
+        [(["id", "attrs", "data"], [{"id": 1, "attrs": packed, "data": other}])]
+    )
+    assert cursor.fetchall() == [{"id": 1, "attrs": {"a": 1, "b": "x"}, "data": other}]
+
+
+def test_dyncol_cursor_result_sets():
+    cursor = dyncol_cursor(FakeCursor, ["attrs"])(
+        [(["attrs", "id"], [(packed, 1)]), (["id", "attrs"], [(2, other)])]
+    )
+    assert cursor.fetchall() == [({"a": 1, "b": "x"}, 1)]
+    assert cursor.nextset()
+    assert cursor.fetchall() == [(2, {"c": 2})]
+
+
+def test_dyncol_cursor_class():
+    cursor_class = dyncol_cursor(pymysql.cursors.DictCursor, ("attrs",))
+    assert cursor_class.__name__ == "DynColDictCursor"
+    assert cursor_class.__bases__ == (DynColCursorMixin, pymysql.cursors.DictCursor)
+    assert vars(cursor_class)["dyncol_columns"] == {"attrs"}
+
+
+def test_dyncol_cursor_mixin():
+    class Cursor(DynColCursorMixin, FakeCursor):
+        dyncol_columns = {"attrs"}
+
+    cursor = Cursor([(["attrs"], [(packed,)])])
+    assert cursor.fetchone() == ({"a": 1, "b": "x"},)
@@ -2,26 +2,37 @@ from __future__ import annotations
 
 from math import isinf
 from math import isnan
+from types import ModuleType
 from typing import Any
 
+import pytest
 from hypothesis import assume
 from hypothesis import given
+from hypothesis.strategies import binary
 from hypothesis.strategies import dates
 from hypothesis.strategies import datetimes
+from hypothesis.strategies import decimals
 from hypothesis.strategies import dictionaries
 from hypothesis.strategies import floats
 from hypothesis.strategies import integers
+from hypothesis.strategies import lists
+from hypothesis.strategies import none
 from hypothesis.strategies import recursive
 from hypothesis.strategies import text
 from hypothesis.strategies import times
 
 from .base import check_against_db
+from mariadb_dyncol import base
 from mariadb_dyncol import DynColValueError
-from mariadb_dyncol import pack
-from mariadb_dyncol import unpack
 from mariadb_dyncol.base import MAX_NAME_LENGTH
 from mariadb_dyncol.base import MAX_TOTAL_NAME_LENGTH
 
+_speedups: ModuleType | None
+try:
+    from mariadb_dyncol import _speedups
+except ImportError:  # pragma: no cover
+    _speedups = None
+
 valid_keys = text(min_size=1, max_size=MAX_NAME_LENGTH).filter(
     lambda key: len(key.encode("utf-8")) <= MAX_NAME_LENGTH
 )
@@ -32,6 +43,7 @@ valid_floats = floats().filter(lambda f: not isnan(f) and not isinf(f))
 valid_datetimes = datetimes()
 valid_dates = dates()
 valid_times = times()
+valid_decimals = decimals(allow_nan=False, allow_infinity=False)
 
 
 def valid_dictionaries(keys: Any, values: Any) -> Any:
@@ -42,43 +54,84 @@ def valid_dictionaries(keys: Any, values: Any) -> Any:
     )
 
 
-def check_data(data: dict[str, Any]) -> None:
-    packed = pack(data)
+implementations = pytest.mark.parametrize(
+    "impl",
+    [
+        pytest.param(base, id="python"),
+        pytest.param(
+            _speedups,
+            id="c",
+            marks=pytest.mark.skipif(_speedups is None, reason="C extension not built"),
+        ),
+    ],
+)
+
+
+def check_data(impl: ModuleType, data: dict[str, Any]) -> None:
+    packed = impl.pack(data)
+    base.validate(packed)
     check_against_db(data, packed)
-    assert unpack(packed) == data
+    unpacked = impl.unpack(packed)
+    assert unpacked == data
+    if impl is not base:
+        # The C extension should be equivalent to the Python implementation
+        assert packed == base.pack(data)
+        assert unpacked == base.unpack(packed)
+        assert impl.to_json(packed) == base.to_json(packed)
 
 
+@implementations
 @given(valid_dictionaries(valid_keys, valid_ints))
-def test_ints(data):
-    check_data(data)
+def test_ints(impl, data):
+    check_data(impl, data)
 
 
+@implementations
 @given(valid_dictionaries(valid_keys, valid_floats))
-def test_floats(data):
+def test_floats(impl, data):
     try:
-        check_data(data)
+        check_data(impl, data)
     except DynColValueError:
         assume(False)
 
 
+@implementations
 @given(valid_dictionaries(valid_keys, text()))
-def test_strings(data):
-    check_data(data)
+def test_strings(impl, data):
+    check_data(impl, data)
 
 
+@implementations
+@given(valid_dictionaries(valid_keys, binary()))
+def test_bytes(impl, data):
+    check_data(impl, data)
+
+
+@implementations
 @given(valid_dictionaries(valid_keys, valid_datetimes))
-def test_datetimes(data):
-    check_data(data)
+def test_datetimes(impl, data):
+    check_data(impl, data)
 
 
+@implementations
 @given(valid_dictionaries(valid_keys, valid_dates))
-def test_dates(data):
-    check_data(data)
+def test_dates(impl, data):
+    check_data(impl, data)
 
 
+@implementations
 @given(valid_dictionaries(valid_keys, valid_times))
-def test_times(data):
-    check_data(data)
+def test_times(impl, data):
+    check_data(impl, data)
+
+
+@implementations
+@given(valid_dictionaries(valid_keys, valid_decimals))
+def test_decimals(impl, data):
+    try:
+        check_data(impl, data)
+    except DynColValueError:
+        assume(False)
 
 
 def filter_recursive_values(children):
@@ -86,14 +139,46 @@ def filter_recursive_values(children):
 
 
 recursive_values = recursive(
-    (valid_ints | valid_floats | text() | valid_datetimes | valid_dates | valid_times),
+    (
+        valid_ints
+        | valid_floats
+        | text()
+        | binary()
+        | valid_datetimes
+        | valid_dates
+        | valid_times
+    ),
     filter_recursive_values,
 )
 
 
+@implementations
 @given(valid_dictionaries(valid_keys, recursive_values))
-def test_recursively_defined(data):
+def test_recursively_defined(impl, data):
     try:
-        check_data(data)
+        check_data(impl, data)
     except DynColValueError:
         assume(False)
+
+
+small_keys = text(min_size=1, max_size=3)
+small_values = none() | valid_ints | text(max_size=10) | valid_dates
+
+
+@implementations
+@given(
+    valid_dictionaries(small_keys, valid_ints),
+    dictionaries(small_keys, small_values),
+)
+def test_add(impl, data, updates):
+    added = impl.add(base.pack(data), updates)
+    expected = {**data, **updates}
+    assert added == base.pack({k: v for k, v in expected.items() if v is not None})
+    assert added == base.add(base.pack(data), updates)
+
+
+@implementations
+@given(valid_dictionaries(small_keys, valid_ints), lists(small_keys))
+def test_delete(impl, data, names):
+    deleted = impl.delete(base.pack(data), names)
+    assert deleted == base.pack({k: v for k, v in data.items() if k not in names})
@@ -1,21 +1,47 @@
 from __future__ import annotations
 
+from array import array
+from collections import OrderedDict
 from datetime import date
 from datetime import datetime
 from datetime import time
 from decimal import Decimal
+from enum import Enum
+from enum import IntEnum
+from types import MappingProxyType
+from typing import Any
+from typing import ItemsView
+from typing import Iterator
+from typing import Mapping
+from uuid import UUID
 
 import pytest
 
 from .base import check
 from .base import hexs
 from .base import unhexs
+from mariadb_dyncol import add
+from mariadb_dyncol import base
+from mariadb_dyncol import Codec
+from mariadb_dyncol import delete
 from mariadb_dyncol import DynColLimitError
 from mariadb_dyncol import DynColNotSupported
 from mariadb_dyncol import DynColTypeError
 from mariadb_dyncol import DynColValueError
+from mariadb_dyncol import DynColView
+from mariadb_dyncol import from_json
+from mariadb_dyncol import get
+from mariadb_dyncol import get_many
 from mariadb_dyncol import pack
+from mariadb_dyncol import pack_into
+from mariadb_dyncol import pack_many
+from mariadb_dyncol import packed_size
+from mariadb_dyncol import Schema
+from mariadb_dyncol import to_json
 from mariadb_dyncol import unpack
+from mariadb_dyncol import unpack_many
+from mariadb_dyncol import validate
+from mariadb_dyncol.base import MAX_DEPTH
 from mariadb_dyncol.base import MAX_NAME_LENGTH  # private but useful in tests
 
 
@@ -62,6 +88,22 @@ def test_ulonglongmax():
     )
 
 
+def test_uint_short_unpack():
+    # MariaDB stores unsigned ints in as few bytes as needed
+    assert unpack(unhexs("0401000100000001006105")) == {"a": 5}
+    assert unpack(unhexs("040100010000000100610001")) == {"a": 256}
+
+
+def test_uint_zero_unpack():
+    assert unpack(unhexs("04010001000000010061")) == {"a": 0}
+
+
+@pytest.mark.parametrize("unpack_func", [unpack, base.unpack])
+def test_uint_too_long_unpack(unpack_func):
+    with pytest.raises(DynColValueError):
+        unpack_func(unhexs("04010001000000010061ffffffffffffffff01"))
+
+
 def test_integer_overflow():
     with pytest.raises(DynColValueError):
         pack({"a": 2**64})
@@ -120,9 +162,46 @@ def test_unicode_utf8mb4_unpack():
     assert unpack(unhexs("040100010000000300612d61")) == {"a": "a"}
 
 
-def test_non_unicode_charset_fails():
+def test_latin1_charset():
+    # {'a': 'café€'} in latin1
+    assert unpack(unhexs("0401000100000003006108636166e980")) == {"a": "café€"}
+
+
+def test_latin1_charset_undefined_bytes():
+    # Bytes that Windows-1252 leaves undefined decode like ISO-8859-1
+    assert unpack(unhexs("040100010000000300610881")) == {"a": "\x81"}
+
+
+def test_ascii_charset():
+    assert unpack(unhexs("040100010000000300610b61")) == {"a": "a"}
+
+
+def test_two_byte_charset_number():
+    # utf8mb4_unicode_ci is number 224
+    assert unpack(unhexs("04010001000000030061e00161")) == {"a": "a"}
+
+
+def test_nopad_charset():
+    # latin1_swedish_nopad_ci is number 1032
+    assert unpack(unhexs("04010001000000030061880861")) == {"a": "a"}
+
+
+def test_unknown_charset_fails():
     with pytest.raises(DynColNotSupported):
-        unpack(unhexs("040100010000000300610861"))  # {'a': 'a'} in latin1
+        unpack(unhexs("040100010000000300610a61"))  # {'a': 'a'} in swe7
+
+
+def test_truncated_charset_fails():
+    with pytest.raises(DynColValueError):
+        unpack(unhexs("0401000100000003006188"))
+
+
+def test_bytes():
+    check(input={"a": b"\x00\xff"}, expected=b"040100010000000300613f00ff")
+
+
+def test_bytes_empty():
+    check(input={"a": b""}, expected=b"040100010000000300613f")
 
 
 @pytest.mark.slow
@@ -206,31 +285,67 @@ def test_float_inf_not_stored():
         pack({"a": float("inf")})
 
 
-def test_pack_Decimal_not_implemented():
-    with pytest.raises(DynColNotSupported):
-        pack({"a": Decimal(1)})
+def test_decimal_1():
+    check(input={"a": Decimal("1")}, expected=b"04010001000000040061090080000001")
 
 
-def test_unpack_Decimal_not_implemented():
-    with pytest.raises(DynColNotSupported):
-        # Contains Decimal 1
-        unpack(unhexs(b"04010001000000040061090080000001"))
+def test_decimal_123456789():
+    check(
+        input={"a": Decimal("123456789")},
+        expected=b"040100010000000400610900875bcd15",
+    )
+
+
+def test_decimal_123456789_5():
+    check(
+        input={"a": Decimal("123456789.5")},
+        expected=b"040100010000000400610901875bcd1505",
+    )
+
+
+def test_decimal_minus_1():
+    check(input={"a": Decimal("-1")}, expected=b"0401000100000004006109007ffffffe")
+
 
+def test_decimal_fraction_only():
+    check(input={"a": Decimal("0.05")}, expected=b"04010001000000040061000285")
 
-# def test_decimal_1():
-#     check(input={'a': Decimal('1')}, expected=b'04010001000000040061090080000001')
 
+def test_decimal_keeps_scale():
+    value = unpack(pack({"a": Decimal("1.50")}))["a"]
+    assert str(value) == "1.50"
 
-# def test_decimal_123456789():
-#     check(
-#         input={'a': Decimal('123456789')},
-#         expected=b'040100010000000400610900875bcd15',
-#     )
 
+def test_decimal_long():
+    check(input={"a": Decimal("-12345678901234567890.123456789012")})
 
-# def test_decimal_123456789_5():
-#     check(input={'a': Decimal('123456789.5')},
-#           expected=b'040100010000000400610901875bcd1505')
+
+def test_decimal_zero():
+    check(input={"a": Decimal("0.00")}, expected=b"04010001000000040061")
+
+
+@pytest.mark.parametrize(
+    "value",
+    [Decimal("NaN"), Decimal("Infinity"), Decimal("1E+65"), Decimal("1E-39")],
+)
+def test_decimal_out_of_range(value):
+    with pytest.raises(DynColValueError):
+        pack({"a": value})
+
+
+@pytest.mark.parametrize(
+    "encvalue",
+    [
+        b"09",  # truncated header
+        b"090080",  # truncated data
+        b"09008000000100",  # too much data
+        b"00093b9aca00",  # word out of range
+        b"4100",  # no data for header
+    ],
+)
+def test_unpack_decimal_invalid(encvalue):
+    with pytest.raises(DynColValueError):
+        base.decode_decimal(unhexs(encvalue))
 
 
 def test_datetime():
@@ -309,6 +424,42 @@ def test_time_no_microseconds():
     )
 
 
+def test_temporal_view():
+    value = {
+        "a": datetime(2020, 2, 29, 23, 59, 59, 1),
+        "b": datetime(2020, 2, 29),
+        "c": date(2020, 2, 29),
+        "d": time(23, 59, 59, 1),
+        "e": time(0, 0),
+    }
+    assert dict(DynColView(pack(value))) == value
+
+
+def test_date_shared():
+    buf = pack({"a": date(2015, 1, 1)})
+    assert base.unpack(buf)["a"] is base.unpack(buf)["a"]
+
+
+@pytest.mark.parametrize("unpack_func", [unpack, base.unpack])
+@pytest.mark.parametrize(
+    "buf",
+    [
+        # datetimes of 3 and 7 bytes
+        "04010001000000050061a1300f",
+        "04010001000000050061a1300f00000000",
+        # dates of 2 and 4 bytes
+        "0401000100000006006121f0",
+        "0401000100000006006121f00f00",
+        # times of 2 and 4 bytes
+        "04010001000000070061ffff",
+        "04010001000000070061ffff0000",
+    ],
+)
+def test_temporal_invalid_length(unpack_func, buf):
+    with pytest.raises(DynColValueError):
+        unpack_func(unhexs(buf))
+
+
 def test_cyrillic_key():
     check(input={"адын": 1212}, expected=b"040100080000000000d0b0d0b4d18bd0bd7809")
 
@@ -416,6 +567,48 @@ def test_nested_empty():
     check(input={"0": {}}, expected=b"040100010000000800300400000000")
 
 
+def nest(depth: int) -> dict[str, Any]:
+    dicty: dict[str, Any] = {"a": 1}
+    for _ in range(depth - 1):
+        dicty = {"a": dicty, "b": "x"}
+    return dicty
+
+
+@pytest.mark.parametrize("pack_func", [pack, base.pack])
+def test_nested_max_depth(pack_func):
+    assert pack_func(nest(MAX_DEPTH)) == base.pack(nest(MAX_DEPTH))
+    with pytest.raises(DynColLimitError):
+        pack_func(nest(MAX_DEPTH + 1))
+
+
+@pytest.mark.parametrize("pack_func", [pack, base.pack])
+def test_nested_custom_max_depth(pack_func):
+    assert pack_func(nest(200), max_depth=200) == base.pack(nest(200), max_depth=200)
+    with pytest.raises(DynColLimitError):
+        pack_func(nest(3), max_depth=2)
+
+
+@pytest.mark.parametrize("unpack_func", [unpack, base.unpack])
+def test_unpack_nested_max_depth(unpack_func):
+    assert unpack_func(base.pack(nest(MAX_DEPTH))) == nest(MAX_DEPTH)
+    buf = base.pack(nest(MAX_DEPTH + 1), max_depth=MAX_DEPTH + 1)
+    with pytest.raises(DynColLimitError):
+        unpack_func(buf)
+    assert unpack_func(buf, max_depth=MAX_DEPTH + 1) == nest(MAX_DEPTH + 1)
+
+
+@pytest.mark.parametrize("unpack_func", [unpack, base.unpack])
+def test_unpack_nested_truncated(unpack_func):
+    with pytest.raises(DynColValueError):
+        unpack_func(unhexs(b"04010001000000080030040000"))
+
+
+@pytest.mark.parametrize("unpack_func", [unpack, base.unpack])
+def test_unpack_empty(unpack_func):
+    with pytest.raises(DynColValueError):
+        unpack_func(b"")
+
+
 def test_unknown_type():
     with pytest.raises(DynColTypeError):
         pack({"key": ["lists", "not", "supported"]})
@@ -425,3 +618,882 @@ def test_unknown_columns_format():
     with pytest.raises(DynColValueError):
         # Numbered columns format as pulled from MariaDB tests
         unpack(b"0001000100030861666166")
+
+
+def test_view():
+    view = DynColView(pack({"a": 1, "bb": "two", "c": date(2015, 1, 1)}))
+    assert len(view) == 3
+    assert list(view) == ["a", "c", "bb"]
+    assert view["a"] == 1
+    assert view["bb"] == "two"
+    assert view["c"] == date(2015, 1, 1)
+    assert view == {"a": 1, "bb": "two", "c": date(2015, 1, 1)}
+
+
+def test_view_empty():
+    view = DynColView(pack({}))
+    assert len(view) == 0
+    assert dict(view) == {}
+    assert "a" not in view
+
+
+def test_view_missing_key():
+    view = DynColView(pack({"a": 1, "c": 3}))
+    assert "b" not in view
+    assert "aa" not in view
+    assert view.get("b") is None
+    with pytest.raises(KeyError):
+        view["b"]
+
+
+def test_view_many_keys():
+    data = {str(i): i for i in range(200)}
+    view = DynColView(pack(data))
+    for key, value in data.items():
+        assert key in view
+        assert view[key] == value
+    assert "200" not in view
+
+
+def test_view_nested():
+    view = DynColView(pack({"falafel": {"a": 1}, "fala": {"b": "t"}}))
+    nested = view["falafel"]
+    assert isinstance(nested, DynColView)
+    assert nested["a"] == 1
+    assert view == {"falafel": {"a": 1}, "fala": {"b": "t"}}
+
+
+def test_view_memoryview():
+    packed = pack({"a": 1, "b": "c"})
+    view = DynColView(memoryview(b"xx" + packed)[2:])
+    assert view == {"a": 1, "b": "c"}
+
+
+def test_view_bytearray():
+    view = DynColView(bytearray(pack({"a": 1.0})))
+    assert view["a"] == 1.0
+
+
+@pytest.mark.slow
+def test_view_large_data():
+    data = {"a": "a" * 4094, "b": 1}
+    assert DynColView(pack(data)) == data
+
+
+@pytest.mark.slow
+def test_view_huge_data():
+    data = {"a": "a" * (2**20), "b": 1}
+    assert DynColView(pack(data)) == data
+
+
+def test_view_repr():
+    assert repr(DynColView(pack({"a": 1}))) == "DynColView({'a': 1})"
+
+
+def test_view_unknown_columns_format():
+    with pytest.raises(DynColValueError):
+        DynColView(b"0001000100030861666166")
+
+
+@pytest.mark.parametrize(
+    "buf",
+    [
+        b"",
+        b"0401",
+        b"0402000200",  # directory missing
+        b"0402000200000000000100",  # directory truncated
+        b"040200030000000000010010006162",  # names truncated
+        b"0701000100000000006102",  # unknown data size
+    ],
+)
+def test_view_invalid(buf):
+    with pytest.raises(DynColValueError):
+        DynColView(unhexs(buf))
+
+
+def test_view_nested_truncated():
+    buf = base.pack_columns([(b"a", base.DYN_COL_DYNCOL, b"\x04\x01")])
+    view = DynColView(buf)
+    with pytest.raises(DynColValueError):
+        view["a"]
+
+
+def test_get():
+    packed = pack({"a": 1, "bb": "two", "c": {"d": 4}})
+    assert get(packed, "a") == 1
+    assert get(packed, "bb") == "two"
+    assert get(packed, "c") == {"d": 4}
+
+
+def test_get_missing():
+    packed = pack({"a": 1})
+    assert get(packed, "b") is None
+    assert get(packed, "b", default=2) == 2
+
+
+def test_get_empty():
+    assert get(pack({}), "a", default=1) == 1
+
+
+def test_get_many():
+    packed = pack({"a": 1, "bb": "two", "c": 3.0})
+    assert get_many(packed, ["c", "a", "zz"]) == {"c": 3.0, "a": 1}
+
+
+def test_get_many_empty():
+    assert get_many(pack({"a": 1}), []) == {}
+
+
+def test_add():
+    packed = pack({"a": 1, "c": {"d": datetime(2000, 1, 1)}})
+    assert add(packed, {"b": "two"}) == pack(
+        {"a": 1, "b": "two", "c": {"d": datetime(2000, 1, 1)}}
+    )
+
+
+def test_add_replace():
+    packed = pack({"a": 1, "b": 2})
+    assert add(packed, {"a": "one"}) == pack({"a": "one", "b": 2})
+
+
+def test_add_none_deletes():
+    packed = pack({"a": 1, "b": 2})
+    assert add(packed, {"a": None, "z": None}) == pack({"b": 2})
+
+
+def test_add_to_empty():
+    assert add(pack({}), {"a": 1}) == pack({"a": 1})
+
+
+@pytest.mark.slow
+def test_add_changes_data_size():
+    packed = pack({"a": 1})
+    added = add(packed, {"b": "b" * 4094})
+    assert added == pack({"a": 1, "b": "b" * 4094})
+    assert add(added, {"b": None}) == packed
+
+
+def test_add_name_overflow():
+    with pytest.raises(DynColLimitError):
+        add(pack({}), {"a" * (MAX_NAME_LENGTH + 1): 1})
+
+
+def test_add_total_name_length_overflow():
+    long_key = "a" * (MAX_NAME_LENGTH - 1)
+    packed = pack(
+        {
+            long_key + "1": 1,
+            long_key + "2": 1,
+            long_key + "3": 1,
+            long_key + "4": 1,
+            "abc": 1,
+        }
+    )
+    with pytest.raises(DynColLimitError):
+        add(packed, {"a": 1})
+
+
+def test_add_unknown_type():
+    with pytest.raises(DynColTypeError):
+        add(pack({}), {"key": ["lists", "not", "supported"]})
+
+
+def test_delete():
+    packed = pack({"a": 1, "b": {"c": time(1, 2, 3)}, "dd": 4.0})
+    assert delete(packed, ["a", "dd"]) == pack({"b": {"c": time(1, 2, 3)}})
+
+
+def test_delete_missing():
+    packed = pack({"a": 1})
+    assert delete(packed, ["b"]) == packed
+
+
+def test_delete_all():
+    assert delete(pack({"a": 1, "b": 2}), ["a", "b"]) == pack({})
+
+
+@pytest.mark.parametrize("add_func", [add, base.add])
+def test_add_keywords(add_func):
+    assert add_func(buf=pack({"a": 1}), updates={"b": 2}) == pack({"a": 1, "b": 2})
+
+
+@pytest.mark.parametrize("delete_func", [delete, base.delete])
+def test_delete_keywords(delete_func):
+    assert delete_func(buf=pack({"a": 1, "b": 2}), names=["a"]) == pack({"b": 2})
+
+
+def test_pack_many():
+    dicties: list[dict[str, Any]] = [
+        {"a": 1, "bb": "x"},
+        {"a": 2, "bb": "y"},
+        {"a": None, "bb": "z"},
+        {"bb": "w", "a": 3},
+        {"c": {"d": 1.0}},
+        {},
+    ]
+    assert pack_many(dicties) == [pack(dicty) for dicty in dicties]
+
+
+def test_pack_many_iterator():
+    assert pack_many(iter([{"a": 1}])) == [pack({"a": 1})]
+
+
+def test_pack_many_empty():
+    assert pack_many([]) == []
+
+
+@pytest.mark.parametrize("pack_many_func", [pack_many, base.pack_many])
+def test_pack_many_keywords(pack_many_func):
+    assert pack_many_func(dicties=[{"a": 1}]) == [pack({"a": 1})]
+
+
+def test_pack_many_name_overflow():
+    with pytest.raises(DynColLimitError):
+        pack_many([{"a": 1}, {"a" * (MAX_NAME_LENGTH + 1): 1}])
+
+
+def test_pack_many_mappings():
+    dicties = [OrderedDict([("b", 1), ("a", 2)]), MappingProxyType({"a": 1})]
+    assert pack_many(dicties) == [pack(dicty) for dicty in dicties]
+
+
+def test_pack_many_not_iterable():
+    with pytest.raises(TypeError):
+        pack_many(1)  # type: ignore[arg-type]
+
+
+def test_pack_into():
+    dicty = {"a": 1, "b": {"c": "x" * 5000, "d": None}, "e": None}
+    expected = pack(dicty)
+    buffer = bytearray(b"??") + bytearray(len(expected)) + bytearray(b"??")
+    assert pack_into(buffer, 2, dicty) == len(expected)
+    assert buffer == b"??" + expected + b"??"
+
+
+def test_pack_into_memoryview():
+    buffer = bytearray(20)
+    assert pack_into(memoryview(buffer)[5:], 0, {"a": 1}) == 11
+    assert buffer[5:16] == pack({"a": 1})
+
+
+def test_pack_into_too_small():
+    buffer = bytearray(11)
+    with pytest.raises(ValueError):
+        pack_into(buffer, 1, {"a": 1})
+    assert buffer == bytearray(11)
+
+
+def test_pack_into_negative_offset():
+    with pytest.raises(ValueError):
+        pack_into(bytearray(20), -1, {"a": 1})
+
+
+def test_pack_into_invalid():
+    with pytest.raises(DynColTypeError):
+        pack_into(bytearray(100), 0, {"a": {"b": object()}})
+
+
+@pytest.mark.parametrize("pack_into_func", [pack_into, base.pack_into])
+def test_pack_into_array(pack_into_func):
+    buffer = array("i", [0] * 4)
+    assert pack_into_func(buffer, 2, {"a": 1}) == 11
+    assert buffer.tobytes()[2:13] == pack({"a": 1})
+
+
+@pytest.mark.parametrize("pack_into_func", [pack_into, base.pack_into])
+def test_pack_into_read_only(pack_into_func):
+    with pytest.raises(TypeError):
+        pack_into_func(bytes(20), 0, {"a": 1})
+
+
+@pytest.mark.parametrize("pack_into_func", [pack_into, base.pack_into])
+def test_pack_into_keywords(pack_into_func):
+    buffer = bytearray(11)
+    assert pack_into_func(buffer=buffer, offset=0, dicty={"a": 1}) == 11
+    assert buffer == pack({"a": 1})
+
+
+@pytest.mark.parametrize("packed_size_func", [packed_size, base.packed_size])
+def test_packed_size(packed_size_func):
+    for dicty in ({}, {"a": 1}, {"a": {"b": {"c": "x" * 70000}}, "d": None}):
+        assert packed_size_func(dicty) == len(pack(dicty))
+    assert packed_size_func(dicty=MappingProxyType({"a": 1})) == 11
+
+
+def test_unpack_many():
+    dicties: list[dict[str, Any]] = [
+        {"a": 1, "bb": "x"},
+        {},
+        {"c": {"d": date(2001, 2, 3)}},
+    ]
+    assert unpack_many(pack(dicty) for dicty in dicties) == dicties
+
+
+def test_unpack_many_empty():
+    assert unpack_many([]) == []
+
+
+@pytest.mark.parametrize("unpack_many_func", [unpack_many, base.unpack_many])
+def test_unpack_many_keywords(unpack_many_func):
+    assert unpack_many_func(bufs=[pack({"a": 1})]) == [{"a": 1}]
+
+
+def test_unpack_many_invalid():
+    with pytest.raises(DynColValueError):
+        unpack_many([pack({"a": 1}), b"\x04\x01"])
+
+
+@pytest.fixture(params=["c", "python"])
+def product_schema(request: Any) -> Schema:
+    schema = Schema({"sku": str, "price": float, "created": datetime})
+    if request.param == "python":
+        # The specialised pure Python code is used when the C extension isn't
+        schema._speedups = None
+    return schema
+
+
+def test_schema_pack(product_schema):
+    row = {"sku": "abc", "price": 1.5, "created": datetime(2020, 1, 2, 3, 4, 5)}
+    assert product_schema.pack(row) == pack(row)
+
+
+def test_schema_pack_missing_key(product_schema):
+    row = {"sku": "abc", "price": 1.5}
+    assert product_schema.pack(row) == pack(row)
+
+
+def test_schema_pack_extra_key(product_schema):
+    row = {"sku": "abc", "price": 1.5, "other": 1}
+    assert product_schema.pack(row) == pack(row)
+
+
+def test_schema_pack_none(product_schema):
+    row = {"sku": "abc", "price": 1.5, "created": None}
+    assert product_schema.pack(row) == pack(row)
+
+
+def test_schema_pack_other_type(product_schema):
+    row = {"sku": "abc", "price": 1, "created": date(2020, 1, 2)}
+    assert product_schema.pack(row) == pack(row)
+
+
+def test_schema_pack_uint():
+    schema = Schema({"a": int})
+    assert schema.pack({"a": 2**64 - 1}) == pack({"a": 2**64 - 1})
+
+
+@pytest.mark.slow
+def test_schema_pack_large_data(product_schema):
+    row = {"sku": "a" * 4094, "price": 1.5, "created": datetime(2020, 1, 2)}
+    assert product_schema.pack(row) == pack(row)
+
+
+def test_schema_pack_invalid_value(product_schema):
+    with pytest.raises(DynColValueError):
+        product_schema.pack(
+            {"sku": "abc", "price": float("nan"), "created": datetime(2020, 1, 2)}
+        )
+
+
+def test_schema_unpack(product_schema):
+    row = {"sku": "abc", "price": 1.5, "created": datetime(2020, 1, 2, 3, 4, 5)}
+    assert product_schema.unpack(pack(row)) == row
+
+
+def test_schema_unpack_other_data(product_schema):
+    assert product_schema.unpack(pack({"a": 1})) == {"a": 1}
+    assert product_schema.unpack(pack({})) == {}
+
+
+def test_schema_unpack_other_types(product_schema):
+    row = {"sku": 1, "price": "x", "created": {"a": 1}}
+    assert product_schema.unpack(pack(row)) == row
+
+
+def test_schema_unpack_unknown_columns_format(product_schema):
+    with pytest.raises(DynColValueError):
+        product_schema.unpack(b"0001000100030861666166")
+
+
+def test_schema_pack_other_order(product_schema):
+    row = {"created": datetime(2020, 1, 2), "price": 1.5, "sku": "abc"}
+    assert product_schema.pack(row) == pack(row)
+
+
+def test_schema_unpack_uses_keys(product_schema):
+    row = {"sku": "abc", "price": 1.5, "created": datetime(2020, 1, 2, 3, 4, 5)}
+    unpacked = product_schema.unpack(pack(row))
+    assert all(a is b for a, b in zip(unpacked, product_schema._keys))
+
+
+def test_schema_nested():
+    schema = Schema({"a": dict, "b": int})
+    row = {"a": {"c": 1}, "b": 2}
+    assert schema.pack(row) == pack(row)
+    assert schema.unpack(pack(row)) == row
+
+
+@pytest.mark.parametrize("buf", [b"\x04\x01", b"\x04\x01\x00\x03\x00\x00\x00\xf0"])
+def test_schema_unpack_invalid(product_schema, buf):
+    with pytest.raises(DynColValueError):
+        product_schema.unpack(buf)
+
+
+def test_schema_name_overflow():
+    with pytest.raises(DynColLimitError):
+        Schema({"a" * (MAX_NAME_LENGTH + 1): int})
+
+
+def test_schema_total_name_length_overflow():
+    long_key = "a" * (MAX_NAME_LENGTH - 1)
+    with pytest.raises(DynColLimitError):
+        Schema({long_key + str(i): int for i in range(5)})
+
+
+def test_schema_unknown_type():
+    with pytest.raises(DynColTypeError):
+        Schema({"key": list})
+
+
+def test_schema_repr():
+    assert repr(Schema({"a": int})) == "Schema({'a': <class 'int'>})"
+
+
+def test_unpack_names_shared():
+    first = base.unpack(pack({"a_long_key_name": 1}))
+    second = base.unpack(pack({"a_long_key_name": 2}))
+    assert next(iter(first)) is next(iter(second))
+
+
+def test_name_cache_bounded(monkeypatch):
+    monkeypatch.setattr(base, "NAME_CACHE_SIZE", 2)
+    monkeypatch.setattr(base, "encoded_names", {})
+    monkeypatch.setattr(base, "decoded_names", {})
+    data = {"a": 1, "b": 2, "c": 3}
+    assert base.unpack(base.pack(data)) == data
+    assert list(base.encoded_names) == ["b", "c"]
+    assert list(base.decoded_names) == [b"b", b"c"]
+
+
+@pytest.mark.parametrize("unpack_func", [unpack, base.unpack, base.to_json])
+def test_unpack_bytearray(unpack_func):
+    packed = pack({"a": 1, "b": {"c": "x"}})
+    assert unpack_func(bytearray(packed)) == unpack_func(packed)
+
+
+def test_decode_name_writable_memoryview():
+    encname = memoryview(bytearray(b"abc"))
+    assert base.decode_name(encname) == "abc"
+    assert base.json_name(encname) == b'"abc":'
+
+
+def test_name_cache_skips_long_decoded_names(monkeypatch):
+    monkeypatch.setattr(base, "decoded_names", {})
+    monkeypatch.setattr(base, "json_names", {})
+    long_name = "a" * (base.NAME_CACHE_MAX_LENGTH + 1)
+    packed = pack({long_name: 1, "b": 2})
+    assert base.unpack(packed) == {long_name: 1, "b": 2}
+    assert base.to_json(packed) == to_json(packed)
+    assert list(base.decoded_names) == [b"b"]
+    assert list(base.json_names) == [b"b"]
+
+
+@pytest.mark.parametrize("long_name", ["a" * 65, "\u2603" * 22, "a" * 1000])
+def test_name_cache_skips_long_encoded_names(monkeypatch, long_name):
+    monkeypatch.setattr(base, "encoded_names", {})
+    assert base.pack({long_name: 1, "b": 2}) == pack({long_name: 1, "b": 2})
+    assert base.encode_name(long_name) == long_name.encode("utf-8")
+    assert list(base.encoded_names) == ["b"]
+
+
+def test_delete_uses_name_cache(monkeypatch):
+    packed = pack({"a": 1, "b": 2})
+    expected = pack({"b": 2})
+    monkeypatch.setattr(base, "encoded_names", {})
+    assert base.delete(packed, ["a"]) == expected
+    assert list(base.encoded_names) == ["a"]
+
+
+def test_name_cache_skips_long_names(monkeypatch):
+    monkeypatch.setattr(base, "encoded_names", {})
+    with pytest.raises(DynColLimitError):
+        base.pack({"a" * (MAX_NAME_LENGTH + 1): 1})
+    assert base.encoded_names == {}
+
+
+class Colour(Enum):
+    RED = "red"
+
+
+class Size(IntEnum):
+    LARGE = 3
+
+
+class Name(str):
+    pass
+
+
+def test_pack_subclasses():
+    value = {"a": True, "b": Size.LARGE, "c": Name("x"), "d": OrderedDict(e=1)}
+    expected = {"a": 1, "b": 3, "c": "x", "d": {"e": 1}}
+    assert pack(value) == base.pack(value) == pack(expected)
+    assert unpack(pack(OrderedDict(value))) == expected
+
+
+def test_pack_subclass_of_unencodable():
+    with pytest.raises(DynColTypeError):
+        pack({"a": Colour.RED})
+
+
+def test_schema_subclass():
+    assert Schema({"a": bool}).pack({"a": True}) == pack({"a": 1})
+
+
+def test_codec_register_encoder():
+    codec = Codec()
+    codec.register_encoder(Enum, lambda value: value.value)
+    codec.register_encoder(UUID, str)
+    uuid = UUID(int=1)
+    value = {"a": Colour.RED, "b": {"c": uuid}}
+    assert codec.pack(value) == pack({"a": "red", "b": {"c": str(uuid)}})
+    with pytest.raises(DynColTypeError):
+        pack(value)
+
+
+def test_codec_register_encoder_overrides_cache():
+    codec = Codec()
+    assert codec.pack({"a": Size.LARGE}) == pack({"a": 3})
+    codec.register_encoder(IntEnum, lambda value: value.name)
+    assert codec.pack({"a": Size.LARGE}) == pack({"a": "LARGE"})
+
+
+def test_codec_register_encoder_to_mapping():
+    codec = Codec()
+    codec.register_encoder(Colour, lambda value: {"colour": value.value})
+    assert codec.pack({"a": Colour.RED}) == pack({"a": {"colour": "red"}})
+
+
+def test_codec_register_raw_encoder():
+    codec = Codec()
+    codec.register_raw_encoder(
+        UUID, lambda value: (base.DYN_COL_STRING, b"\x2d" + value.hex.encode())
+    )
+    uuid = UUID(int=1)
+    assert codec.pack({"a": uuid}) == pack({"a": uuid.hex})
+
+
+def test_codec_register_raw_encoder_packed():
+    codec = Codec()
+    codec.register_raw_encoder(bytearray, lambda value: (base.DYN_COL_DYNCOL, value))
+    packed = pack({"b": 1})
+    assert codec.pack({"a": bytearray(packed)}) == pack({"a": {"b": 1}})
+
+
+def test_codec_register_decoder():
+    codec = Codec()
+    codec.register_decoder(Decimal, float)
+    codec.register_decoder(str, str.upper)
+    buf = pack({"a": Decimal("1.5"), "b": "x", "c": b"x", "d": {"e": "y"}})
+    assert codec.unpack(buf) == {"a": 1.5, "b": "X", "c": b"x", "d": {"e": "Y"}}
+    assert unpack(buf)["b"] == "x"
+
+
+def test_codec_register_decoder_replaces():
+    codec = Codec()
+    codec.register_decoder(str, str.upper)
+    codec.register_decoder(str, str.title)
+    assert codec.unpack(pack({"a": "ab cd"})) == {"a": "Ab Cd"}
+
+
+def test_codec_register_decoder_unknown_type():
+    with pytest.raises(DynColTypeError):
+        Codec().register_decoder(dict, OrderedDict)
+
+
+def test_codec_max_depth():
+    with pytest.raises(DynColLimitError):
+        Codec().pack({"a": {"b": 1}}, max_depth=1)
+    with pytest.raises(DynColLimitError):
+        Codec().unpack(pack({"a": {"b": 1}}), max_depth=1)
+
+
+class CountingMapping(Mapping[str, Any]):
+    def __init__(self, data: dict[str, Any]) -> None:
+        self.data = data
+        self.iterations = 0
+
+    def __getitem__(self, key: str) -> Any:
+        return self.data[key]
+
+    def __iter__(self) -> Iterator[str]:
+        self.iterations += 1
+        return iter(self.data)
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+
+@pytest.mark.parametrize("pack_func", [pack, base.pack])
+def test_pack_mapping(pack_func):
+    mapping = CountingMapping({"b": 1, "a": {"c": "x"}})
+    assert pack_func(mapping) == pack({"a": {"c": "x"}, "b": 1})
+    assert mapping.iterations == 1
+
+
+class ItemsMapping(CountingMapping):
+    # Like DynColView, has a faster items() than looking up each key
+    def __init__(self, data: dict[str, Any]) -> None:
+        super().__init__(data)
+        self.lookups = 0
+
+    def __getitem__(self, key: str) -> Any:
+        self.lookups += 1
+        return super().__getitem__(key)
+
+    def items(self) -> ItemsView[str, Any]:
+        self.iterations += 1
+        return self.data.items()
+
+
+@pytest.mark.parametrize("pack_many_func", [pack_many, base.pack_many])
+def test_pack_many_mappings_iterated_once(pack_many_func):
+    mappings = [ItemsMapping({"b": 1, "a": 2}), ItemsMapping({"b": 3, "a": 4})]
+    assert pack_many_func(mappings) == [pack({"a": 2, "b": 1}), pack({"a": 4, "b": 3})]
+    assert [mapping.iterations for mapping in mappings] == [1, 1]
+    assert [mapping.lookups for mapping in mappings] == [0, 0]
+
+
+@pytest.mark.parametrize("pack_func", [pack, base.pack])
+def test_pack_nested_mappings(pack_func):
+    value = {
+        "a": MappingProxyType({"b": 1}),
+        "c": CountingMapping({"d": None}),
+        "e": DynColView(pack({"f": "g"})),
+    }
+    expected = {"a": {"b": 1}, "c": {}, "e": {"f": "g"}}
+    assert pack_func(value) == pack(expected)
+
+
+def test_pack_view():
+    buf = pack({"b": {"c": 1}, "a": "x"})
+    assert pack(DynColView(buf)) == buf
+
+
+def test_pack_into_mapping():
+    buffer = bytearray(11)
+    pack_into(buffer, 0, MappingProxyType({"a": 1}))
+    assert buffer == pack({"a": 1})
+
+
+@pytest.mark.parametrize(
+    "value",
+    [
+        {},
+        {"a": 1, "bb": "x", "c": {"d": Decimal("1.5"), "e": {}}},
+        {"a": "x" * 5000, "b": datetime(2020, 1, 2, 3, 4, 5, 6)},
+        {"a": b"x" * 2**20, "b": time(1, 2), "c": date(2020, 1, 2), "d": 1.5},
+    ],
+)
+def test_validate(value):
+    buf = pack(value)
+    validate(buf)
+    validate(bytearray(buf))
+    validate(memoryview(buf))
+    assert base.check(buf)
+
+
+@pytest.mark.parametrize(
+    "buf",
+    [
+        b"",
+        b"0400",  # truncated header
+        b"0700000000",  # unknown data size flag
+        b"0001000100030861666166",  # numbered columns format
+        b"040000000000",  # trailing data
+        b"04010001000000",  # truncated column directory
+        b"0402000200000000000100100062610204",  # names out of order
+        b"0402000200000000000100100061610204",  # duplicate names
+        b"0402000201000000000100100061620204",  # name offset not from start
+        b"0402000200000000000300100061620204",  # name offset past names
+        b"0402000200000010000100000061620204",  # data offsets out of order
+        b"0402000200000000000100300061620204",  # data offset past data
+        b"040100010000000000ff02",  # invalid name
+        b"0401000100000009006102",  # unknown type
+        b"04010001000000000061010101010101010101",  # int too long
+        b"040100010000000200610000f83f",  # double too short
+        b"04010001000000030061",  # string without charset
+        b"0401000100000003006188",  # string with truncated charset
+        b"040100010000000400610900800000",  # decimal too short
+        b"0401000100000004006100",  # decimal with truncated header
+        b"04010001000000050061000000000000000000000000",  # datetime too long
+        b"0401000100000006006121be",  # date too short
+        b"0401000100000007006100",  # time too short
+        b"040100010000000800610701000100000000006202",  # invalid nested
+    ],
+)
+def test_validate_invalid(buf):
+    with pytest.raises(DynColValueError):
+        validate(unhexs(buf))
+    assert not base.check(unhexs(buf))
+
+
+def test_validate_max_depth():
+    buf = base.pack(nest(3))
+    validate(buf, max_depth=3)
+    with pytest.raises(DynColLimitError):
+        validate(buf, max_depth=2)
+    assert not base.check(buf, max_depth=2)
+
+
+@pytest.mark.parametrize(
+    "dicty,expected",
+    [
+        ({}, b"{}"),
+        ({"a": 1, "bb": -2, "c": 2**63}, b'{"a":1,"c":9223372036854775808,"bb":-2}'),
+        ({"a": 1.5, "b": 1.23456789, "c": 1e20}, b'{"a":1.5,"b":1.23457,"c":1e+20}'),
+        ({"a": 'x"y\\z\n/'}, b'{"a":"x\\"y\\\\z\\u000A/"}'),
+        ({"a": "\u2603"}, '{"a":"\u2603"}'.encode("utf-8")),
+        (
+            {"a": "\x00\x1f\t\r\b\f\x7f"},
+            b'{"a":"\\u0000\\u001F\\u0009\\u000D\\u0008\\u000C\x7f"}',
+        ),
+        ({'a"\n': 1}, b'{"a\\"\\u000A":1}'),
+        ({"\u2603": 1}, '{"\u2603":1}'.encode("utf-8")),
+        ({"a": b"x\xff"}, b'{"a":"x\xff"}'),
+        ({"a": Decimal("1.50"), "b": Decimal(0)}, b'{"a":1.50,"b":0}'),
+        ({"a": Decimal("-1E+10")}, b'{"a":-10000000000}'),
+        (
+            {"a": datetime(2020, 1, 2, 3, 4, 5), "b": datetime(1, 2, 3, 4, 5, 6, 7)},
+            b'{"a":"2020-01-02 03:04:05","b":"0001-02-03 04:05:06.000007"}',
+        ),
+        ({"a": date(2020, 1, 2)}, b'{"a":"2020-01-02"}'),
+        (
+            {"a": time(3, 4, 5), "b": time(23, 0, 0, 10)},
+            b'{"a":"03:04:05","b":"23:00:00.000010"}',
+        ),
+        ({"a": {"b": {"c": 1}, "d": {}}, "e": 2}, b'{"a":{"b":{"c":1},"d":{}},"e":2}'),
+    ],
+)
+@pytest.mark.parametrize("to_json_func", [to_json, base.to_json])
+def test_to_json(to_json_func, dicty, expected):
+    assert to_json_func(pack(dicty)) == expected
+
+
+def test_to_json_time_out_of_range():
+    # -838:59:59, outside of the range of datetime.time
+    val = 59 | 59 << 6 | 838 << 12 | 1 << 22
+    buf = base.pack_columns([(b"a", base.DYN_COL_TIME, val.to_bytes(3, "little"))])
+    assert to_json(buf) == b'{"a":"-838:59:59"}'
+    assert base.to_json(buf) == b'{"a":"-838:59:59"}'
+
+
+@pytest.mark.parametrize("to_json_func", [to_json, base.to_json])
+def test_to_json_max_depth(to_json_func):
+    buf = pack(nest(3))
+    assert to_json_func(buf, max_depth=3) == b'{"a":{"a":{"a":1},"b":"x"},"b":"x"}'
+    with pytest.raises(DynColLimitError):
+        to_json_func(buf, max_depth=2)
+    with pytest.raises(DynColLimitError):
+        to_json_func(buf, max_depth=0)
+
+
+def test_to_json_other_charset():
+    buf = base.pack_columns([(b"a", base.DYN_COL_STRING, b'\x08caf\xe9"')])
+    assert to_json(buf) == '{"a":"caf\u00e9\\""}'.encode("utf-8")
+
+
+@pytest.mark.parametrize(
+    "buf",
+    [
+        b"04",
+        b"0001000100000000006102",
+        b"0401000a000000000061",
+        b"0401000100000009006102",
+        # A name offset past the end of the names
+        b"0402000200000000000500100061620204",
+        # A data offset past the end of the data
+        b"0402000200000000000100f00061620204",
+    ],
+)
+@pytest.mark.parametrize("to_json_func", [to_json, base.to_json])
+def test_to_json_invalid(to_json_func, buf):
+    with pytest.raises(DynColValueError):
+        to_json_func(unhexs(buf))
+
+
+@pytest.mark.parametrize(
+    "dtype,encvalue",
+    [
+        (base.DYN_COL_DATETIME, b""),
+        (base.DYN_COL_DATETIME, b"\x00" * 3),
+        (base.DYN_COL_DATETIME, b"\x00" * 7),
+        (base.DYN_COL_DATE, b""),
+        (base.DYN_COL_DATE, b"\x00" * 4),
+        (base.DYN_COL_TIME, b"\x00" * 2),
+        (base.DYN_COL_TIME, b"\x00" * 9),
+    ],
+)
+@pytest.mark.parametrize("to_json_func", [to_json, base.to_json])
+def test_to_json_invalid_temporal(to_json_func, dtype, encvalue):
+    buf = base.pack_columns([(b"a", dtype, encvalue)])
+    with pytest.raises(DynColValueError):
+        to_json_func(buf)
+
+
+@pytest.mark.parametrize("to_json_func", [to_json, base.to_json])
+def test_to_json_invalid_utf8(to_json_func):
+    buf = base.pack_columns([(b"a", base.DYN_COL_STRING, b"\x2d\xff")])
+    with pytest.raises(DynColValueError, match="Invalid UTF-8 string value"):
+        to_json_func(buf)
+
+
+@pytest.mark.parametrize("to_json_func", [to_json, base.to_json])
+def test_to_json_invalid_utf8_name(to_json_func):
+    buf = base.pack_columns([(b"\xff", base.DYN_COL_INT, b"\x02")])
+    with pytest.raises(DynColValueError, match="Invalid column name"):
+        to_json_func(buf)
+
+
+@pytest.mark.parametrize(
+    "json,expected",
+    [
+        (b"{}", {}),
+        (b'{"a": 1, "b": -2.5, "c": "x", "d": null}', {"a": 1, "b": -2.5, "c": "x"}),
+        (b'{"a": true, "b": false}', {"a": 1, "b": 0}),
+        (b'{"a": {"b": {"c": 1}, "d": {}}}', {"a": {"b": {"c": 1}, "d": {}}}),
+        (b'{"a": 1, "a": 2}', {"a": 2}),
+        ('{"\u2603": "\u2603"}', {"\u2603": "\u2603"}),
+    ],
+)
+def test_from_json(json, expected):
+    packed = from_json(json)
+    assert packed == pack(expected)
+
+
+def test_from_json_round_trip():
+    dicty = {"a": 1, "bb": "x", "c": {"d": 2**63, "e": {}}}
+    assert from_json(to_json(pack(dicty))) == pack(dicty)
+
+
+@pytest.mark.parametrize("json", [b"", b"{", b'{"a": 1,}', b"\xff"])
+def test_from_json_invalid(json):
+    with pytest.raises(DynColValueError, match="Invalid JSON"):
+        from_json(json)
+
+
+@pytest.mark.parametrize("json", [b"[]", b"1", b'"a"', b"null"])
+def test_from_json_not_object(json):
+    with pytest.raises(DynColValueError, match="JSON must be an object"):
+        from_json(json)
+
+
+def test_from_json_array():
+    with pytest.raises(DynColTypeError):
+        from_json(b'{"a": [1]}')
+
+
+def test_from_json_max_depth():
+    json = b'{"a": {"a": {"a": 1}, "b": "x"}, "b": "x"}'
+    assert from_json(json, max_depth=3) == pack(nest(3))
+    with pytest.raises(DynColLimitError):
+        from_json(json, max_depth=2)
@@ -0,0 +1,62 @@
+from __future__ import annotations
+
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any
+
+import pytest
+
+from mariadb_dyncol import DynColTypeError
+from mariadb_dyncol import pack
+from mariadb_dyncol import parallel_pack
+from mariadb_dyncol import parallel_unpack
+from mariadb_dyncol import unpack
+
+dicties: list[dict[str, Any]] = [
+    {"i": i, "s": str(i), "d": {"dt": datetime(2020, 1, 1, 0, 0, i % 60)}}
+    for i in range(50)
+]
+
+
+def test_parallel_pack():
+    assert parallel_pack(dicties, workers=2, chunksize=7) == [
+        pack(dicty) for dicty in dicties
+    ]
+
+
+def test_parallel_unpack():
+    bufs = [pack(dicty) for dicty in dicties]
+    assert parallel_unpack(iter(bufs), workers=2, chunksize=7) == dicties
+
+
+def test_parallel_unpack_single_chunk():
+    bufs = [pack(dicty) for dicty in dicties]
+    assert parallel_unpack(bufs, chunksize=len(bufs)) == dicties
+
+
+def test_parallel_unpack_empty():
+    assert parallel_unpack([]) == []
+
+
+def test_parallel_unpack_executor():
+    bufs = [pack(dicty) for dicty in dicties]
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        assert parallel_unpack(bufs, chunksize=10, executor=executor) == dicties
+        assert parallel_unpack(bufs, chunksize=20, executor=executor) == dicties
+
+
+def test_parallel_pack_thread_executor():
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        result = parallel_pack(dicties, chunksize=10, executor=executor)
+    assert [unpack(buf) for buf in result] == dicties
+
+
+def test_parallel_pack_error():
+    with pytest.raises(DynColTypeError):
+        parallel_pack([{"a": 1}, {"a": [1]}], workers=2, chunksize=1)
+
+
+def test_parallel_invalid_chunksize():
+    with pytest.raises(ValueError):
+        parallel_pack(dicties, chunksize=0)
@@ -0,0 +1,200 @@
+from __future__ import annotations
+
+from collections import OrderedDict
+from datetime import date
+from decimal import Decimal
+from types import ModuleType
+
+import pytest
+
+from mariadb_dyncol import add
+from mariadb_dyncol import base
+from mariadb_dyncol import Codec
+from mariadb_dyncol import collect_stats
+from mariadb_dyncol import disable_stats
+from mariadb_dyncol import DynColTypeError
+from mariadb_dyncol import enable_stats
+from mariadb_dyncol import pack
+from mariadb_dyncol import pack_many
+from mariadb_dyncol import Schema
+from mariadb_dyncol import unpack
+from mariadb_dyncol import unpack_many
+
+_speedups: ModuleType | None
+try:
+    from mariadb_dyncol import _speedups
+except ImportError:  # pragma: no cover
+    _speedups = None
+
+
+def test_collect_stats():
+    with collect_stats() as stats:
+        packed = pack({"a": 1, "b": {"c": "x", "d": {"e": 1.5}}})
+        unpack(packed)
+
+    assert stats.calls == {"pack": 1, "unpack": 1}
+    assert stats.bytes == {"pack": len(packed), "unpack": len(packed)}
+    assert stats.seconds == {}
+    assert stats.type_columns == {"int": 2, "dyncol": 4, "string": 2, "double": 2}
+    assert stats.type_bytes["int"] == 2
+    assert stats.type_bytes["double"] == 16
+    assert stats.column_counts == {2: 4, 1: 2}
+    assert stats.depths == {3: 2}
+    assert stats.offset_sizes == {4: 6}
+
+
+def test_collect_stats_types():
+    with collect_stats() as stats:
+        pack({"i": -1, "u": 2**63, "d": Decimal("1.5"), "dt": date(2020, 1, 1)})
+
+    assert stats.type_columns == {"int": 1, "uint": 1, "decimal": 1, "date": 1}
+    assert stats.type_bytes["date"] == 3
+
+
+def test_collect_stats_offset_sizes():
+    with collect_stats() as stats:
+        pack({"a": "a" * 2**13})
+        pack({"a": "a" * 2**21})
+
+    assert stats.offset_sizes == {5: 1, 6: 1}
+
+
+def test_collect_stats_empty():
+    with collect_stats() as stats:
+        unpack(pack({}))
+
+    assert stats.column_counts == {0: 2}
+    assert stats.depths == {1: 2}
+
+
+def test_collect_stats_many():
+    with collect_stats() as stats:
+        unpack_many(pack_many([{"a": 1}, {"a": 2}, {"b": 3}]))
+
+    assert stats.calls == {"pack": 3, "unpack": 3}
+
+
+def test_collect_stats_codec():
+    codec = Codec()
+    with collect_stats() as stats:
+        codec.unpack(codec.pack({"a": 1}))
+
+    assert stats.calls == {"pack": 1, "unpack": 1}
+
+
+def test_collect_stats_timing():
+    with collect_stats(timing=True) as stats:
+        for i in range(1, 4):
+            unpack(pack({"a": i, "b": "x" * 100}))
+        pack({"a": 1})
+
+    # The header, column directory, names, and values of each mapping in the
+    # loop are 5 + 2 * 4 + 2 + 1 + 101 bytes
+    assert stats.calls == {"pack": 4, "unpack": 3}
+    assert stats.bytes == {"pack": 3 * 117 + 11, "unpack": 3 * 117}
+    assert set(stats.seconds) == {"pack", "unpack"}
+    assert all(seconds > 0 for seconds in stats.seconds.values())
+
+
+def test_collect_stats_fallback_counted_once():
+    with collect_stats() as stats:
+        packed = pack(OrderedDict([("a", 1)]))
+        unpack(bytearray(packed))  # type: ignore[arg-type]
+
+    assert stats.calls == {"pack": 1, "unpack": 1}
+    assert stats.bytes == {"pack": 11, "unpack": 11}
+
+
+@pytest.mark.skipif(_speedups is None, reason="C extension not built")
+def test_collect_stats_uses_c_extension(monkeypatch):
+    def fail(*args: object) -> None:
+        raise AssertionError("Python implementation used")
+
+    monkeypatch.setattr(base, "sorted_chunks", fail)
+    monkeypatch.setattr(base, "unpack_with", fail)
+    with collect_stats(timing=True) as stats:
+        unpack(pack({"a": 1}))
+        unpack_many(pack_many([{"a": 1}, {"b": 2}]))
+
+    assert stats.calls == {"pack": 3, "unpack": 3}
+    assert stats.bytes == {"pack": 33, "unpack": 33}
+    assert set(stats.seconds) == {"pack", "unpack"}
+
+
+@pytest.mark.parametrize("impl", ["c", "python"])
+def test_collect_stats_schema(impl):
+    schema = Schema({"a": int, "b": str})
+    if impl == "python":
+        schema._speedups = None
+    with collect_stats() as stats:
+        packed = schema.pack({"a": 1, "b": "x"})
+        schema.unpack(packed)
+
+    assert stats.calls == {"pack": 1, "unpack": 1}
+    assert stats.bytes == {"pack": len(packed), "unpack": len(packed)}
+
+
+@pytest.mark.parametrize("impl", ["c", "python"])
+def test_collect_stats_nested_values_not_counted(impl):
+    codec = Codec()
+    codec.register_encoder(complex, lambda value: {"r": value.real})
+    schema = Schema({"a": int, "b": dict})
+    if impl == "python":
+        schema._speedups = None
+    with collect_stats() as stats:
+        codec.pack({"a": 1j})
+        schema.pack({"a": 1, "b": {"c": 1}})
+        add(b"\x04\x00\x00\x00\x00", {"a": {"b": 1}})
+
+    assert stats.calls == {"pack": 2}
+    assert stats.depths == {2: 2}
+
+
+def test_collect_stats_nested():
+    with collect_stats() as outer:
+        pack({"a": 1})
+        with collect_stats() as inner:
+            pack({"a": 1})
+        pack({"a": 1})
+
+    assert base.stats_hook is None
+    assert outer.calls == {"pack": 2}
+    assert inner.calls == {"pack": 1}
+
+
+def test_collect_stats_error_not_counted():
+    with collect_stats() as stats:
+        with pytest.raises(DynColTypeError):
+            pack({"a": object()})
+
+    assert stats.calls == {}
+
+
+def test_collect_stats_stops():
+    with collect_stats() as stats:
+        pack({"a": 1})
+    pack({"a": 1})
+
+    assert base.stats_hook is None
+    assert stats.calls == {"pack": 1}
+
+
+def test_enable_disable_stats():
+    stats = enable_stats()
+    try:
+        pack({"a": 1})
+    finally:
+        disable_stats()
+    pack({"a": 1})
+
+    assert stats.calls == {"pack": 1}
+
+
+def test_stats_reset():
+    with collect_stats() as stats:
+        pack({"a": 1})
+        stats.reset()
+        pack({"a": "x"})
+
+    assert stats.calls == {"pack": 1}
+    assert stats.type_columns == {"string": 1}
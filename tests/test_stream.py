@@ -0,0 +1,87 @@
+from __future__ import annotations
+
+import io
+import mmap
+from datetime import date
+from typing import Any
+
+import pytest
+
+from mariadb_dyncol import DynColValueError
+from mariadb_dyncol import DynColView
+from mariadb_dyncol import pack
+from mariadb_dyncol import pack_stream
+from mariadb_dyncol import unpack_stream
+
+dicties: list[dict[str, Any]] = [
+    {"a": 1},
+    {},
+    {"b": "c", "d": {"e": date(2020, 1, 2)}},
+]
+
+
+def packed_stream() -> bytes:
+    stream = io.BytesIO()
+    pack_stream(stream, dicties)
+    return stream.getvalue()
+
+
+def test_pack_stream():
+    assert packed_stream() == (
+        len(pack({"a": 1})).to_bytes(4, "little")
+        + pack({"a": 1})
+        + len(pack({})).to_bytes(4, "little")
+        + pack({})
+        + len(pack(dicties[2])).to_bytes(4, "little")
+        + pack(dicties[2])
+    )
+
+
+def test_unpack_stream_file():
+    assert list(unpack_stream(io.BytesIO(packed_stream()))) == dicties
+
+
+def test_unpack_stream_bytes():
+    assert list(unpack_stream(packed_stream())) == dicties
+
+
+def test_unpack_stream_memoryview():
+    assert list(unpack_stream(memoryview(packed_stream()))) == dicties
+
+
+def test_unpack_stream_mmap(tmp_path):
+    path = tmp_path / "spool"
+    path.write_bytes(packed_stream())
+    with path.open("rb") as fp:
+        with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            assert list(unpack_stream(mapped)) == dicties
+
+
+def test_unpack_stream_empty():
+    assert list(unpack_stream(b"")) == []
+    assert list(unpack_stream(io.BytesIO())) == []
+
+
+def test_unpack_stream_lazy_file():
+    result = list(unpack_stream(io.BytesIO(packed_stream()), lazy=True))
+    assert all(isinstance(view, DynColView) for view in result)
+    assert result == dicties
+
+
+def test_unpack_stream_lazy_bytes():
+    result = list(unpack_stream(packed_stream(), lazy=True))
+    assert all(isinstance(view, DynColView) for view in result)
+    assert result == dicties
+
+
+@pytest.mark.parametrize("length", [2, 6, 12])
+def test_unpack_stream_truncated_file(length):
+    stream = io.BytesIO(packed_stream()[:length])
+    with pytest.raises(DynColValueError):
+        list(unpack_stream(stream))
+
+
+@pytest.mark.parametrize("length", [2, 6, 12])
+def test_unpack_stream_truncated_bytes(length):
+    with pytest.raises(DynColValueError):
+        list(unpack_stream(packed_stream()[:length]))